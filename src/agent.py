@@ -1,10 +1,9 @@
 import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
 import logging
+from src.profile_store import SUBSCRIPTION_COLUMNS
+from src.instrumentation import traced
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def validate_user_profile(user_profile):
@@ -24,6 +23,7 @@ def validate_user_profile(user_profile):
         logger.error(f"Invalid seeking: {user_profile['seeking']}")
         raise ValueError("Seeking must be 'Female', 'Male', or 'unknown'")
 
+@traced('apply_rules')
 def apply_rules(profiles, user_profile, blocked_ids, declined_ids, deleted_ids, reported_ids):
     """
     Apply rule-based filtering to profiles.
@@ -52,10 +52,9 @@ def apply_rules(profiles, user_profile, blocked_ids, declined_ids, deleted_ids,
         filtered['language_match'] = filtered['language'] == user_profile.get('language', 'unknown')
         filtered['goal_match'] = filtered['relationshipGoals'] == user_profile.get('relationshipGoals', 'unknown')
         
-        # Prioritize subscribed users
-        filtered['subscribed_score'] = filtered[['subscribed', 'subscribedEliteOne', 
-                                                'subscribedEliteThree', 'subscribedEliteSix', 
-                                                'subscribedEliteTwelve']].sum(axis=1)
+        # Prioritize subscribed users (precomputed by the profile store when available)
+        if 'subscribed_score' not in filtered.columns:
+            filtered['subscribed_score'] = filtered[SUBSCRIPTION_COLUMNS].sum(axis=1)
         
         logger.info(f"Filtered to {len(filtered)} profiles after applying rules")
         return filtered
@@ -64,9 +63,60 @@ def apply_rules(profiles, user_profile, blocked_ids, declined_ids, deleted_ids,
         logger.error(f"Error in apply_rules: {e}")
         raise
 
+def add_match_flags(store, filtered, user_profile):
+    """Set the country/language/goal match flags of filtered store rows for a viewer (in place)."""
+    filtered['country_match'] = filtered['country'].to_numpy() == store.code_for('country', user_profile.get('country', 'unknown'))
+    filtered['language_match'] = filtered['language'].to_numpy() == store.code_for('language', user_profile.get('language', 'unknown'))
+    filtered['goal_match'] = filtered['relationshipGoals'].to_numpy() == store.code_for('relationshipGoals', user_profile.get('relationshipGoals', 'unknown'))
+    return filtered
+
+def age_window(ages, age):
+    """Bool mask of ages within 5 years of the viewer's."""
+    age = float(age)
+    return (ages >= age - 5) & (ages <= age + 5)
+
+@traced('apply_rules')
+def apply_rules_compact(store, user_profile, blocked_ids, declined_ids, deleted_ids, reported_ids,
+                        excluded_mask=None, filter_age=True):
+    """
+    Apply rule-based filtering against a ProfileStore using category codes.
+    `excluded_mask` (bool per store row) replaces the id lookups when the caller precomputed it.
+    `filter_age=False` skips the age window (for callers that re-slice it themselves).
+    Returns: filtered rows of store.table with match flags (resolve strings via store.resolve)
+    """
+    try:
+        validate_user_profile(user_profile)
+        table = store.table
+        mask = np.ones(len(table), dtype=bool)
+
+        if excluded_mask is None:
+            excluded_ids = set(blocked_ids).union(declined_ids, deleted_ids, reported_ids)
+            if excluded_ids:
+                excluded_mask = table['__id__'].isin(excluded_ids).to_numpy()
+        if excluded_mask is not None:
+            mask &= ~excluded_mask
+
+        if user_profile.get('seeking') and user_profile.get('sex'):
+            mask &= table['sex'].to_numpy() == store.code_for('sex', user_profile['seeking'])
+            mask &= table['seeking'].to_numpy() == store.code_for('seeking', user_profile['sex'])
+
+        if filter_age and user_profile.get('age'):
+            mask &= age_window(table['age'].to_numpy(), user_profile['age'])
+
+        filtered = add_match_flags(store, table[mask].copy(), user_profile)
+
+        logger.info(f"Filtered to {len(filtered)} profiles after applying rules")
+        return filtered
+
+    except Exception as e:
+        logger.error(f"Error in apply_rules_compact: {e}")
+        raise
+
+@traced('encode_user_profile')
 def encode_user_profile(user_profile, label_encoders, tfidf):
     """
     Encode user profile for ML prediction.
+    `tfidf` is the fitted vectorizer or its FrozenVocabulary (src.text_features).
     Returns: encoded user features
     """
     try:
@@ -88,7 +138,10 @@ def encode_user_profile(user_profile, label_encoders, tfidf):
                 if word.lower() in user_profile['aboutMe'].lower()) / 6.0
         ])
         
-        tfidf_vec = tfidf.transform([user_profile['aboutMe']]).toarray().flatten()
+        if hasattr(tfidf, 'transform_one'):
+            tfidf_vec = tfidf.transform_one(user_profile['aboutMe'])
+        else:
+            tfidf_vec = tfidf.transform([user_profile['aboutMe']]).toarray().flatten()
         encoded_features = np.concatenate([user_features, tfidf_vec])
         logger.info(f"Encoded user profile with {len(encoded_features)} features")
         return encoded_features
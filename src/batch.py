@@ -0,0 +1,128 @@
+import json
+import time
+import logging
+from src.parallel import fork_map
+from src.recommendation_sink import reason_bitmask, decode_reasons
+
+logger = logging.getLogger(__name__)
+
+PROFILE_KEYS = ['userId', 'age', 'sex', 'seeking', 'country', 'language', 'relationshipGoals', 'aboutMe']
+MATCH_COLUMNS = ['__id__', 'userName', 'age', 'country', 'final_score', 'ml_score']
+
+def check_profile(profile):
+    """
+    Validate a viewer profile with the CLI's input rules.
+    Raises: ValueError describing the first invalid field
+    """
+    for key in PROFILE_KEYS:
+        if key not in profile:
+            raise ValueError(f"Missing required user profile key: {key}")
+    if not profile['userId'] or len(str(profile['userId'])) > 50:
+        raise ValueError("User ID must be non-empty and less than 50 characters")
+    if not isinstance(profile['age'], (int, float)) or profile['age'] < 18 or profile['age'] > 70:
+        raise ValueError("Age must be between 18 and 70")
+    if profile['sex'] not in ["Female", "Male", "unknown"]:
+        raise ValueError("Sex must be 'Female', 'Male', or 'unknown'")
+    if profile['seeking'] not in ["Female", "Male", "unknown"]:
+        raise ValueError("Seeking must be 'Female', 'Male', or 'unknown'")
+    if len(str(profile['country'])) > 100:
+        raise ValueError("Country must be less than 100 characters")
+    if len(str(profile['language'])) > 100:
+        raise ValueError("Language must be less than 100 characters")
+    if len(str(profile['relationshipGoals'])) > 100:
+        raise ValueError("Relationship Goals must be less than 100 characters")
+    if len(str(profile['aboutMe'])) > 1000:
+        raise ValueError("About Me must be less than 1000 characters")
+
+def read_requests(stream):
+    """Yield (line number, raw line) for the non-blank lines of a JSONL stream."""
+    for line_no, line in enumerate(stream, start=1):
+        if line.strip():
+            yield line_no, line
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def recommend_chunk(shared, chunk):
+    """
+    Parse, validate and recommend for one chunk of (line number, raw line) requests;
+    `shared` is (engine, top_k, time_budget_ms).
+    Returns: list of (line number, userId, top matches or None, error message or None)
+    """
+    engine, top_k, time_budget_ms = shared
+    results = []
+    for line_no, line in chunk:
+        user_id = None
+        try:
+            profile = json.loads(line)
+            if not isinstance(profile, dict):
+                raise ValueError("Each line must be a JSON object")
+            user_id = profile.get('userId')
+            check_profile(profile)
+            top = engine.recommend(profile, top_k, time_budget_ms)
+            results.append((line_no, user_id, top, None))
+        except Exception as e:
+            results.append((line_no, user_id, None, str(e)))
+    return results
+
+def result_record(line_no, user_id, top, error):
+    """JSON-serialisable output record for one request."""
+    if error is not None:
+        return {'line': line_no, 'userId': user_id, 'error': error}
+    record = {'line': line_no, 'userId': user_id, 'partial': bool(top.attrs.get('partial', False)),
+              'matches': []}
+    if top.empty:
+        return record
+    reasons = reason_bitmask(top)
+    for row, mask in zip(top[[c for c in MATCH_COLUMNS if c in top]].to_dict('records'), reasons):
+        row = {key: value.item() if hasattr(value, 'item') else value for key, value in row.items()}
+        row['reasons'] = decode_reasons(mask)
+        record['matches'].append(row)
+    return record
+
+def run_batch(engine, stream, out, chunk_size=100, workers=1, sink=None, top_k=None, time_budget_ms=None,
+              progress_interval=5.0):
+    """
+    Stream JSONL profiles from `stream` through the engine and write JSONL results to `out`
+    in input order. Chunks run across a pool of forked workers sharing the loaded engine;
+    at most 2 * workers chunks are in flight, so memory stays bounded on unbounded input.
+    The engine should have no sink of its own: persistence (if `sink` is given) happens in
+    this process, as results are emitted.
+    Returns: summary dict (requests, errors, seconds, requests_per_second)
+    """
+    start = time.perf_counter()
+    last_report = start
+    summary = {'requests': 0, 'errors': 0}
+    chunks = chunked(read_requests(stream), chunk_size)
+
+    def emit(results):
+        nonlocal last_report
+        for line_no, user_id, top, error in results:
+            out.write(json.dumps(result_record(line_no, user_id, top, error)) + "\n")
+            summary['requests'] += 1
+            if error is not None:
+                summary['errors'] += 1
+            elif sink is not None and not top.empty:
+                sink.submit(user_id, top)
+        out.flush()
+        now = time.perf_counter()
+        if now - last_report >= progress_interval:
+            last_report = now
+            logger.info(f"Batch progress: {summary['requests']} requests, {summary['errors']} errors, "
+                        f"{summary['requests'] / (now - start):.1f} requests/s")
+
+    for results in fork_map(recommend_chunk, chunks, (engine, top_k, time_budget_ms), workers):
+        emit(results)
+
+    summary['seconds'] = time.perf_counter() - start
+    summary['requests_per_second'] = summary['requests'] / summary['seconds'] if summary['seconds'] else 0.0
+    logger.info(f"Batch finished: {summary['requests']} requests ({summary['errors']} errors) in "
+                f"{summary['seconds']:.2f}s, {summary['requests_per_second']:.1f} requests/s")
+    return summary
@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import logging
+import numpy as np
+from src.data_loader import load_config, load_data
+from src.preprocessing import preprocess_data
+from src.feature_store import csr_nbytes
+from src.profile_store import ProfileStore
+from src.recommender import train_model
+from src.pipeline import MatchEngine
+from src.diversity import diversity_metrics
+from src.synthetic import generate_dataset
+
+logger = logging.getLogger(__name__)
+
+TIERS = {
+    'tiny': 2_000,
+    'small': 100_000,
+    'medium': 1_000_000,
+    'large': 10_000_000,
+}
+
+class StageTimer:
+    """Times a stage and records its tracemalloc peak (MB) when memory profiling is on."""
+
+    def __init__(self, results, stage, profile_memory):
+        self.results = results
+        self.stage = stage
+        self.profile_memory = profile_memory
+
+    def __enter__(self):
+        if self.profile_memory:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        entry = {'seconds': elapsed}
+        if self.profile_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            entry['peak_mb'] = peak / 2**20
+        self.results[self.stage] = entry
+        return False
+
+def sample_queries(store, n_queries, rng):
+    """Viewer profiles drawn from the store itself, so every query has plausible candidates."""
+    rows = store.resolve(store.table.iloc[rng.choice(len(store), size=min(n_queries, len(store)), replace=False)])
+    queries = []
+    for row in rows.itertuples(index=False):
+        queries.append({
+            'userId': row.userId,
+            'age': int(min(max(row.age, 18), 70)),
+            'sex': row.sex,
+            'seeking': row.seeking,
+            'country': row.country,
+            'language': row.language,
+            'relationshipGoals': row.relationshipGoals,
+            'aboutMe': str(row.aboutMe),
+        })
+    return queries
+
+def run_tier(n_profiles, work_dir, seed=0, n_queries=20, max_train_interactions=200_000, profile_memory=True,
+             diversity_shortlist=50):
+    """
+    Generate a tier, then time and memory-profile each pipeline stage.
+    Returns: dict of stage -> {'seconds', 'peak_mb'} plus per-query stages as mean/p95 seconds
+    """
+    # Deferred imports would otherwise be charged to whichever stage first needs them
+    import sklearn.ensemble, sklearn.preprocessing, sklearn.feature_extraction.text, scipy.sparse  # noqa: F401
+
+    config = load_config()
+    stages = {}
+    data_dir = os.path.join(work_dir, f"synthetic_{n_profiles}")
+    if not os.path.exists(os.path.join(data_dir, config['data']['profiles_file'])):
+        generate_dataset(n_profiles, data_dir, seed=seed, config=config)
+
+    with StageTimer(stages, 'load_data', profile_memory):
+        (profiles, liked, matched, blocked_ids, declined_ids,
+         deleted_ids, reported_ids) = load_data(data_dir=data_dir)
+    with StageTimer(stages, 'build_store', profile_memory):
+        store = ProfileStore.from_profiles(profiles, config['preprocessing']['categorical_columns'],
+                                           config['preprocessing']['keywords'])
+    with StageTimer(stages, 'preprocess_data', profile_memory):
+        (_, interaction_matrix, X_features, user_to_idx, profile_to_idx,
+         label_encoders, tfidf) = preprocess_data(profiles, liked, matched)
+    # Feature memory against the former single float64 CSR layout
+    stages['preprocess_data']['feature_mb'] = X_features.nbytes / 1e6
+    stages['preprocess_data']['csr_float64_feature_mb'] = csr_nbytes(X_features.tocsr().astype(np.float64)) / 1e6
+
+    rng = np.random.default_rng(seed)
+    train_matrix = interaction_matrix
+    if max_train_interactions and interaction_matrix.nnz > max_train_interactions:
+        # Keep training tractable on large tiers: train on a fixed-size row sample
+        keep_rows = rng.choice(interaction_matrix.shape[0],
+                               size=max(1, int(interaction_matrix.shape[0] * max_train_interactions / interaction_matrix.nnz)),
+                               replace=False)
+        mask = np.zeros(interaction_matrix.shape[0], dtype=bool)
+        mask[keep_rows] = True
+        train_matrix = interaction_matrix.multiply(mask[:, None]).tocsr()
+        train_matrix.eliminate_zeros()
+    with StageTimer(stages, 'train_model', profile_memory):
+        model, scaler = train_model(train_matrix, X_features)
+    stages['train_model']['interactions'] = int(train_matrix.nnz)
+
+    engine = MatchEngine(store, X_features, model, scaler, label_encoders, tfidf, user_to_idx,
+                         profile_to_idx, blocked_ids, declined_ids, deleted_ids, reported_ids)
+    reciprocal_engine = MatchEngine(store, X_features, model, scaler, label_encoders, tfidf, user_to_idx,
+                                    profile_to_idx, blocked_ids, declined_ids, deleted_ids, reported_ids,
+                                    interaction_matrix=interaction_matrix, reciprocal=True)
+    timings = {'apply_rules': [], 'predict_compatibility': [], 'predict_reciprocal': [], 'top_k': [],
+               'rerank': []}
+    candidates = []
+    diversity = {'top_k': [], 'rerank': []}
+    for user_profile in sample_queries(store, n_queries, rng):
+        start = time.perf_counter()
+        filtered = engine.filter_candidates(user_profile)
+        timings['apply_rules'].append(time.perf_counter() - start)
+        candidates.append(len(filtered))
+        if filtered.empty:
+            continue
+        start = time.perf_counter()
+        scored = engine.score_candidates(user_profile, filtered)
+        timings['predict_compatibility'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        reciprocal_engine.score_candidates(user_profile, filtered.copy())
+        timings['predict_reciprocal'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        engine.select_top_k(scored)
+        timings['top_k'].append(time.perf_counter() - start)
+        top = scored.nlargest(engine.top_k, 'final_score')
+        start = time.perf_counter()
+        reranked = engine.rerank(scored.nlargest(diversity_shortlist, 'final_score'), engine.top_k)
+        timings['rerank'].append(time.perf_counter() - start)
+        for name, frame in (('top_k', top), ('rerank', reranked)):
+            diversity[name].append(diversity_metrics(*engine.shortlist_features(frame))['intra_list_diversity'])
+    for stage, values in timings.items():
+        if values:
+            stages[stage] = {'seconds': float(np.mean(values)), 'p95_seconds': float(np.percentile(values, 95)),
+                             'queries': len(values)}
+    stages['apply_rules']['mean_candidates'] = float(np.mean(candidates)) if candidates else 0.0
+    for stage, values in diversity.items():
+        if values:
+            stages[stage]['intra_list_diversity'] = float(np.mean(values))
+    if 'rerank' in stages:
+        stages['rerank']['shortlist'] = diversity_shortlist
+    if 'predict_reciprocal' in stages:
+        stages['predict_reciprocal']['cost_ratio'] = (stages['predict_reciprocal']['seconds'] /
+                                                      max(stages['predict_compatibility']['seconds'], 1e-9))
+    return stages
+
+def compare_to_baseline(results, baseline, threshold=0.25, min_seconds=0.01):
+    """
+    Compare results with a stored baseline.
+    Returns: list of human-readable regressions (seconds or peak_mb above baseline * (1 + threshold))
+    """
+    regressions = []
+    for tier, tier_result in results.get('tiers', {}).items():
+        base_tier = baseline.get('tiers', {}).get(tier)
+        if not base_tier:
+            continue
+        for stage, entry in tier_result['stages'].items():
+            base = base_tier['stages'].get(stage)
+            if not base:
+                continue
+            for metric, floor in (('seconds', min_seconds), ('peak_mb', 1.0)):
+                if metric not in entry or metric not in base:
+                    continue
+                limit = max(base[metric], floor) * (1 + threshold)
+                if entry[metric] > limit:
+                    regressions.append(f"{tier}/{stage} {metric}: {entry[metric]:.3f} > "
+                                       f"{base[metric]:.3f} baseline (+{threshold:.0%} allowed)")
+    return regressions
+
+def run_benchmarks(tiers, work_dir, seed=0, n_queries=20, profile_memory=True):
+    """Run the given tiers and return the full results document."""
+    results = {
+        'meta': {'python': sys.version.split()[0], 'platform': platform.platform(), 'seed': seed,
+                 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'tiers': {}
+    }
+    for tier in tiers:
+        n_profiles = TIERS[tier] if tier in TIERS else int(tier)
+        logger.info(f"Benchmarking tier {tier} ({n_profiles} profiles)")
+        stages = run_tier(n_profiles, work_dir, seed=seed, n_queries=n_queries, profile_memory=profile_memory)
+        results['tiers'][str(tier)] = {'profiles': n_profiles, 'stages': stages}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Scale benchmarks for the matchmaking pipeline")
+    parser.add_argument("--tiers", default="tiny,small", help=f"Comma-separated tiers {list(TIERS)} or profile counts")
+    parser.add_argument("--work_dir", default=os.path.join(tempfile.gettempdir(), "matchmaking_bench"),
+                        help="Where synthetic datasets are generated and reused")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json", help="Baseline JSON file")
+    parser.add_argument("--update_baseline", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--queries", type=int, default=20, help="Sample queries per tier")
+    parser.add_argument("--no_memory", action="store_true", help="Skip tracemalloc memory profiling")
+    parser.add_argument("--output", default=None, help="Write this run's results to a JSON file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    results = run_benchmarks(args.tiers.split(','), args.work_dir, n_queries=args.queries,
+                             profile_memory=not args.no_memory)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(results, baseline, threshold=args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import logging
+import numpy as np
+from src.agent import age_window
+from src.recommender import item_prior_scores, reference_users, model_version
+
+logger = logging.getLogger(__name__)
+
+MIN_AGE = 18
+# Packing bases for segment keys: category codes (with -1 for unseen values) and age bands
+_CODE_BASE = 1 << 16
+_BAND_BASE = 1 << 8
+
+def age_band(age, band_width=5):
+    return int((max(float(age), MIN_AGE) - MIN_AGE) // band_width)
+
+def segment_key(candidate_sex, candidate_seeking, band, country):
+    """One int64 per segment: candidate sex/seeking codes, viewer age band and country code."""
+    key = (int(candidate_sex) + 1) * _CODE_BASE + (int(candidate_seeking) + 1)
+    key = (key * _BAND_BASE + int(band)) * _CODE_BASE + (int(country) + 1)
+    return key
+
+def store_digest(store):
+    """Digest of the store's profile ids in row order (tables address rows by position)."""
+    digest = hashlib.sha1()
+    for profile_id in store.table['__id__'].astype(str):
+        digest.update(profile_id.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+def build_cold_start_tables(store, X_features, model, scaler, interaction_matrix, profile_to_idx, out_dir,
+                            top_n=200, band_width=5, model_version=None):
+    """
+    Nightly job: ranked candidate lists per segment (candidate sex/seeking codes, viewer age
+    band, viewer country). Candidates are ranked by 0.7 * prior + 0.1 * country match, where
+    the prior blends normalised popularity (like/match weight received) with the item-side
+    model score. Lists are written as flat .npy arrays (sorted segment keys, offsets, store
+    rows, priors) that serving memory-maps.
+    Returns: metadata dict
+    """
+    start = time.perf_counter()
+    table = store.table
+    item_index = table['__id__'].map(profile_to_idx).fillna(-1).to_numpy(dtype=np.int64)
+    known = item_index >= 0
+    model_scores = np.zeros(len(table))
+    model_scores[known] = item_prior_scores(model, scaler, X_features, item_index[known],
+                                            users=reference_users(interaction_matrix.shape[0]))
+    received = np.asarray(interaction_matrix.sum(axis=0)).ravel()
+    popularity = np.zeros(len(table))
+    popularity[known] = received[item_index[known]]
+    popularity /= max(popularity.max(), 1.0)
+    prior = (0.5 * np.clip(model_scores, 0, 1) + 0.5 * popularity).astype(np.float32)
+
+    sexes = table['sex'].to_numpy()
+    seekings = table['seeking'].to_numpy()
+    ages = table['age'].to_numpy().astype(np.float64)
+    countries = table['country'].to_numpy()
+    viewer_countries = np.append(np.unique(countries), -1)
+    n_bands = age_band(ages.max(), band_width) + 1 if len(ages) else 0
+
+    keys, offsets, rows, priors = [], [0], [], []
+    for candidate_sex, candidate_seeking in sorted(set(zip(sexes.tolist(), seekings.tolist()))):
+        group = np.flatnonzero((sexes == candidate_sex) & (seekings == candidate_seeking))
+        for band in range(n_bands):
+            low = MIN_AGE + band * band_width
+            # Every candidate some viewer in the band can see; serving applies the exact window
+            eligible = group[(ages[group] >= low - 5) & (ages[group] <= low + band_width + 5)]
+            if not len(eligible):
+                continue
+            for country in viewer_countries:
+                score = 0.7 * prior[eligible] + 0.1 * (countries[eligible] == country)
+                top = np.argsort(-score, kind='stable')[:top_n]
+                keys.append(segment_key(candidate_sex, candidate_seeking, band, country))
+                rows.append(eligible[top].astype(np.int32))
+                priors.append(prior[eligible[top]])
+                offsets.append(offsets[-1] + len(top))
+
+    order = np.argsort(keys, kind='stable')
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {
+        'keys': np.asarray(keys, dtype=np.int64)[order],
+        'offsets': np.asarray(offsets, dtype=np.int64),
+        'order': order.astype(np.int64),
+        'rows': np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32),
+        'priors': np.concatenate(priors) if priors else np.zeros(0, dtype=np.float32),
+    }
+    for name, array in arrays.items():
+        path = os.path.join(out_dir, f"{name}.npy")
+        with open(path + ".tmp", 'wb') as f:
+            np.save(f, array)
+        os.replace(path + ".tmp", path)
+    meta = {'segments': len(keys), 'entries': int(offsets[-1]), 'top_n': top_n, 'band_width': band_width,
+            'profiles': len(table), 'store_digest': store_digest(store), 'model_version': model_version,
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'seconds': time.perf_counter() - start}
+    with open(os.path.join(out_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    logger.info(f"Built {meta['segments']} cold-start segments ({meta['entries']} entries) "
+                f"in {meta['seconds']:.2f}s")
+    return meta
+
+class ColdStartTable:
+    """Memory-mapped per-segment candidate lists written by build_cold_start_tables."""
+
+    def __init__(self, table_dir):
+        with open(os.path.join(table_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.band_width = self.meta['band_width']
+        self.keys = np.load(os.path.join(table_dir, "keys.npy"), mmap_mode='r')
+        self.offsets = np.load(os.path.join(table_dir, "offsets.npy"), mmap_mode='r')
+        self.order = np.load(os.path.join(table_dir, "order.npy"), mmap_mode='r')
+        self.rows = np.load(os.path.join(table_dir, "rows.npy"), mmap_mode='r')
+        self.priors = np.load(os.path.join(table_dir, "priors.npy"), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def candidates(self, store, user_profile, excluded_mask=None):
+        """
+        Ranked candidates for a viewer's segment with the exact age window and exclusions applied.
+        Returns: (store rows, priors) arrays, or None if the segment was not materialised
+        """
+        if not (user_profile.get('sex') and user_profile.get('seeking') and user_profile.get('age')):
+            return None
+        key = segment_key(store.code_for('sex', user_profile['seeking']),
+                          store.code_for('seeking', user_profile['sex']),
+                          age_band(user_profile['age'], self.band_width),
+                          store.code_for('country', user_profile.get('country', 'unknown')))
+        position = int(np.searchsorted(self.keys, key))
+        if position >= len(self.keys) or self.keys[position] != key:
+            return None
+        segment = int(self.order[position])
+        rows = np.asarray(self.rows[self.offsets[segment]:self.offsets[segment + 1]], dtype=np.int64)
+        priors = np.asarray(self.priors[self.offsets[segment]:self.offsets[segment + 1]])
+        keep = age_window(store.table['age'].to_numpy()[rows], user_profile['age'])
+        if excluded_mask is not None:
+            keep &= ~excluded_mask[rows]
+        return rows[keep], priors[keep]
+
+def load_cold_start(config, store, version=None):
+    """
+    Cold-start table from the `cold_start` config section, or None when disabled, missing,
+    or built for a different profile set or model version. `version` defaults to the saved
+    model's version in the configured models_dir.
+    """
+    settings = config.get('cold_start', {})
+    table_dir = settings.get('table_dir')
+    if not settings.get('enabled', False) or not table_dir or not os.path.exists(os.path.join(table_dir, "meta.json")):
+        return None
+    table = ColdStartTable(table_dir)
+    if table.meta['profiles'] != len(store) or table.meta['store_digest'] != store_digest(store):
+        logger.warning(f"Cold-start tables in {table_dir} were built for another profile set; ignoring them")
+        return None
+    if version is None:
+        version = model_version(config.get('model', {}).get('models_dir', 'models'))
+    if table.meta.get('model_version') != version:
+        logger.warning(f"Cold-start tables in {table_dir} were built for model {table.meta.get('model_version')}, "
+                       f"not the live {version}; ignoring them")
+        return None
+    return table
+
+def main():
+    from src.data_loader import load_config, load_data
+    from src.preprocessing import preprocess_data
+    from src.profile_store import ProfileStore
+    from src.recommender import load_model_and_encoders
+
+    parser = argparse.ArgumentParser(description="Build cold-start candidate tables per segment")
+    parser.add_argument("--data_dir", default=None, help="Data directory (defaults to config)")
+    parser.add_argument("--models_dir", default=None, help="Models directory (defaults to config)")
+    parser.add_argument("--out_dir", default=None, help="Table directory (defaults to config cold_start.table_dir)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = load_config()
+    settings = config.get('cold_start', {})
+    models_dir = args.models_dir or config['model']['models_dir']
+
+    (profiles, liked, matched, *_) = load_data(data_dir=args.data_dir or config['data']['data_dir'])
+    if profiles is None:
+        raise SystemExit("Failed to load data")
+    store = ProfileStore.from_profiles(profiles, config['preprocessing']['categorical_columns'],
+                                       config['preprocessing']['keywords'])
+    (_, interaction_matrix, X_features, _, profile_to_idx, _, _) = preprocess_data(profiles, liked, matched)
+    model, scaler, *_ = load_model_and_encoders(models_dir)
+    if model is None:
+        raise SystemExit(f"No trained model in {models_dir}")
+    meta = build_cold_start_tables(store, X_features, model, scaler, interaction_matrix, profile_to_idx,
+                                   args.out_dir or settings.get('table_dir', 'models/cold_start'),
+                                   top_n=settings.get('top_n', 200), band_width=settings.get('band_width', 5),
+                                   model_version=model_version(models_dir))
+    print(json.dumps(meta, indent=2))
+
+if __name__ == "__main__":
+    main()
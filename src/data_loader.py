@@ -1,13 +1,17 @@
+import numpy as np
 import pandas as pd
 import os
+import csv
 import logging
+import threading
 import yaml
-from jsonschema import validate, ValidationError
+from src.instrumentation import traced
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+_config_cache = {}
+_config_lock = threading.Lock()
+
 config_schema = {
     "type": "object",
     "properties": {
@@ -22,7 +26,11 @@ config_schema = {
                 "declined_file": {"type": "string"},
                 "deleted_file": {"type": "string"},
                 "reported_file": {"type": "string"},
-                "required_columns": {"type": "array", "items": {"type": "string"}}
+                "required_columns": {"type": "array", "items": {"type": "string"}},
+                "dedupe_key": {"type": "string"},
+                "backend": {"type": "string", "enum": ["csv", "sqlite"]},
+                "sqlite_file": {"type": "string"},
+                "updated_at_column": {"type": ["string", "null"]}
             },
             "required": ["data_dir", "required_columns"]
         },
@@ -55,8 +63,30 @@ config_schema = {
     "required": ["data", "model", "preprocessing"]
 }
 
-def load_config(config_path="config.yaml"):
-    """Load configuration from YAML file."""
+def load_config(config_path="config.yaml", reload=False):
+    """
+    Load configuration from YAML file, memoised per path.
+    The returned dict is shared between callers and must not be mutated; pass reload=True
+    (or call reload_config) to re-read and re-validate the file.
+    """
+    key = os.path.abspath(config_path)
+    if not reload:
+        config = _config_cache.get(key)
+        if config is not None:
+            return config
+    with _config_lock:
+        if reload or key not in _config_cache:
+            _config_cache[key] = _read_config(config_path)
+        return _config_cache[key]
+
+def reload_config(config_path="config.yaml"):
+    """Drop the cached configuration for config_path and read it again."""
+    return load_config(config_path, reload=True)
+
+def _read_config(config_path):
+    """Read and validate configuration from YAML file."""
+    from jsonschema import validate, ValidationError
+
     default_config = {
         'data': {
             'data_dir': 'data',
@@ -72,7 +102,11 @@ def load_config(config_path="config.yaml"):
                 'aboutMe', 'sex', 'seeking', 'relationshipGoals', 'subscribed',
                 'subscribedEliteOne', 'subscribedEliteThree', 'subscribedEliteSix',
                 'subscribedEliteTwelve'
-            ]
+            ],
+            'dedupe_key': '__id__',
+            'backend': 'csv',
+            'sqlite_file': 'profiles.sqlite',
+            'updated_at_column': 'updatedAt'
         },
         'model': {
             'models_dir': 'models',
@@ -90,6 +124,88 @@ def load_config(config_path="config.yaml"):
             'keywords': [
                 'love', 'soul mate', 'relationship', 'partner', 'soccer', 'football'
             ]
+        },
+        'recommendation_log': {
+            'log_dir': 'data/recommendation_log',
+            'batch_size': 500,
+            'flush_interval_seconds': 1.0,
+            'max_queue_size': 10000,
+            'max_file_mb': 64
+        },
+        'instrumentation': {
+            'enabled': False
+        },
+        'scoring': {
+            'reciprocal': False,
+            'combine': 'harmonic'
+        },
+        'diversity': {
+            'shortlist_size': 0,
+            'lambda': 0.7
+        },
+        'serving': {
+            'time_budget_ms': None,
+            'score_chunk_size': 2000
+        },
+        'result_cache': {
+            'enabled': True,
+            'max_mb': 32
+        },
+        'sharding': {
+            'n_shards': 0,
+            'partition': 'hash'
+        },
+        'retraining': {
+            'incremental_stages': 20
+        },
+        'near_duplicates': {
+            'enabled': False,
+            'num_perm': 128,
+            'bands': 16,
+            'shingle_size': 5,
+            'threshold': 0.8,
+            'spam_cluster_size': 5,
+            'index_file': 'models/near_duplicates.npz',
+            'workers': 1
+        },
+        'cold_start': {
+            'enabled': True,
+            'table_dir': 'models/cold_start',
+            'top_n': 200,
+            'band_width': 5
+        },
+        'event_log': {
+            'enabled': False,
+            'path': 'data/events',
+            'checkpoint_file': 'models/event_checkpoint.json',
+            'batch_kb': 1024,
+            'poll_interval_ms': 200,
+            'checkpoint_interval_s': 5,
+            'compact_after': 32
+        },
+        'profiling': {
+            'enabled': False,
+            'sample_rate': 0.01,
+            'slow_ms': 250,
+            'interval_ms': 2,
+            'out_dir': 'log/profiles',
+            'max_mb': 5,
+            'backups': 5
+        },
+        'text_features': {
+            'cache_dir': None,
+            'workers': None,
+            'chunk_size': 20000
+        },
+        'shadow': {
+            'enabled': False,
+            'models_dir': 'models/shadow',
+            'sample_rate': 1.0,
+            'workers': 1,
+            'max_pending': 8,
+            'top_k': 10,
+            'log_interval_seconds': 60,
+            'report_path': None
         }
     }
     try:
@@ -108,6 +224,19 @@ def load_config(config_path="config.yaml"):
         logger.error(f"Config validation error: {e}")
         return default_config
 
+ID_COLUMNS = ['__id__', 'userId']
+TEXT_COLUMNS = ['userName', 'aboutMe']
+SUBSCRIPTION_COLUMNS = ['subscribed', 'subscribedEliteOne', 'subscribedEliteThree',
+                        'subscribedEliteSix', 'subscribedEliteTwelve']
+
+_FLAG_VALUES = {True: 1, False: 0, 'True': 1, 'False': 0, 'true': 1, 'false': 0, '1': 1, '0': 0}
+
+def to_flag(series):
+    """Coerce a subscription column (bool, 0/1, 'True'/'False', 'unknown') to int8."""
+    if series.dtype == bool or pd.api.types.is_integer_dtype(series.dtype):
+        return (series.astype(np.int64) != 0).astype(np.int8)
+    return series.map(_FLAG_VALUES).fillna(0).astype(np.int8)
+
 def validate_csv_schema(df, expected_cols, file_name):
     """Validate CSV file schema."""
     missing_cols = [col for col in expected_cols if col not in df.columns]
@@ -115,40 +244,119 @@ def validate_csv_schema(df, expected_cols, file_name):
         logger.error(f"Missing columns in {file_name}: {missing_cols}")
         raise ValueError(f"Missing columns in {file_name}: {missing_cols}")
 
+def read_csv_header(path):
+    """Read only the header row of a CSV file."""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return next(csv.reader(f), [])
+
+def validate_csv_header(path, expected_cols, file_name):
+    """
+    Validate CSV columns from the header row, before the body is parsed.
+    Returns: list of header columns
+    """
+    header = read_csv_header(path)
+    missing_cols = [col for col in expected_cols if col not in header]
+    if missing_cols:
+        logger.error(f"Missing columns in {file_name}: {missing_cols}")
+        raise ValueError(f"Missing columns in {file_name}: {missing_cols}")
+    return header
+
+def profile_dtypes(columns, categorical_cols):
+    """
+    Explicit parser dtypes for the profile columns present in `columns`. Subscription flags and
+    age are read as text so one dirty cell cannot fail the whole parse; coerce_profile_columns
+    converts them afterwards.
+    """
+    dtypes = {}
+    for col in columns:
+        if col in ID_COLUMNS or col in TEXT_COLUMNS or col == 'age':
+            dtypes[col] = str
+        elif col in categorical_cols or col in SUBSCRIPTION_COLUMNS:
+            dtypes[col] = 'category'
+    return dtypes
+
+def coerce_profile_columns(profiles):
+    """Subscription flags to bool (unrecognised values are False) and age to float32 (NaN if not numeric)."""
+    for col in SUBSCRIPTION_COLUMNS:
+        if col in profiles.columns:
+            profiles[col] = to_flag(profiles[col].astype(object)).astype(bool)
+    if 'age' in profiles.columns:
+        profiles['age'] = pd.to_numeric(profiles['age'], errors='coerce').astype(np.float32)
+    return profiles
+
+def fill_missing(profiles):
+    """Fill missing values with 'unknown' (False for subscription flags) without widening dtypes."""
+    for col in profiles.columns:
+        if isinstance(profiles[col].dtype, pd.CategoricalDtype):
+            if 'unknown' not in profiles[col].cat.categories:
+                profiles[col] = profiles[col].cat.add_categories('unknown')
+            profiles[col] = profiles[col].fillna('unknown')
+        elif isinstance(profiles[col].dtype, pd.BooleanDtype):
+            profiles[col] = profiles[col].fillna(False).astype(bool)
+        elif col != 'age':
+            profiles[col] = profiles[col].fillna('unknown')
+    return profiles
+
+def dedupe_profiles(profiles, key='__id__', updated_at_column=None):
+    """
+    Deduplicate profiles on `key` with last-write-wins semantics.
+    The latest `updated_at_column` value wins when that column is present, otherwise the last row;
+    a missing or unparseable timestamp loses to any valid one.
+    Returns: deduplicated profiles in original row order
+    """
+    if key not in profiles.columns:
+        logger.warning(f"Dedupe key {key} not found in profiles, skipping deduplication")
+        return profiles
+    ordered = profiles
+    if updated_at_column and updated_at_column in profiles.columns:
+        updated = pd.Series(pd.to_datetime(profiles[updated_at_column], errors='coerce', utc=True).to_numpy())
+        ordered = profiles.iloc[updated.sort_values(kind='stable', na_position='first').index.to_numpy()]
+    deduped = ordered.drop_duplicates(subset=[key], keep='last').sort_index()
+    dropped = len(profiles) - len(deduped)
+    if dropped:
+        logger.info(f"Dropped {dropped} duplicate profiles on {key}")
+    return deduped.reset_index(drop=True)
+
+def _read_ids(path, file_name, columns):
+    """Read an interaction/exclusion file with header validation and string ids."""
+    validate_csv_header(path, columns, file_name)
+    return pd.read_csv(path, usecols=columns, dtype={col: str for col in columns})
+
+@traced('load_data')
 def load_data(data_dir=None):
     """
-    Load and merge CSV datasets.
+    Load and merge CSV datasets (or read them from the SQLite store when data.backend is 'sqlite').
     Returns: profiles_df, liked_df, matched_df, blocked_ids, declined_ids, deleted_ids, reported_ids
     """
     config = load_config()
+    if config['data'].get('backend', 'csv') == 'sqlite':
+        from src.sqlite_store import load_sqlite_data
+        return load_sqlite_data(data_dir)
     data_dir = data_dir or config['data']['data_dir']
     required_cols = config['data']['required_columns']
-    start_time = config.get('start_time', None)  # Set by caller if needed
+    categorical_cols = config.get('preprocessing', {}).get('categorical_columns', [])
+    dedupe_key = config['data'].get('dedupe_key', '__id__')
+    updated_at_column = config['data'].get('updated_at_column')
 
     try:
-        profiles = pd.read_csv(
-            os.path.join(data_dir, config['data']['profiles_file']),
-            usecols=[c for c in required_cols if c in pd.read_csv(os.path.join(data_dir, config['data']['profiles_file']), nrows=1).columns]
-        )
-        validate_csv_schema(profiles, required_cols, config['data']['profiles_file'])
-        
-        liked = pd.read_csv(os.path.join(data_dir, config['data']['liked_file']), usecols=['userId', '__id__'])
-        validate_csv_schema(liked, ['userId', '__id__'], config['data']['liked_file'])
-        
-        matched = pd.read_csv(os.path.join(data_dir, config['data']['matched_file']), usecols=['userId', '__id__'])
-        validate_csv_schema(matched, ['userId', '__id__'], config['data']['matched_file'])
-        
-        blocked = pd.read_csv(os.path.join(data_dir, config['data']['blocked_file']), usecols=['__id__'])
-        validate_csv_schema(blocked, ['__id__'], config['data']['blocked_file'])
-        
-        declined = pd.read_csv(os.path.join(data_dir, config['data']['declined_file']), usecols=['__id__'])
-        validate_csv_schema(declined, ['__id__'], config['data']['declined_file'])
-        
-        deleted = pd.read_csv(os.path.join(data_dir, config['data']['deleted_file']), usecols=['__id__'])
-        validate_csv_schema(deleted, ['__id__'], config['data']['deleted_file'])
+        profiles_path = os.path.join(data_dir, config['data']['profiles_file'])
+        header = validate_csv_header(profiles_path, required_cols, config['data']['profiles_file'])
+        usecols = [c for c in header if c in required_cols or c == updated_at_column]
+        profiles = pd.read_csv(profiles_path, usecols=usecols,
+                               dtype=profile_dtypes(usecols, categorical_cols))
         
-        reported = pd.read_csv(os.path.join(data_dir, config['data']['reported_file']), usecols=['__id__'])
-        validate_csv_schema(reported, ['__id__'], config['data']['reported_file'])
+        liked = _read_ids(os.path.join(data_dir, config['data']['liked_file']),
+                          config['data']['liked_file'], ['userId', '__id__'])
+        matched = _read_ids(os.path.join(data_dir, config['data']['matched_file']),
+                            config['data']['matched_file'], ['userId', '__id__'])
+        blocked = _read_ids(os.path.join(data_dir, config['data']['blocked_file']),
+                            config['data']['blocked_file'], ['__id__'])
+        declined = _read_ids(os.path.join(data_dir, config['data']['declined_file']),
+                             config['data']['declined_file'], ['__id__'])
+        deleted = _read_ids(os.path.join(data_dir, config['data']['deleted_file']),
+                            config['data']['deleted_file'], ['__id__'])
+        reported = _read_ids(os.path.join(data_dir, config['data']['reported_file']),
+                             config['data']['reported_file'], ['__id__'])
         
     except FileNotFoundError as e:
         logger.error(f"CSV file not found: {e}")
@@ -160,10 +368,8 @@ def load_data(data_dir=None):
         logger.error(f"Unexpected error loading data: {e}")
         return None, None, None, None, None, None, None
 
-    profiles = profiles.drop_duplicates().fillna("unknown")
+    profiles = fill_missing(coerce_profile_columns(dedupe_profiles(profiles, dedupe_key, updated_at_column)))
     logger.info(f"Loaded {len(profiles)} profiles, {len(liked)} liked, {len(matched)} matched")
-    if start_time:
-        logger.info(f"Data Loading Time: {time.time() - start_time:.2f} seconds")
     return (profiles, liked, matched, 
             blocked['__id__'].tolist(), declined['__id__'].tolist(), 
-            deleted['__id__'].tolist(), reported['__id__'].tolist())
\ No newline at end of file
+            deleted['__id__'].tolist(), reported['__id__'].tolist())
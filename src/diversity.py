@@ -0,0 +1,64 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+def pair_similarity(text_rows, codes, index, text_weight=0.5):
+    """
+    Similarity of every shortlist row to row `index`: a blend of TF-IDF cosine
+    (rows are L2-normalised by the vectorizer) and the share of equal category codes.
+    Returns: float array of length len(codes)
+    """
+    text_sim = np.asarray((text_rows @ text_rows[index].T).todense()).ravel()
+    if codes.shape[1]:
+        code_sim = (codes == codes[index]).mean(axis=1)
+    else:
+        code_sim = np.zeros(len(codes))
+    return text_weight * text_sim + (1 - text_weight) * code_sim
+
+def mmr_rerank(relevance, text_rows, codes, k, mmr_lambda=0.7, text_weight=0.5):
+    """
+    Maximal Marginal Relevance over a shortlist.
+    Each step picks argmax(lambda * relevance - (1 - lambda) * max similarity to the picks so far);
+    the running max similarity is updated with one row of similarities per pick, so the
+    cost is O(N * K) rather than the O(N^2) of a full similarity matrix.
+    Returns: shortlist positions in selection order
+    """
+    relevance = np.asarray(relevance, dtype=np.float64)
+    n = len(relevance)
+    k = min(k, n)
+    if not k:
+        return np.zeros(0, dtype=np.int64)
+    # Scale relevance to [0, 1] so lambda trades off comparable quantities
+    top = relevance.max()
+    relevance = np.clip(relevance / top, 0, None) if top > 0 else np.ones(n)
+
+    max_sim = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    selected = np.empty(k, dtype=np.int64)
+    for step in range(k):
+        gain = np.where(available, mmr_lambda * relevance - (1 - mmr_lambda) * max_sim, -np.inf)
+        pick = int(np.argmax(gain))
+        selected[step] = pick
+        available[pick] = False
+        np.maximum(max_sim, pair_similarity(text_rows, codes, pick, text_weight), out=max_sim)
+    return selected
+
+def diversity_metrics(text_rows, codes, code_columns=(), text_weight=0.5):
+    """
+    Diversity of a result list.
+    Returns: dict with intra_list_diversity (1 - mean pairwise similarity) and distinct values per category
+    """
+    n = text_rows.shape[0]
+    result = {}
+    if n > 1:
+        text_sim = np.asarray((text_rows @ text_rows.T).todense())
+        code_sim = (codes[:, None, :] == codes[None, :, :]).mean(axis=2) if codes.shape[1] else 0.0
+        similarity = text_weight * text_sim + (1 - text_weight) * code_sim
+        off_diagonal = similarity[~np.eye(n, dtype=bool)]
+        result['intra_list_diversity'] = float(1 - off_diagonal.mean())
+    else:
+        result['intra_list_diversity'] = 0.0
+    for i, col in enumerate(code_columns):
+        result[f'distinct_{col}'] = int(len(np.unique(codes[:, i])))
+    return result
@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+from src.data_loader import load_config, load_data
+from src.preprocessing import preprocess_data
+from src.profile_store import ProfileStore
+from src.recommender import train_model, training_rows
+from src.pipeline import MatchEngine
+from src.parallel import fork_map
+
+logger = logging.getLogger(__name__)
+
+def load_interactions(liked, matched, data_dir=None, timestamp_column=None):
+    """
+    Combine likes (weight 1) and matches (weight 2) into one event table ordered by time.
+    Uses `timestamp_column` from the CSVs when present, otherwise file row order.
+    Returns: DataFrame with userId, __id__, weight, order
+    """
+    config = load_config()
+    frames = []
+    for frame, weight, key in ((liked, 1, 'liked_file'), (matched, 2, 'matched_file')):
+        frame = frame[['userId', '__id__']].copy()
+        frame['weight'] = weight
+        frame['order'] = np.arange(len(frame), dtype=np.float64)
+        if timestamp_column and data_dir:
+            path = os.path.join(data_dir, config['data'][key])
+            header = pd.read_csv(path, nrows=0).columns
+            if timestamp_column in header:
+                stamps = pd.read_csv(path, usecols=[timestamp_column])[timestamp_column]
+                stamps = pd.to_datetime(stamps, errors='coerce', utc=True)
+                epoch = pd.Timestamp(0, tz='UTC')
+                frame['order'] = (stamps - epoch).dt.total_seconds().fillna(-np.inf).to_numpy()
+        frames.append(frame)
+    events = pd.concat(frames, ignore_index=True)
+    return events.sort_values('order', kind='stable').reset_index(drop=True)
+
+def time_split(events, holdout_per_user=1, min_history=2):
+    """
+    Hold out each user's most recent `holdout_per_user` interactions.
+    Users with fewer than `min_history` + holdout_per_user events are kept entirely in training.
+    Returns: train_events, holdout_events
+    """
+    per_user = events.groupby('userId', sort=False)['userId'].transform('size').to_numpy()
+    from_end = events.groupby('userId', sort=False).cumcount(ascending=False).to_numpy()
+    is_holdout = (from_end < holdout_per_user) & (per_user >= min_history + holdout_per_user)
+    return events[~is_holdout].reset_index(drop=True), events[is_holdout].reset_index(drop=True)
+
+def _split_frames(events):
+    liked = events.loc[events['weight'] == 1, ['userId', '__id__']]
+    matched = events.loc[events['weight'] == 2, ['userId', '__id__']]
+    return liked, matched
+
+def viewer_profiles(store, user_ids):
+    """Resolved profile dicts for viewers, looked up by userId in the store."""
+    table = store.table
+    positions = pd.Index(table['userId']).get_indexer(user_ids)
+    found = positions >= 0
+    rows = store.resolve(table.iloc[positions[found]])
+    viewers = []
+    for row in rows.itertuples(index=False):
+        viewers.append({
+            'userId': row.userId,
+            'age': int(min(max(row.age, 18), 70)),
+            'sex': row.sex,
+            'seeking': row.seeking,
+            'country': row.country,
+            'language': row.language,
+            'relationshipGoals': row.relationshipGoals,
+            'aboutMe': str(row.aboutMe),
+        })
+    return viewers
+
+def replay_shard(shared, viewers):
+    """
+    Run the recommend pipeline (minus persistence) for a shard of viewers; `shared` is
+    (engine, seen training items per user, k). Already-seen items are removed before taking the top K.
+    Returns: (user_idx, item_idx, rank) int arrays for all recommendations
+    """
+    engine, seen, k = shared
+    user_out, item_out, rank_out = [], [], []
+    for viewer in viewers:
+        filtered = engine.filter_candidates(viewer)
+        if filtered.empty:
+            continue
+        user_idx = engine.user_to_idx.get(viewer['userId'])
+        if user_idx is None:
+            continue
+        seen_items = seen.get(user_idx)
+        if seen_items is not None:
+            filtered = filtered[~np.isin(engine.item_index[filtered.index.to_numpy()], seen_items)]
+            if filtered.empty:
+                continue
+        scored = engine.score_candidates(viewer, filtered)
+        top = scored.nlargest(k, 'final_score')
+        items = engine.item_index[top.index.to_numpy()]
+        user_out.append(np.full(len(items), user_idx, dtype=np.int64))
+        item_out.append(items)
+        rank_out.append(np.arange(len(items), dtype=np.int64))
+    if not user_out:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    return np.concatenate(user_out), np.concatenate(item_out), np.concatenate(rank_out)
+
+def ranking_metrics(rec_users, rec_items, rec_ranks, holdout_matrix, k, eval_users):
+    """
+    Precision@K, recall@K, NDCG@K and catalogue coverage with sparse operations.
+    holdout_matrix is a users x items binary CSR matrix; eval_users are the users held out.
+    Returns: dict of metrics
+    """
+    from scipy.sparse import csr_matrix
+
+    n_users, n_items = holdout_matrix.shape
+    hits_matrix = csr_matrix((np.ones(len(rec_users)), (rec_users, rec_items)), shape=(n_users, n_items))
+    gains = csr_matrix((1.0 / np.log2(rec_ranks + 2.0), (rec_users, rec_items)), shape=(n_users, n_items))
+
+    hits = np.asarray(hits_matrix.multiply(holdout_matrix).sum(axis=1)).ravel()[eval_users]
+    dcg = np.asarray(gains.multiply(holdout_matrix).sum(axis=1)).ravel()[eval_users]
+    relevant = np.asarray(holdout_matrix.sum(axis=1)).ravel()[eval_users]
+    ideal_discounts = np.concatenate([[0.0], np.cumsum(1.0 / np.log2(np.arange(k) + 2.0))])
+    idcg = ideal_discounts[np.minimum(relevant, k).astype(int)]
+
+    return {
+        'users': int(len(eval_users)),
+        f'precision@{k}': float(np.mean(hits / k)) if len(eval_users) else 0.0,
+        f'recall@{k}': float(np.mean(np.divide(hits, relevant, out=np.zeros_like(hits), where=relevant > 0))) if len(eval_users) else 0.0,
+        f'ndcg@{k}': float(np.mean(np.divide(dcg, idcg, out=np.zeros_like(dcg), where=idcg > 0))) if len(eval_users) else 0.0,
+        'coverage': float(len(np.unique(rec_items)) / n_items) if n_items else 0.0,
+    }
+
+def holdout_rmse(model, scaler, holdout_matrix, X_features):
+    """Root mean squared error of the model on held-out interaction weights."""
+    X, y = training_rows(holdout_matrix, X_features)
+    if not len(y):
+        return 0.0
+    return float(np.sqrt(np.mean((model.predict(scaler.transform(X)) - y) ** 2)))
+
+def _binary_matrix(events, user_to_idx, profile_to_idx, shape):
+    from scipy.sparse import csr_matrix
+
+    rows = events['userId'].map(user_to_idx)
+    cols = events['__id__'].map(profile_to_idx)
+    valid = (rows.notna() & cols.notna()).to_numpy()
+    matrix = csr_matrix((np.ones(int(valid.sum())), (rows[valid].to_numpy(dtype=np.int64),
+                                                     cols[valid].to_numpy(dtype=np.int64))), shape=shape)
+    matrix.data[:] = 1.0  # duplicates collapse to a single relevant item
+    return matrix
+
+def replay_holdout(engine, store, interaction_matrix, holdout_events, k=5, workers=None, shard_size=500,
+                   max_users=None, seed=0):
+    """
+    Replay recommend for the held-out users and score the recommendations against their holdout.
+    `interaction_matrix` holds the training interactions, whose items are not recommended again.
+    Returns: dict of ranking metrics, replay_seconds and workers
+    """
+    holdout_matrix = _binary_matrix(holdout_events, engine.user_to_idx, engine.profile_to_idx,
+                                    interaction_matrix.shape)
+    eval_user_ids = holdout_events['userId'].drop_duplicates()
+    if max_users and len(eval_user_ids) > max_users:
+        eval_user_ids = eval_user_ids.sample(max_users, random_state=seed)
+    viewers = viewer_profiles(store, eval_user_ids.to_numpy())
+    eval_users = np.array([engine.user_to_idx[v['userId']] for v in viewers], dtype=np.int64)
+
+    seen_matrix = interaction_matrix.tocsr()
+    seen = {}
+    for user_idx in eval_users:
+        items = seen_matrix.indices[seen_matrix.indptr[user_idx]:seen_matrix.indptr[user_idx + 1]]
+        if len(items):
+            seen[user_idx] = items
+
+    start = time.perf_counter()
+    shards = [viewers[i:i + shard_size] for i in range(0, len(viewers), shard_size)]
+    workers = workers if workers is not None else min(os.cpu_count() or 1, max(len(shards), 1))
+    parts = list(fork_map(replay_shard, shards, (engine, seen, k), workers))
+    replay_seconds = time.perf_counter() - start
+
+    rec_users = np.concatenate([p[0] for p in parts]) if parts else np.zeros(0, dtype=np.int64)
+    rec_items = np.concatenate([p[1] for p in parts]) if parts else np.zeros(0, dtype=np.int64)
+    rec_ranks = np.concatenate([p[2] for p in parts]) if parts else np.zeros(0, dtype=np.int64)
+    metrics = ranking_metrics(rec_users, rec_items, rec_ranks, holdout_matrix, k, eval_users)
+    metrics['replay_seconds'] = replay_seconds
+    metrics['workers'] = workers
+    return metrics
+
+def evaluate(data_dir=None, k=5, holdout_per_user=1, min_history=2, workers=None,
+             shard_size=500, max_users=None, seed=0, timestamp_column=None):
+    """
+    Time-split offline evaluation: train on older interactions, replay recommend for held-out users.
+    Returns: dict of ranking metrics and stage timings
+    """
+    config = load_config()
+    timings = {}
+    start = time.perf_counter()
+    (profiles, liked, matched, blocked_ids, declined_ids,
+     deleted_ids, reported_ids) = load_data(data_dir=data_dir)
+    if profiles is None:
+        raise ValueError("Failed to load data for evaluation")
+    data_dir = data_dir or config['data']['data_dir']
+    store = ProfileStore.from_profiles(profiles, config['preprocessing']['categorical_columns'],
+                                       config['preprocessing']['keywords'])
+    events = load_interactions(liked, matched, data_dir, timestamp_column)
+    train_events, holdout_events = time_split(events, holdout_per_user, min_history)
+    train_liked, train_matched = _split_frames(train_events)
+    (_, interaction_matrix, X_features, user_to_idx, profile_to_idx,
+     label_encoders, tfidf) = preprocess_data(profiles, train_liked, train_matched)
+    timings['prepare_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model, scaler = train_model(interaction_matrix, X_features)
+    timings['train_seconds'] = time.perf_counter() - start
+
+    engine = MatchEngine(store, X_features, model, scaler, label_encoders, tfidf, user_to_idx,
+                         profile_to_idx, blocked_ids, declined_ids, deleted_ids, reported_ids)
+    metrics = replay_holdout(engine, store, interaction_matrix, holdout_events, k=k, workers=workers,
+                             shard_size=shard_size, max_users=max_users, seed=seed)
+    metrics.update(timings)
+    logger.info(f"Offline evaluation: {metrics}")
+    return metrics
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline time-split ranking evaluation")
+    parser.add_argument("--data_dir", default=None, help="Data directory (defaults to config)")
+    parser.add_argument("--k", type=int, default=5, help="Cut-off for ranking metrics")
+    parser.add_argument("--holdout", type=int, default=1, help="Most recent interactions held out per user")
+    parser.add_argument("--workers", type=int, default=None, help="Replay worker processes")
+    parser.add_argument("--max_users", type=int, default=None, help="Evaluate a random sample of users")
+    parser.add_argument("--timestamp_column", default=None, help="Interaction timestamp column, if any")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    results = evaluate(args.data_dir, k=args.k, holdout_per_user=args.holdout, workers=args.workers,
+                       max_users=args.max_users, timestamp_column=args.timestamp_column)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import threading
+import time
+import logging
+import numpy as np
+import pandas as pd
+from src.instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+# Event type -> exclusion set it feeds (profile ids excluded for every viewer)
+EXCLUSION_EVENTS = {'block': 'blocked', 'decline': 'declined', 'delete': 'deleted', 'report': 'reported'}
+INTERACTION_EVENTS = {'like': 1, 'match': 2}
+
+def append_events(path, events):
+    """
+    Append events to a JSONL log (a file, or the last segment of a log directory).
+    Each event is a dict with 'type', '__id__', 'userId' for likes/matches and 'ts' (epoch
+    seconds, filled in if missing); one write per call keeps lines whole for readers.
+    """
+    if os.path.isdir(path):
+        segments = list_segments(path)
+        path = segments[-1] if segments else os.path.join(path, "events-000000.jsonl")
+    now = time.time()
+    lines = [json.dumps({'ts': now, **event}, separators=(',', ':')) for event in events]
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+
+def list_segments(path):
+    """Segment files of a log: the file itself, or a directory's *.jsonl files in name order."""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.jsonl")))
+    return [path] if os.path.exists(path) else []
+
+class EventIngestor:
+    """
+    Tails an append-only event log and applies it to a serving engine in batches: block,
+    decline, delete and report events extend the exclusions (engine.add_exclusions), likes and
+    matches the interaction store (engine.add_interactions). The read position, the ingested
+    exclusions and interactions are checkpointed, so a restart resumes where it stopped. Each
+    checkpoint writes only the events applied since the previous one to a delta file; once
+    `compact_after` deltas have accumulated they are folded into a single file.
+    """
+
+    def __init__(self, engine, log_path, checkpoint_path=None, user_to_idx=None, profile_to_idx=None,
+                 batch_bytes=1 << 20, poll_interval=0.2, checkpoint_interval=5.0, compact_after=32):
+        self.engine = engine
+        self.log_path = log_path
+        self.checkpoint_path = checkpoint_path
+        self.user_to_idx = user_to_idx if user_to_idx is not None else getattr(engine, 'user_to_idx', {})
+        self.profile_to_idx = profile_to_idx if profile_to_idx is not None else getattr(engine, 'profile_to_idx', {})
+        self.batch_bytes = batch_bytes
+        self.poll_interval = poll_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.compact_after = compact_after
+        self.segment = None
+        self.offset = 0
+        self.applied = 0
+        self.malformed = 0
+        self.last_event_ts = None
+        self.lag_seconds = 0.0
+        self.exclusions = {kind: set() for kind in EXCLUSION_EVENTS.values()}
+        self.interactions = {'userId': [], '__id__': [], 'weight': []}
+        # State not yet in a delta file: exclusions added and interactions past saved_interactions
+        self.pending_exclusions = {kind: set() for kind in EXCLUSION_EVENTS.values()}
+        self.saved_interactions = 0
+        self.deltas = []
+        self.delta_seq = 0
+        self.last_checkpoint = time.monotonic()
+
+    def restore(self):
+        """Resume from the checkpoint, re-applying its exclusions and interactions to the engine."""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return False
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        self.segment, self.offset = state['segment'], state['offset']
+        self.applied, self.last_event_ts = state['applied'], state.get('last_event_ts')
+        self.deltas, self.delta_seq = state['deltas'], state['delta_seq']
+        for name in self.deltas:
+            with np.load(self.delta_path(name), allow_pickle=False) as data:
+                for column in ('userId', '__id__', 'weight'):
+                    self.interactions[column].extend(data[column].tolist())
+                for kind, profile_id in zip(data['exclusion_kind'].tolist(), data['exclusion_id'].tolist()):
+                    self.exclusions[kind].add(profile_id)
+        self.saved_interactions = len(self.interactions['userId'])
+        self.engine.add_exclusions(set().union(*self.exclusions.values()))
+        self.push_interactions(self.interactions['userId'], self.interactions['__id__'], self.interactions['weight'])
+        logger.info(f"Resumed event ingestion at {self.segment}:{self.offset} ({self.applied} events applied)")
+        return True
+
+    def delta_path(self, name):
+        return os.path.join(os.path.dirname(os.path.abspath(self.checkpoint_path)), name)
+
+    def write_delta(self, start, exclusions):
+        """Write interactions from `start` on and the given exclusions to a new delta file. Returns: its name."""
+        self.delta_seq += 1
+        name = f"{os.path.basename(self.checkpoint_path)}.delta-{self.delta_seq:06d}.npz"
+        pairs = [(kind, str(profile_id)) for kind, ids in exclusions.items() for profile_id in sorted(map(str, ids))]
+        with open(self.delta_path(name), 'wb') as f:
+            np.savez(f, userId=np.asarray(self.interactions['userId'][start:], dtype=str),
+                     __id__=np.asarray(self.interactions['__id__'][start:], dtype=str),
+                     weight=np.asarray(self.interactions['weight'][start:], dtype=np.int8),
+                     exclusion_kind=np.asarray([kind for kind, _ in pairs], dtype=str),
+                     exclusion_id=np.asarray([profile_id for _, profile_id in pairs], dtype=str))
+        return name
+
+    def checkpoint(self):
+        """
+        Write the events applied since the last checkpoint as a delta file, then the read
+        position and delta list atomically; the delta only becomes part of the state once the
+        position that covers it does.
+        """
+        if not self.checkpoint_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_path)), exist_ok=True)
+        superseded = []
+        if len(self.interactions['userId']) > self.saved_interactions or any(self.pending_exclusions.values()):
+            if len(self.deltas) >= self.compact_after:
+                superseded, self.deltas = self.deltas, [self.write_delta(0, self.exclusions)]
+            else:
+                self.deltas.append(self.write_delta(self.saved_interactions, self.pending_exclusions))
+        state = {'segment': self.segment, 'offset': self.offset, 'applied': self.applied,
+                 'last_event_ts': self.last_event_ts, 'deltas': self.deltas, 'delta_seq': self.delta_seq}
+        with open(self.checkpoint_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(self.checkpoint_path + ".tmp", self.checkpoint_path)
+        for name in superseded:
+            os.remove(self.delta_path(name))
+        self.saved_interactions = len(self.interactions['userId'])
+        self.pending_exclusions = {kind: set() for kind in EXCLUSION_EVENTS.values()}
+        self.last_checkpoint = time.monotonic()
+
+    def backlog_bytes(self):
+        """Bytes written to the log but not yet applied."""
+        segments = list_segments(self.log_path)
+        backlog = 0
+        for segment in segments:
+            if self.segment is None or segment > self.segment:
+                backlog += os.path.getsize(segment)
+            elif segment == self.segment:
+                backlog += os.path.getsize(segment) - self.offset
+        return backlog
+
+    def read_batch(self):
+        """
+        Up to batch_bytes of whole lines from the current position, moving on to the next
+        segment once the current one is exhausted and a newer one exists.
+        Returns: list of raw lines (bytes)
+        """
+        segments = list_segments(self.log_path)
+        if not segments:
+            return []
+        if self.segment is None:
+            self.segment, self.offset = segments[0], 0
+        while True:
+            with open(self.segment, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read(self.batch_bytes)
+                # A single line longer than a batch is read through to its end
+                while b"\n" not in data and len(data) % self.batch_bytes == 0 and data:
+                    data += f.read(self.batch_bytes)
+            end = data.rfind(b"\n") + 1
+            if end:
+                self.offset += end
+                return data[:end].splitlines()
+            later = [segment for segment in segments if segment > self.segment]
+            if not later:
+                return []
+            # A partial line left in a sealed segment was never committed
+            self.segment, self.offset = later[0], 0
+
+    def apply(self, lines):
+        """
+        Parse a batch and apply it: one add_exclusions and one add_interactions call per batch.
+        Returns: number of events applied
+        """
+        new_exclusions = set()
+        users, profiles, weights = [], [], []
+        newest = None
+        applied = 0
+        for line in lines:
+            try:
+                event = json.loads(line)
+                kind = event['type']
+                profile_id = event['__id__']
+            except (ValueError, KeyError, TypeError):
+                self.malformed += 1
+                continue
+            if kind in EXCLUSION_EVENTS:
+                if profile_id not in self.exclusions[EXCLUSION_EVENTS[kind]]:
+                    self.pending_exclusions[EXCLUSION_EVENTS[kind]].add(profile_id)
+                self.exclusions[EXCLUSION_EVENTS[kind]].add(profile_id)
+                new_exclusions.add(profile_id)
+            elif kind in INTERACTION_EVENTS and 'userId' in event:
+                users.append(event['userId'])
+                profiles.append(profile_id)
+                weights.append(INTERACTION_EVENTS[kind])
+            else:
+                self.malformed += 1
+                continue
+            applied += 1
+            ts = event.get('ts')
+            if ts is not None and (newest is None or ts > newest):
+                newest = ts
+        if new_exclusions:
+            self.engine.add_exclusions(new_exclusions)
+        if users:
+            self.interactions['userId'].extend(users)
+            self.interactions['__id__'].extend(profiles)
+            self.interactions['weight'].extend(weights)
+            self.push_interactions(users, profiles, weights)
+        self.applied += applied
+        if newest is not None:
+            self.last_event_ts = newest
+            # Age of the newest event at the moment it became visible to serving
+            self.lag_seconds = max(time.time() - newest, 0.0)
+        metrics.increment('ingest_events', applied)
+        metrics.set_gauge('ingest_lag_seconds', self.lag_seconds)
+        return applied
+
+    def push_interactions(self, users, profiles, weights):
+        """Hand likes/matches to the engine as a users x profiles matrix (weights as in preprocessing)."""
+        if not users or not hasattr(self.engine, 'add_interactions'):
+            return
+        from scipy.sparse import csr_matrix
+
+        user_idx = pd.Series(users).map(self.user_to_idx)
+        item_idx = pd.Series(profiles).map(self.profile_to_idx)
+        valid = (user_idx.notna() & item_idx.notna()).to_numpy()
+        if not valid.any():
+            return
+        matrix = csr_matrix((np.asarray(weights)[valid], (user_idx[valid].to_numpy(dtype=np.int64),
+                                                          item_idx[valid].to_numpy(dtype=np.int64))),
+                            shape=(len(self.user_to_idx), len(self.profile_to_idx)))
+        self.engine.add_interactions(matrix)
+
+    def poll_once(self):
+        """Read and apply one batch, checkpointing when the interval has passed. Returns: events applied."""
+        applied = self.apply(self.read_batch())
+        if applied and time.monotonic() - self.last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+        return applied
+
+    def catch_up(self):
+        """Apply everything currently in the log, then checkpoint. Returns: events applied."""
+        start = time.perf_counter()
+        total = 0
+        while True:
+            lines = self.read_batch()
+            if not lines:
+                break
+            total += self.apply(lines)
+        self.checkpoint()
+        metrics.set_gauge('ingest_backlog_bytes', 0)
+        seconds = time.perf_counter() - start
+        logger.info(f"Ingested {total} events in {seconds:.2f}s ({total / max(seconds, 1e-9):,.0f} events/s)")
+        return total
+
+    async def run(self, stop=None):
+        """
+        Tail the log until `stop` (a threading.Event) is set: reads happen off the event loop,
+        batches are applied as they arrive and an idle log is polled every poll_interval.
+        """
+        stop = stop or threading.Event()
+        try:
+            while not stop.is_set():
+                lines = await asyncio.to_thread(self.read_batch)
+                if lines:
+                    self.apply(lines)
+                    if time.monotonic() - self.last_checkpoint >= self.checkpoint_interval:
+                        await asyncio.to_thread(self.checkpoint)
+                    continue
+                self.lag_seconds = 0.0
+                metrics.set_gauge('ingest_lag_seconds', 0.0)
+                metrics.set_gauge('ingest_backlog_bytes', await asyncio.to_thread(self.backlog_bytes))
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            self.checkpoint()
+
+    def stats(self):
+        return {'segment': self.segment, 'offset': self.offset, 'applied': self.applied,
+                'malformed': self.malformed, 'lag_seconds': self.lag_seconds,
+                'backlog_bytes': self.backlog_bytes(),
+                'excluded': sum(len(ids) for ids in self.exclusions.values()),
+                'interactions': len(self.interactions['userId'])}
+
+def start_ingestion(ingestor):
+    """
+    Run an ingestor's asyncio loop in a daemon thread next to a serving process.
+    Returns: (thread, stop event)
+    """
+    stop = threading.Event()
+    thread = threading.Thread(target=lambda: asyncio.run(ingestor.run(stop)), name="event-ingest", daemon=True)
+    thread.start()
+    return thread, stop
+
+def stop_ingestion(thread, stop, timeout=10.0):
+    """
+    Stop a thread from start_ingestion and wait for its final checkpoint.
+    Returns: True if the thread exited within `timeout`
+    """
+    stop.set()
+    thread.join(timeout)
+    if thread.is_alive():
+        logger.warning(f"Event ingestion thread did not stop within {timeout}s")
+        return False
+    return True
+
+def create_ingestor(config, engine):
+    """Ingestor from the `event_log` config section (restored from its checkpoint), or None when disabled."""
+    settings = config.get('event_log', {})
+    if not settings.get('enabled', False):
+        return None
+    ingestor = EventIngestor(engine, settings['path'], settings.get('checkpoint_file'),
+                             batch_bytes=int(settings.get('batch_kb', 1024) * 1024),
+                             poll_interval=settings.get('poll_interval_ms', 200) / 1000.0,
+                             checkpoint_interval=settings.get('checkpoint_interval_s', 5.0),
+                             compact_after=settings.get('compact_after', 32))
+    ingestor.restore()
+    return ingestor
+
+class _ExclusionCounter:
+    """Stand-in engine for measuring raw ingestion throughput."""
+
+    def __init__(self):
+        self.excluded_ids = set()
+
+    def add_exclusions(self, profile_ids):
+        self.excluded_ids |= set(profile_ids)
+
+def main():
+    parser = argparse.ArgumentParser(description="Event log ingestion: catch up once, or generate and measure")
+    parser.add_argument("--log", required=True, help="Event log file or segment directory")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file")
+    parser.add_argument("--generate", type=int, default=0,
+                        help="Append N synthetic events first, then report ingestion throughput")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.generate:
+        rng = np.random.default_rng(0)
+        kinds = np.array(['like'] * 6 + ['match', 'block', 'decline', 'report'])
+        events = [{'type': kind, 'userId': f"user{u}", '__id__': f"p{p:09d}"}
+                  for kind, u, p in zip(rng.choice(kinds, args.generate), rng.integers(0, 50000, args.generate),
+                                        rng.integers(0, 50000, args.generate))]
+        append_events(args.log, events)
+    ingestor = EventIngestor(_ExclusionCounter(), args.log, args.checkpoint)
+    ingestor.restore()
+    ingestor.catch_up()
+    print(json.dumps(ingestor.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
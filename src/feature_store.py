@@ -0,0 +1,115 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+def csr_nbytes(matrix):
+    """Memory held by a CSR matrix's data, indices and indptr arrays."""
+    return int(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes)
+
+def narrow_dtype(values):
+    """Smallest dtype holding a numeric column exactly (float32 for non-integer columns)."""
+    values = np.asarray(values)
+    if values.dtype.kind == 'b':
+        return np.dtype(np.uint8)
+    if values.dtype.kind not in 'iu':
+        return np.dtype(np.float32)
+    if not len(values):
+        return np.dtype(np.uint8)
+    low, high = values.min(), values.max()
+    for dtype in (np.uint8, np.int8, np.uint16, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def gather_csr(data, indices, indptr, rows):
+    """
+    Rows of a CSR matrix given as raw arrays, in one vectorised pass.
+    Returns: data, indices, indptr of the selected rows
+    """
+    starts = indptr[rows].astype(np.int64)
+    counts = indptr[rows + 1].astype(np.int64) - starts
+    new_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_indptr[1:])
+    positions = np.repeat(starts - new_indptr[:-1], counts) + np.arange(new_indptr[-1])
+    return data[positions], indices[positions], new_indptr.astype(indptr.dtype)
+
+class FeatureStore:
+    """
+    Item feature matrix split by storage. The numeric block (age, category codes, subscription
+    flags, keyword score) is one contiguous record array with a narrow dtype per column; the
+    TF-IDF block is float32 CSR with uint16 column indices when the vocabulary allows.
+    Logically it is the [numeric | text] matrix the model was trained on: indexing rows gives
+    another FeatureStore and toarray() gathers the dense float32 rows in that column order.
+    """
+
+    def __init__(self, numeric, text_data, text_indices, text_indptr, text_width):
+        self.numeric = numeric
+        self.text_data = text_data
+        self.text_indices = text_indices
+        self.text_indptr = text_indptr
+        self.text_width = text_width
+
+    @classmethod
+    def from_blocks(cls, numeric, text):
+        """Build from a DataFrame of numeric columns and a sparse TF-IDF matrix."""
+        from scipy.sparse import csr_matrix
+
+        text = csr_matrix(text)
+        columns = [str(col) for col in numeric.columns]
+        records = np.empty(len(numeric), dtype=[(col, narrow_dtype(numeric[col].to_numpy())) for col in columns])
+        for col in columns:
+            records[col] = numeric[col].to_numpy()
+        index_dtype = np.uint16 if text.shape[1] <= np.iinfo(np.uint16).max + 1 else np.int32
+        indptr_dtype = np.int32 if text.nnz <= np.iinfo(np.int32).max else np.int64
+        return cls(records, text.data.astype(np.float32), text.indices.astype(index_dtype),
+                   text.indptr.astype(indptr_dtype), text.shape[1])
+
+    @property
+    def shape(self):
+        return (len(self.numeric), len(self.numeric.dtype.names) + self.text_width)
+
+    @property
+    def nbytes(self):
+        return int(self.numeric.nbytes + self.text_data.nbytes + self.text_indices.nbytes +
+                   self.text_indptr.nbytes)
+
+    def __getitem__(self, rows):
+        """Row selection (int, slice or index array); column slicing is not supported."""
+        if isinstance(rows, tuple):
+            raise TypeError("FeatureStore supports row indexing only; use tocsr() for column slices")
+        if isinstance(rows, slice):
+            rows = np.arange(len(self.numeric))[rows]
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        data, indices, indptr = gather_csr(self.text_data, self.text_indices, self.text_indptr, rows)
+        return FeatureStore(self.numeric[rows], data, indices, indptr, self.text_width)
+
+    def numeric_array(self):
+        """The numeric block as a dense float32 array."""
+        out = np.empty((len(self.numeric), len(self.numeric.dtype.names)), dtype=np.float32)
+        for j, col in enumerate(self.numeric.dtype.names):
+            out[:, j] = self.numeric[col]
+        return out
+
+    def toarray(self):
+        """Dense float32 rows: one allocation, numeric columns copied, text entries scattered in."""
+        width = len(self.numeric.dtype.names)
+        out = np.zeros(self.shape, dtype=np.float32)
+        out[:, :width] = self.numeric_array()
+        rows = np.repeat(np.arange(len(self.numeric)), np.diff(self.text_indptr))
+        out[rows, width + self.text_indices.astype(np.int64)] = self.text_data
+        return out
+
+    def text_csr(self):
+        """The TF-IDF block as a scipy CSR matrix."""
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self.text_data, self.text_indices, self.text_indptr),
+                          shape=(len(self.numeric), self.text_width))
+
+    def tocsr(self):
+        """The combined matrix as one float32 CSR (for column slicing and sparse algebra)."""
+        from scipy.sparse import csr_matrix, hstack
+
+        return hstack([csr_matrix(self.numeric_array()), self.text_csr()], format='csr')
@@ -0,0 +1,54 @@
+import os
+import re
+import subprocess
+import sys
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Imports that must stay deferred until first use on the request path
+DEFERRED_MODULES = ['streamlit', 'sklearn', 'scipy', 'jsonschema', 'joblib']
+
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+def parse_importtime(stderr):
+    """
+    Parse `python -X importtime` output.
+    Returns: dict mapping module name -> (self_us, cumulative_us, depth)
+    """
+    timings = {}
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            timings.setdefault(name, (int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return timings
+
+def measure_import_time(modules, cwd=None):
+    """
+    Import `modules` in a fresh interpreter with -X importtime.
+    Returns: (total cumulative ms of the requested modules, dict of all module timings)
+    """
+    cwd = cwd or os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    code = '; '.join(f"import {m}" for m in modules)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=cwd, capture_output=True, text=True, check=True)
+    timings = parse_importtime(result.stderr)
+    total_ms = sum(timings[m][1] for m in modules if m in timings) / 1000.0
+    return total_ms, timings
+
+def deferred_violations(timings, deferred=None):
+    """Names of deferred top-level packages that were imported anyway."""
+    deferred = deferred or DEFERRED_MODULES
+    return sorted({name.split('.')[0] for name in timings if name.split('.')[0] in deferred})
+
+if __name__ == "__main__":
+    targets = sys.argv[1:] or ['ui.cli']
+    total_ms, timings = measure_import_time(targets)
+    print(f"Import time for {', '.join(targets)}: {total_ms:.1f} ms")
+    top = sorted(timings.items(), key=lambda item: item[1][0], reverse=True)[:15]
+    for name, (self_us, cumulative_us, _) in top:
+        print(f"{self_us / 1000.0:8.1f} ms self {cumulative_us / 1000.0:8.1f} ms cumulative  {name}")
+    violations = deferred_violations(timings)
+    if violations:
+        print(f"Eagerly imported heavy modules: {violations}")
@@ -0,0 +1,254 @@
+import functools
+import json
+import math
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 2**5 sub-buckets per power of two: recorded values are exact to within ~3%
+_SUB_BUCKET_BITS = 5
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear histogram of nanosecond latencies.
+    Memory is bounded by the dynamic range, not by the number of samples.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def bucket_index(value):
+        if value < _SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - _SUB_BUCKET_BITS - 1
+        return (shift + 1) * _SUB_BUCKETS + ((value >> shift) - _SUB_BUCKETS)
+
+    @staticmethod
+    def bucket_upper(index):
+        if index < _SUB_BUCKETS:
+            return index
+        shift = index // _SUB_BUCKETS - 1
+        mantissa = index % _SUB_BUCKETS + _SUB_BUCKETS
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(int(value), 0)
+        index = self.bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def merge(self, other):
+        for index, n in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-quantile (0 < q <= 1)."""
+        if not self.count:
+            return 0
+        target = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.bucket_upper(index), self.max)
+        return self.max
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_candidates(self, n):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class _Span:
+    __slots__ = ('registry', 'stage', 'candidates', 'start')
+
+    def __init__(self, registry, stage, candidates):
+        self.registry = registry
+        self.stage = stage
+        self.candidates = candidates
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.record(self.stage, time.perf_counter_ns() - self.start, self.candidates)
+        return False
+
+    def set_candidates(self, n):
+        self.candidates = n
+
+class MetricsRegistry:
+    """Per-stage latency histograms, candidate counts, cache hit/miss counters and gauges."""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.candidates = {}
+            self.caches = {}
+            self.counters = {}
+            self.gauges = {}
+
+    def record(self, stage, elapsed_ns, candidates=None):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = LatencyHistogram()
+            histogram.record(elapsed_ns)
+            if candidates is not None:
+                self.candidates[stage] = self.candidates.get(stage, 0) + int(candidates)
+
+    def add_candidates(self, stage, n):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.candidates[stage] = self.candidates.get(stage, 0) + int(n)
+
+    def record_cache(self, cache, hit):
+        if not self.enabled:
+            return
+        with self._lock:
+            hits, misses = self.caches.get(cache, (0, 0))
+            self.caches[cache] = (hits + 1, misses) if hit else (hits, misses + 1)
+
+    def increment(self, counter, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def set_gauge(self, gauge, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[gauge] = float(value)
+
+    def snapshot(self):
+        """
+        JSON-serialisable view of all metrics.
+        Returns: dict with 'stages', 'caches', 'counters' and 'gauges'
+        """
+        with self._lock:
+            stages = {}
+            for stage, histogram in self.stages.items():
+                stages[stage] = {
+                    'count': histogram.count,
+                    'sum_ms': histogram.total / 1e6,
+                    'max_ms': histogram.max / 1e6,
+                    'candidates': self.candidates.get(stage, 0),
+                }
+                for q in QUANTILES:
+                    stages[stage][f"p{q * 100:g}_ms"] = histogram.percentile(q) / 1e6
+            caches = {}
+            for cache, (hits, misses) in self.caches.items():
+                total = hits + misses
+                caches[cache] = {'hits': hits, 'misses': misses,
+                                 'hit_rate': hits / total if total else 0.0}
+            return {'stages': stages, 'caches': caches, 'counters': dict(self.counters),
+                    'gauges': dict(self.gauges)}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix="matchmaking"):
+        """Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [f"# HELP {prefix}_stage_latency_seconds Latency of each pipeline stage",
+                 f"# TYPE {prefix}_stage_latency_seconds summary"]
+        for stage, stats in sorted(snapshot['stages'].items()):
+            for q in QUANTILES:
+                value = stats[f"p{q * 100:g}_ms"] / 1e3
+                lines.append(f'{prefix}_stage_latency_seconds{{stage="{stage}",quantile="{q:g}"}} {value:.9f}')
+            lines.append(f'{prefix}_stage_latency_seconds_sum{{stage="{stage}"}} {stats["sum_ms"] / 1e3:.9f}')
+            lines.append(f'{prefix}_stage_latency_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines += [f"# HELP {prefix}_stage_candidates_total Candidates processed by each stage",
+                  f"# TYPE {prefix}_stage_candidates_total counter"]
+        for stage, stats in sorted(snapshot['stages'].items()):
+            lines.append(f'{prefix}_stage_candidates_total{{stage="{stage}"}} {stats["candidates"]}')
+        lines += [f"# HELP {prefix}_cache_requests_total Cache lookups by result",
+                  f"# TYPE {prefix}_cache_requests_total counter"]
+        for cache, stats in sorted(snapshot['caches'].items()):
+            lines.append(f'{prefix}_cache_requests_total{{cache="{cache}",result="hit"}} {stats["hits"]}')
+            lines.append(f'{prefix}_cache_requests_total{{cache="{cache}",result="miss"}} {stats["misses"]}')
+        if snapshot['counters']:
+            lines += [f"# HELP {prefix}_events_total Pipeline event counters",
+                      f"# TYPE {prefix}_events_total counter"]
+            for counter, value in sorted(snapshot['counters'].items()):
+                lines.append(f'{prefix}_events_total{{event="{counter}"}} {value}')
+        for gauge, value in sorted(snapshot['gauges'].items()):
+            lines += [f"# TYPE {prefix}_{gauge} gauge", f"{prefix}_{gauge} {value:.6f}"]
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry used by span()/traced()
+metrics = MetricsRegistry()
+
+def enable():
+    metrics.enabled = True
+
+def disable():
+    metrics.enabled = False
+
+def span(stage, candidates=None):
+    """Context manager timing one pipeline stage; a shared no-op when instrumentation is disabled."""
+    if not metrics.enabled:
+        return _NOOP_SPAN
+    return _Span(metrics, stage, candidates)
+
+def traced(stage):
+    """Decorator recording the wrapped function's latency under `stage`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.record(stage, time.perf_counter_ns() - start)
+        return wrapper
+    return decorator
+
+def configure(config):
+    """Enable instrumentation if `instrumentation.enabled` is set in config."""
+    if config.get('instrumentation', {}).get('enabled', False):
+        enable()
+    return metrics
+
+def write_metrics(path):
+    """Write metrics to `path`: Prometheus text for *.prom/*.txt, JSON otherwise."""
+    content = metrics.to_prometheus() if path.endswith(('.prom', '.txt')) else metrics.to_json()
+    with open(path, 'w') as f:
+        f.write(content)
+    logger.info(f"Wrote metrics to {path}")
@@ -0,0 +1,399 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import logging
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from src import instrumentation
+from src.batch import check_profile, read_requests, result_record
+from src.instrumentation import LatencyHistogram, QUANTILES
+
+logger = logging.getLogger(__name__)
+
+MODES = ('closed', 'open')
+TARGETS = ('inproc', 'http')
+
+def load_profiles(path=None, store=None, n_profiles=1000, seed=0):
+    """
+    Viewer profiles to replay: a recorded JSONL file (one profile per line, invalid lines
+    skipped with a warning) or, without one, profiles sampled from the store.
+    Returns: list of profile dicts
+    """
+    if path is None:
+        from src.benchmark import sample_queries
+
+        return sample_queries(store, n_profiles, np.random.default_rng(seed))
+    profiles = []
+    skipped = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for _, line in read_requests(f):
+            try:
+                profile = json.loads(line)
+                check_profile(profile)
+                profiles.append(profile)
+            except (ValueError, TypeError):
+                skipped += 1
+    if skipped:
+        logger.warning(f"Skipped {skipped} invalid profiles in {path}")
+    return profiles
+
+def inproc_target(engine, top_k=None, time_budget_ms=None):
+    """Request function calling engine.recommend directly."""
+    def request(profile):
+        engine.recommend(profile, top_k, time_budget_ms)
+    return request
+
+def http_target(url, timeout=30.0):
+    """Request function POSTing the profile as JSON to `url`; non-2xx responses raise."""
+    def request(profile):
+        body = json.dumps(profile).encode('utf-8')
+        req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+    return request
+
+def make_server(engine, host='127.0.0.1', port=0):
+    """
+    Minimal local HTTP front end for the engine: POST /recommend with a JSON profile returns
+    the same record as batch mode (400 for invalid profiles). One thread per connection.
+    Returns: ThreadingHTTPServer (not yet serving)
+    """
+    class RecommendHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/recommend':
+                return self.reply(404, {'error': 'not found'})
+            try:
+                profile = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                if not isinstance(profile, dict):
+                    raise ValueError("Request body must be a JSON object")
+                check_profile(profile)
+            except ValueError as e:
+                return self.reply(400, {'error': str(e)})
+            try:
+                top = engine.recommend(profile)
+            except Exception as e:
+                logger.error(f"Recommendation failed: {e}")
+                return self.reply(500, {'error': 'recommendation failed'})
+            record = result_record(None, profile['userId'], top, None)
+            del record['line']
+            self.reply(200, record)
+
+        def reply(self, status, record):
+            body = json.dumps(record).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), RecommendHandler)
+    server.daemon_threads = True
+    return server
+
+def start_server(engine, host='127.0.0.1', port=0):
+    """
+    Serve the engine on a background thread.
+    Returns: server (call shutdown() when done), URL of its /recommend endpoint
+    """
+    server = make_server(engine, host, port)
+    threading.Thread(target=server.serve_forever, name="load-test-server", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/recommend"
+
+def rss_mb():
+    """Current resident set size of this process in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+class _Recorder:
+    """Latency histogram and outcome counts shared by the request threads."""
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.completed = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def call(self, target, profile, start_ns):
+        """Run one request; latency runs from `start_ns` (the scheduled arrival in open loop)."""
+        try:
+            target(profile)
+            failed = False
+        except Exception as e:
+            logger.debug(f"Request failed: {e}")
+            failed = True
+        elapsed = time.perf_counter_ns() - start_ns
+        with self._lock:
+            self.histogram.record(elapsed)
+            self.completed += 1
+            self.errors += failed
+
+class ResourceSampler(threading.Thread):
+    """Samples this process's CPU use (% of one core), RSS and completed requests every interval."""
+
+    def __init__(self, recorder, interval=1.0):
+        super().__init__(name="load-test-sampler", daemon=True)
+        self.recorder = recorder
+        self.interval = interval
+        self.timeline = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        start = last_wall = time.perf_counter()
+        last_cpu = time.process_time()
+        while not self._stop_event.wait(self.interval):
+            last_wall, last_cpu = self.sample(start, last_wall, last_cpu)
+        self.sample(start, last_wall, last_cpu)
+
+    def sample(self, start, last_wall, last_cpu):
+        wall, cpu = time.perf_counter(), time.process_time()
+        self.timeline.append({'t': round(wall - start, 3),
+                              'cpu_pct': 100.0 * (cpu - last_cpu) / max(wall - last_wall, 1e-9),
+                              'rss_mb': rss_mb(), 'completed': self.recorder.completed})
+        return wall, cpu
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.timeline
+
+def _closed_loop(target, profiles, recorder, concurrency, deadline, max_requests):
+    """`concurrency` clients, each sending its next request as soon as the previous one returns."""
+    issued = iter(range(max_requests)) if max_requests else itertools.count()
+    lock = threading.Lock()
+
+    def client():
+        while time.perf_counter() < deadline:
+            with lock:
+                i = next(issued, None)
+            if i is None:
+                return
+            recorder.call(target, profiles[i % len(profiles)], time.perf_counter_ns())
+
+    threads = [threading.Thread(target=client, name=f"load-test-client-{n}") for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def _open_loop(target, profiles, recorder, concurrency, rate, deadline, max_requests, seed):
+    """
+    Poisson arrivals at `rate` per second, independent of response times. Requests waiting for
+    a free worker count that wait in their latency, so a saturated server is not under-reported.
+    """
+    rng = random.Random(seed)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load-test-worker") as pool:
+        scheduled = time.perf_counter()
+        i = 0
+        while not max_requests or i < max_requests:
+            scheduled += rng.expovariate(rate)
+            if scheduled >= deadline:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            start_ns = time.perf_counter_ns() - max(int(-delay * 1e9), 0)
+            pool.submit(recorder.call, target, profiles[i % len(profiles)], start_ns)
+            i += 1
+
+def run_load(target, profiles, mode='closed', concurrency=4, rate=None, duration=None, max_requests=None,
+             sample_interval=1.0, seed=0):
+    """
+    Replay `profiles` (cycled) through `target` in a closed loop (`concurrency` clients back to
+    back) or an open loop (Poisson arrivals at `rate`/s served by `concurrency` workers), until
+    `duration` seconds or `max_requests` requests (one pass over the profiles if neither is set).
+    Returns: report dict (throughput, error rate, latency percentiles in ms, resource timeline)
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    if mode == 'open' and not rate:
+        raise ValueError("Open-loop mode needs an arrival rate")
+    if not profiles:
+        raise ValueError("No profiles to replay")
+    if duration is None and max_requests is None:
+        max_requests = len(profiles)
+    recorder = _Recorder()
+    sampler = ResourceSampler(recorder, sample_interval)
+    start = time.perf_counter()
+    deadline = start + duration if duration else float('inf')
+    sampler.start()
+    try:
+        if mode == 'closed':
+            _closed_loop(target, profiles, recorder, concurrency, deadline, max_requests)
+        else:
+            _open_loop(target, profiles, recorder, concurrency, rate, deadline, max_requests, seed)
+    finally:
+        timeline = sampler.stop()
+    seconds = time.perf_counter() - start
+
+    histogram = recorder.histogram
+    latency = {f"p{q * 100:g}": histogram.percentile(q) / 1e6 for q in QUANTILES}
+    latency['max'] = histogram.max / 1e6
+    latency['mean'] = histogram.total / max(histogram.count, 1) / 1e6
+    report = {
+        'mode': mode, 'concurrency': concurrency, 'rate': rate,
+        'requests': recorder.completed, 'errors': recorder.errors,
+        'error_rate': recorder.errors / max(recorder.completed, 1),
+        'seconds': seconds, 'throughput_rps': recorder.completed / seconds if seconds else 0.0,
+        'latency_ms': latency,
+        'cpu_pct_mean': float(np.mean([s['cpu_pct'] for s in timeline])) if timeline else 0.0,
+        'rss_mb_max': max((s['rss_mb'] for s in timeline), default=0.0),
+        'timeline': timeline,
+    }
+    logger.info(f"{mode} loop: {report['requests']} requests ({report['errors']} errors) in {seconds:.2f}s, "
+                f"{report['throughput_rps']:.1f} requests/s, p99 {latency['p99']:.1f} ms")
+    return report
+
+def compare_to_slo(report, slo):
+    """
+    Check a load-test report against an SLO document with any of: min_throughput_rps,
+    max_error_rate, max_rss_mb, max_latency_ms {percentile: ms} and
+    max_stage_latency_ms {stage: {percentile: ms}} (needs the report's 'stages').
+    Returns: list of human-readable violations
+    """
+    violations = []
+    if 'min_throughput_rps' in slo and report['throughput_rps'] < slo['min_throughput_rps']:
+        violations.append(f"throughput {report['throughput_rps']:.1f} rps < {slo['min_throughput_rps']} rps")
+    if 'max_error_rate' in slo and report['error_rate'] > slo['max_error_rate']:
+        violations.append(f"error rate {report['error_rate']:.2%} > {slo['max_error_rate']:.2%}")
+    if 'max_rss_mb' in slo and report['rss_mb_max'] > slo['max_rss_mb']:
+        violations.append(f"RSS {report['rss_mb_max']:.0f} MB > {slo['max_rss_mb']} MB")
+    for percentile, limit in slo.get('max_latency_ms', {}).items():
+        value = report['latency_ms'].get(percentile)
+        if value is not None and value > limit:
+            violations.append(f"latency {percentile} {value:.1f} ms > {limit} ms")
+    for stage, limits in slo.get('max_stage_latency_ms', {}).items():
+        stats = report.get('stages', {}).get(stage)
+        if not stats:
+            continue
+        for percentile, limit in limits.items():
+            value = stats.get(f"{percentile}_ms")
+            if value is not None and value > limit:
+                violations.append(f"{stage} {percentile} {value:.1f} ms > {limit} ms")
+    return violations
+
+def load_engine(config, data_dir=None):
+    """
+    Engine built the way the CLI builds it (saved model if present, otherwise trained),
+    without a recommendation sink so the replay does not write recommendations.
+    Returns: MatchEngine, ProfileStore
+    """
+    from src.data_loader import load_data
+    from src.preprocessing import preprocess_data
+    from src.profile_store import ProfileStore
+    from src.recommender import train_model, load_model_and_encoders
+    from src.pipeline import MatchEngine, engine_options
+    from src.near_duplicates import suppressed_profile_ids
+    from src.cold_start import load_cold_start
+    from src.request_profiler import create_profiler
+    from src.shadow_scoring import create_shadow
+
+    (profiles, liked, matched, blocked_ids, declined_ids,
+     deleted_ids, reported_ids) = load_data(data_dir=data_dir or config['data']['data_dir'])
+    if profiles is None:
+        raise ValueError("Failed to load data")
+    suppressed_ids = suppressed_profile_ids(profiles, config)
+    store = ProfileStore.from_profiles(profiles, config['preprocessing']['categorical_columns'],
+                                       config['preprocessing']['keywords'])
+    (_, interaction_matrix, X_features, user_to_idx, profile_to_idx,
+     label_encoders, tfidf) = preprocess_data(profiles, liked, matched)
+    model, scaler, _, _, _, _ = load_model_and_encoders(config['model']['models_dir'])
+    if model is None or scaler is None:
+        model, scaler = train_model(interaction_matrix, X_features)
+    engine = MatchEngine(store, X_features, model, scaler, label_encoders, tfidf, user_to_idx,
+                         profile_to_idx, blocked_ids, declined_ids, deleted_ids, reported_ids,
+                         interaction_matrix=interaction_matrix, suppressed_ids=suppressed_ids,
+                         cold_start=load_cold_start(config, store), profiler=create_profiler(config),
+                         shadow=create_shadow(config, scaler, tfidf, label_encoders, user_to_idx, profile_to_idx),
+                         **engine_options(config))
+    return engine, store
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay user profiles through the recommend path under load")
+    parser.add_argument("--data_dir", default=None, help="Dataset directory (defaults to config data.data_dir)")
+    parser.add_argument("--profiles", default=None,
+                        help="JSONL file of recorded profiles (defaults to profiles sampled from the store)")
+    parser.add_argument("--n_profiles", type=int, default=1000, help="Sampled profiles when --profiles is not given")
+    parser.add_argument("--target", default="inproc", choices=TARGETS,
+                        help="Call the engine in-process or over HTTP")
+    parser.add_argument("--url", default=None,
+                        help="HTTP target URL (defaults to a local server started in this process)")
+    parser.add_argument("--mode", default="closed", choices=MODES, help="Closed loop or open (Poisson) loop")
+    parser.add_argument("--concurrency", type=int, default=4, help="Clients (closed) or workers (open)")
+    parser.add_argument("--rate", type=float, default=None, help="Open loop: arrivals per second")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests")
+    parser.add_argument("--sample_interval", type=float, default=1.0, help="Seconds between CPU/RSS samples")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for profile sampling and arrivals")
+    parser.add_argument("--slo", default="benchmarks/slo.json", help="SLO JSON file to check the run against")
+    parser.add_argument("--output", default=None, help="Write the report to a JSON file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from src.data_loader import load_config
+
+    config = load_config()
+    server = None
+    engine = store = None
+    if args.target == 'inproc' or not args.url or not args.profiles:
+        engine, store = load_engine(config, args.data_dir)
+    profiles = load_profiles(args.profiles, store, args.n_profiles, args.seed)
+    if args.target == 'inproc':
+        target = inproc_target(engine)
+    else:
+        url = args.url
+        if url is None:
+            server, url = start_server(engine)
+            logger.info(f"Serving the engine at {url}")
+        target = http_target(url)
+
+    # Per-stage latencies are only visible when the engine runs in this process
+    in_process = args.target == 'inproc' or server is not None
+    if in_process:
+        instrumentation.metrics.reset()
+        instrumentation.enable()
+    try:
+        report = run_load(target, profiles, args.mode, args.concurrency, args.rate, args.duration, args.requests,
+                          args.sample_interval, args.seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+    if in_process:
+        report['stages'] = instrumentation.metrics.snapshot()['stages']
+        instrumentation.disable()
+    report['target'] = args.target
+    print(json.dumps({key: value for key, value in report.items() if key != 'timeline'}, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if not os.path.exists(args.slo):
+        logger.info(f"No SLO file at {args.slo}; skipping the SLO check")
+        return 0
+    with open(args.slo) as f:
+        slo = json.load(f)
+    violations = compare_to_slo(report, slo)
+    for violation in violations:
+        print(f"SLO VIOLATION {violation}")
+    return 1 if violations else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from src.parallel import fork_map
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+def normalise_texts(texts):
+    """Lowercase, punctuation-free, whitespace-collapsed bios ('' for missing ones)."""
+    texts = pd.Series(texts, dtype=object).fillna('').astype(str).str.lower()
+    return texts.str.replace(r'[\W_]+', ' ', regex=True).str.strip()
+
+def shingle_hashes(texts, shingle_size=5):
+    """
+    32-bit hashes of every character k-shingle, computed for a whole chunk at once: the
+    encoded texts are concatenated and a polynomial hash is taken over every window, keeping
+    only windows inside one text. Texts shorter than k count as a single shingle.
+    Returns: hashes, per-text shingle counts (0 for empty texts)
+    """
+    encoded = [text.encode('utf-8').ljust(shingle_size) if text else b'' for text in texts]
+    lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+    counts = np.where(lengths > 0, lengths - shingle_size + 1, 0)
+    if not counts.sum():
+        return np.zeros(0, dtype=np.uint64), counts
+    buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+    powers = np.uint64(31) ** np.arange(shingle_size, dtype=np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(buffer, shingle_size)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    starts = np.repeat(offsets - first, counts) + np.arange(counts.sum())
+    hashes = (windows[starts] * powers).sum(axis=1, dtype=np.uint64)
+    return (hashes ^ (hashes >> np.uint64(32))) & _MAX_HASH, counts
+
+def minhash_signatures(texts, num_perm=128, shingle_size=5, seed=1):
+    """
+    MinHash signatures of normalised texts: for each of `num_perm` universal hash functions
+    (a * x + b mod p), the minimum over the text's shingles, via one reduceat per function.
+    Empty texts get an all-max signature and are never clustered.
+    Returns: uint32 array of shape (len(texts), num_perm)
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    hashes, counts = shingle_hashes(texts, shingle_size)
+    signatures = np.full((len(counts), num_perm), 0xFFFFFFFF, dtype=np.uint32)
+    present = counts > 0
+    if not present.any():
+        return signatures
+    segments = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+    for i in range(num_perm):
+        permuted = ((a[i] * hashes + b[i]) % _MERSENNE_PRIME) & _MAX_HASH
+        signatures[present, i] = np.minimum.reduceat(permuted, segments)
+    return signatures
+
+def _signature_chunk(params, texts):
+    num_perm, shingle_size, seed = params
+    return minhash_signatures(texts, num_perm, shingle_size, seed)
+
+class NearDuplicateIndex:
+    """
+    MinHash + banded LSH index over profile bios. Signatures are computed once per profile and
+    kept with a digest of the normalised bio, so adding profiles only hashes new or edited bios;
+    bucketing is a vectorised sort per band
+    over all signatures, linear-ish in the number of profiles rather than quadratic.
+    """
+
+    def __init__(self, num_perm=128, bands=16, shingle_size=5, threshold=0.8, seed=1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.seed = seed
+        self.ids = np.empty(0, dtype=object)
+        self.signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self.digests = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, ids, texts, workers=1, chunk_size=5000):
+        """
+        Hash the bios of new profiles and of indexed profiles whose bio changed (their signature
+        is replaced in place); ids indexed with the same bio are skipped. Hashing runs in
+        parallel chunks.
+        Returns: number of profiles added or re-hashed
+        """
+        ids = np.asarray(ids, dtype=object)
+        texts = normalise_texts(texts).to_numpy()
+        digests = pd.util.hash_array(texts)
+        positions = pd.Index(self.ids).get_indexer(ids) if len(self.ids) else np.full(len(ids), -1)
+        known = positions >= 0
+        changed = known.copy()
+        changed[known] = self.digests[positions[known]] != digests[known]
+        stale = changed | ~known
+        if not stale.any():
+            return 0
+        signatures = self.compute_signatures(texts[stale], workers, chunk_size)
+        replaced = changed[stale]
+        self.signatures[positions[changed]] = signatures[replaced]
+        self.digests[positions[changed]] = digests[changed]
+        new = ~known
+        self.ids = np.concatenate([self.ids, ids[new]])
+        self.signatures = np.vstack([self.signatures, signatures[~replaced]])
+        self.digests = np.concatenate([self.digests, digests[new]])
+        logger.info(f"Added {int(new.sum())} and re-hashed {int(changed.sum())} profiles in the near-duplicate "
+                    f"index ({len(self.ids)} total)")
+        return int(stale.sum())
+
+    def compute_signatures(self, texts, workers=1, chunk_size=5000):
+        """MinHash signatures of normalised texts, in parallel chunks when workers > 1."""
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        params = (self.num_perm, self.shingle_size, self.seed)
+        return np.vstack(list(fork_map(_signature_chunk, chunks, params, workers)))
+
+    def band_keys(self, signatures=None):
+        """One 64-bit key per (profile, band): a fold of the band's signature rows."""
+        signatures = self.signatures if signatures is None else signatures
+        rows = self.num_perm // self.bands
+        banded = signatures.reshape(len(signatures), self.bands, rows).astype(np.uint64)
+        keys = np.zeros(banded.shape[:2], dtype=np.uint64)
+        for r in range(rows):
+            keys = keys * np.uint64(1000003) ^ banded[:, :, r]
+        return keys
+
+    def candidate_pairs(self, rows=None):
+        """
+        Pairs sharing a bucket in any band whose estimated Jaccard similarity (share of equal
+        signature entries) reaches the threshold. Within a bucket, neighbours in sorted order
+        are compared, which links the bucket without enumerating all of its pairs. With `rows`,
+        only those index rows take part.
+        Returns: (left, right) position arrays (into `rows` when given)
+        """
+        signatures = self.signatures if rows is None else self.signatures[rows]
+        valid = signatures[:, 0] != 0xFFFFFFFF
+        keys = self.band_keys(signatures)
+        left, right = [], []
+        for band in range(self.bands):
+            order = np.argsort(keys[:, band], kind='stable')
+            ordered = keys[order, band]
+            same = ordered[1:] == ordered[:-1]
+            left.append(order[:-1][same])
+            right.append(order[1:][same])
+        left, right = np.concatenate(left), np.concatenate(right)
+        pairs = np.unique(np.stack([np.minimum(left, right), np.maximum(left, right)], axis=1), axis=0)
+        if not len(pairs):
+            return pairs[:, 0], pairs[:, 1]
+        pairs = pairs[valid[pairs[:, 0]] & valid[pairs[:, 1]]]
+        similarity = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+        pairs = pairs[similarity >= self.threshold]
+        return pairs[:, 0], pairs[:, 1]
+
+    def clusters(self, ids=None):
+        """
+        Near-duplicate clusters (two or more profiles) as lists of ids, in index order. With
+        `ids`, profiles outside it (e.g. deleted since they were indexed) are left out before
+        clustering, so they neither link nor enlarge clusters.
+        """
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        rows = np.arange(len(self.ids)) if ids is None else np.flatnonzero(pd.Index(self.ids).isin(ids))
+        n = len(rows)
+        if not n:
+            return []
+        left, right = self.candidate_pairs(rows)
+        graph = coo_matrix((np.ones(len(left)), (left, right)), shape=(n, n))
+        _, labels = connected_components(graph, directed=False)
+        sizes = np.bincount(labels)
+        grouped = pd.Series(rows)[sizes[labels] > 1].groupby(labels[sizes[labels] > 1])
+        return [self.ids[members.to_numpy()].tolist() for _, members in grouped]
+
+    def suppression_list(self, spam_cluster_size=5, ids=None):
+        """
+        Profile ids to exclude from recommendations: within each near-duplicate cluster the
+        earliest indexed profile is kept, except that clusters of `spam_cluster_size` or more
+        copies of one bio are suppressed entirely. `ids` restricts clustering as in clusters().
+        """
+        suppressed = []
+        for cluster in self.clusters(ids):
+            suppressed.extend(cluster if len(cluster) >= spam_cluster_size else cluster[1:])
+        return suppressed
+
+    def save(self, path):
+        """Persist ids, signatures and bio digests (settings included) to an .npz file, atomically."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".tmp", 'wb') as f:
+            np.savez(f, ids=self.ids.astype(str), signatures=self.signatures, digests=self.digests,
+                     settings=np.array([self.num_perm, self.bands, self.shingle_size, self.seed]),
+                     threshold=np.array(self.threshold))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            num_perm, bands, shingle_size, seed = (int(v) for v in data['settings'])
+            index = cls(num_perm, bands, shingle_size, float(data['threshold']), seed)
+            index.ids = data['ids'].astype(object)
+            index.signatures = data['signatures']
+            # Indexes saved without digests re-hash every bio once on the next add
+            index.digests = data['digests'] if 'digests' in data.files else np.zeros(len(index.ids), dtype=np.uint64)
+        return index
+
+def suppressed_profile_ids(profiles, config, workers=None):
+    """
+    Suppression list for the profiles per the `near_duplicates` config section. With an
+    index_file, the saved index is loaded, updated with new or edited profiles and saved back.
+    `workers` (default: the section's `workers`) hashes new bios in parallel chunks.
+    Returns: list of profile ids (empty when disabled)
+    """
+    settings = config.get('near_duplicates', {})
+    if not settings.get('enabled', False):
+        return []
+    workers = workers or settings.get('workers', 1)
+    index_file = settings.get('index_file')
+    index = None
+    if index_file and os.path.exists(index_file):
+        index = NearDuplicateIndex.load(index_file)
+        if (index.num_perm, index.bands, index.shingle_size) != (settings.get('num_perm', 128),
+                                                                 settings.get('bands', 16),
+                                                                 settings.get('shingle_size', 5)):
+            logger.warning("Near-duplicate settings changed; rebuilding the index")
+            index = None
+    if index is None:
+        index = NearDuplicateIndex(settings.get('num_perm', 128), settings.get('bands', 16),
+                                   settings.get('shingle_size', 5), settings.get('threshold', 0.8))
+    index.threshold = settings.get('threshold', 0.8)
+    if index.add(profiles['__id__'].astype(str).to_numpy(), profiles['aboutMe'], workers=workers) and index_file:
+        index.save(index_file)
+    # Cluster only the currently loaded profiles (the index may remember deleted ones), so a
+    # deleted original hands its place to the next copy; ids keep their original type
+    current = dict(zip(profiles['__id__'].astype(str), profiles['__id__']))
+    suppressed = [current[pid] for pid in index.suppression_list(settings.get('spam_cluster_size', 5),
+                                                                 ids=list(current))]
+    logger.info(f"Suppressing {len(suppressed)} near-duplicate profiles")
+    return suppressed
@@ -0,0 +1,43 @@
+import itertools
+import multiprocessing
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# State of the running fork_map calls, inherited by forked workers (copy-on-write, never pickled)
+_shared = {}
+_tokens = itertools.count()
+
+def _call(token, fn, item):
+    return fn(_shared[token], item)
+
+def fork_map(fn, items, shared=None, workers=1):
+    """
+    Lazily map fn(shared, item) over items, in input order. With workers > 1 the items run across a
+    pool of forked processes that inherit `shared` rather than receiving a pickled copy (fn and each
+    item are pickled). At most 2 * workers items are in flight, so `items` may be an unbounded
+    iterator. Runs in this process when workers <= 1, there is only one item or fork is unavailable.
+    Returns: generator of fn results
+    """
+    if hasattr(items, '__len__') and len(items) < 2:
+        workers = 1
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        for item in items:
+            yield fn(shared, item)
+        return
+
+    token = next(_tokens)
+    _shared[token] = shared
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            pending = deque()
+            for item in items:
+                pending.append(pool.submit(_call, token, fn, item))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    finally:
+        _shared.pop(token, None)
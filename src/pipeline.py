@@ -0,0 +1,513 @@
+import hashlib
+import logging
+import time
+import numpy as np
+import pandas as pd
+from src.agent import apply_rules_compact, encode_user_profile, validate_user_profile, add_match_flags, age_window
+from src.recommender import (predict_compatibility, predict_reciprocal_compatibility, blend_final_score,
+                             reference_users, fitted_version)
+from src.diversity import mmr_rerank
+from src.result_cache import ResultCache
+from src.text_features import FrozenVocabulary
+from src.instrumentation import metrics, span
+from src.request_profiler import profile_request, note_candidates
+
+logger = logging.getLogger(__name__)
+
+def engine_options(config):
+    """MatchEngine keyword arguments from the `scoring`, `diversity` and `serving` config sections."""
+    scoring = config.get('scoring', {})
+    diversity = config.get('diversity', {})
+    serving = config.get('serving', {})
+    return {
+        'reciprocal': scoring.get('reciprocal', False),
+        'combine': scoring.get('combine', 'harmonic'),
+        'diversity_shortlist': diversity.get('shortlist_size', 0),
+        'diversity_lambda': diversity.get('lambda', 0.7),
+        'time_budget_ms': serving.get('time_budget_ms'),
+        'score_chunk_size': serving.get('score_chunk_size', 2000),
+    }
+
+def create_result_cache(config):
+    """Top-K result cache from the `result_cache` config section, or None when disabled."""
+    settings = config.get('result_cache', {})
+    if not settings.get('enabled', False):
+        return None
+    return ResultCache(max_bytes=int(settings.get('max_mb', 32) * 1024 * 1024))
+
+def exclusion_version(excluded_ids):
+    """Content digest of an exclusion set; unchanged sets keep their version."""
+    digest = hashlib.sha1()
+    for profile_id in sorted(map(str, excluded_ids)):
+        digest.update(profile_id.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()[:12]
+
+class QuerySession:
+    """
+    Interactive state for one user session (MatchEngine.recommend_incremental): the last
+    sex/seeking candidate set, before the age window, and the ML scores computed for it so far
+    (NaN until a candidate first enters the window).
+    """
+
+    def __init__(self):
+        self.engine = None
+        self.key = None
+        self.base = None
+        self.scores = {}
+
+    def reset(self, engine, key, base):
+        self.engine = engine
+        self.key = key
+        self.base = base
+        self.scores = {'ml_score': np.full(len(base), np.nan)}
+
+    def store_scores(self, scored):
+        """Keep the ML score columns of the rows that were ML-scored."""
+        if 'ml_scored' in scored:
+            scored = scored[scored['ml_scored'].to_numpy(dtype=bool)]
+        offsets = self.base.index.get_indexer(scored.index)
+        if 'ml_score' not in scored:
+            # predict_compatibility leaves candidates unknown to the model unscored
+            scored = scored.assign(ml_score=0.0)
+        for col in scored.columns:
+            if col.startswith('ml_score') and col != 'ml_scored':
+                self.scores.setdefault(col, np.full(len(self.base), np.nan))[offsets] = scored[col].to_numpy()
+
+class MatchEngine:
+    """
+    Loaded serving state plus the per-request recommend pipeline shared by the CLI and Streamlit app.
+    Stages: apply_rules -> (encode_user_profile, reciprocal only) -> predict_compatibility -> top_k
+    (-> rerank) -> persistence. Viewers unknown to the model are served from `cold_start` tables
+    (src.cold_start) when their segment was materialised.
+    """
+
+    def __init__(self, store, X_features, model, scaler, label_encoders, tfidf,
+                 user_to_idx, profile_to_idx, blocked_ids=(), declined_ids=(), deleted_ids=(),
+                 reported_ids=(), sink=None, top_k=5, interaction_matrix=None, reciprocal=False,
+                 combine='harmonic', diversity_shortlist=0, diversity_lambda=0.7,
+                 diversity_columns=('country', 'language', 'relationshipGoals'), time_budget_ms=None,
+                 score_chunk_size=2000, result_cache=None, model_version=None, feature_rows=None,
+                 suppressed_ids=(), cold_start=None, n_users=None, profiler=None, shadow=None):
+        self.store = store
+        self.X_features = X_features
+        self.model = model
+        self.scaler = scaler
+        self.label_encoders = label_encoders
+        self.tfidf = tfidf
+        # Array-backed copy of the vocabulary for single-document transforms
+        self.text_encoder = FrozenVocabulary.from_vectorizer(tfidf) or tfidf
+        self.user_to_idx = user_to_idx
+        self.profile_to_idx = profile_to_idx
+        # Users averaged over to score unknown viewers; n_users is the full model's count for shards
+        self.fallback_users = reference_users(n_users if n_users is not None else len(user_to_idx))
+        self.cold_start = cold_start
+        # Opt-in sampling profiler wrapped around each request (src.request_profiler)
+        self.profiler = profiler
+        # Candidate model version scoring the same batches in the background (src.shadow_scoring)
+        self.shadow = shadow
+        self.result_cache = result_cache
+        # id -> store row index, built on the first add_exclusions
+        self.store_rows = None
+        # Part of every result-cache key; without an explicit version it is derived from the
+        # fitted model itself, which is only worth hashing when there is a cache to key
+        if model_version is None and result_cache is not None:
+            model_version = fitted_version(model, scaler)
+        self.model_version = model_version
+        self.set_exclusions(blocked_ids, declined_ids, deleted_ids, reported_ids, suppressed_ids)
+        # Precomputed per store row so requests never hash ids: model item index
+        self.item_index = store.table['__id__'].map(profile_to_idx).fillna(-1).to_numpy(dtype=np.int64)
+        # Row of X_features per store row; differs from item_index only for partial (shard) matrices
+        self.feature_row = self.item_index if feature_rows is None else np.asarray(feature_rows, dtype=np.int64)
+        self.sink = sink
+        self.top_k = top_k
+        self.reciprocal = reciprocal
+        self.combine = combine
+        # MMR re-ranking of the top `diversity_shortlist` rows; 0 disables it
+        self.diversity_shortlist = diversity_shortlist
+        self.diversity_lambda = diversity_lambda
+        self.diversity_columns = [c for c in diversity_columns if c in store.categories]
+        self.text_offset = X_features.shape[1] - len(tfidf.vocabulary_)
+        # Per-request deadline (None = unbounded) and candidates scored between deadline checks
+        self.time_budget_ms = time_budget_ms
+        self.score_chunk_size = score_chunk_size
+        if reciprocal:
+            # Reverse direction: each candidate acts as the user, the viewer as the item
+            self.user_rows = pd.Index(store.table['userId'])
+            # -1 for candidates who never acted as users (scored over fallback_users)
+            self.candidate_user_index = store.table['userId'].map(user_to_idx).fillna(-1).to_numpy(dtype=np.int64)
+            # Items averaged over for viewers without a stored profile, spread over the known items
+            known_items = np.sort(self.item_index[self.item_index >= 0])
+            self.fallback_items = known_items[reference_users(len(known_items))] if len(known_items) else None
+            # Transposed interactions: row = profile, columns = users who liked/matched it
+            self.interactions_by_item = interaction_matrix.T.tocsr() if interaction_matrix is not None else None
+
+    def set_exclusions(self, blocked_ids=(), declined_ids=(), deleted_ids=(), reported_ids=(), suppressed_ids=()):
+        """
+        Replace the exclusion sets (suppressed_ids: near-duplicate/spam profiles, see src.near_duplicates);
+        cached results are invalidated only if the set changed.
+        """
+        self.excluded_ids = set(blocked_ids).union(declined_ids, deleted_ids, reported_ids, suppressed_ids)
+        # Precomputed per store row so requests never hash ids
+        self.excluded_mask = self.store.table['__id__'].isin(self.excluded_ids).to_numpy()
+        self.exclusion_version = exclusion_version(self.excluded_ids) if self.result_cache is not None else None
+        self.exclusion_generation = getattr(self, 'exclusion_generation', -1) + 1
+
+    def add_exclusions(self, profile_ids):
+        """
+        Exclude more profiles (e.g. from the event log) without rebuilding the whole mask: only
+        their rows are flipped. The mask and set are replaced, never mutated, so concurrent
+        requests see either the old or the new exclusions.
+        Returns: number of newly excluded ids
+        """
+        new = set(profile_ids) - self.excluded_ids
+        if not new:
+            return 0
+        if self.store_rows is None:
+            self.store_rows = pd.Index(self.store.table['__id__'])
+        rows = self.store_rows.get_indexer_for(list(new))
+        mask = self.excluded_mask.copy()
+        mask[rows[rows >= 0]] = True
+        self.excluded_ids = self.excluded_ids | new
+        self.excluded_mask = mask
+        if self.result_cache is not None:
+            # Chained so a batch costs O(batch), not a re-hash of the whole set
+            self.exclusion_version = exclusion_version(new | {self.exclusion_version})
+        self.exclusion_generation += 1
+        return len(new)
+
+    def add_interactions(self, interaction_matrix):
+        """
+        Fold new users x profiles interactions into the reverse-interaction floor of reciprocal
+        scoring (other modes do not read interactions while serving).
+        """
+        if not self.reciprocal or self.interactions_by_item is None or not interaction_matrix.nnz:
+            return
+        self.interactions_by_item = (self.interactions_by_item + interaction_matrix.T).tocsr()
+        # Reverse scores change: start interactive sessions afresh
+        self.exclusion_generation += 1
+        if self.result_cache is not None:
+            self.result_cache.clear()
+
+    def normalise_profile(self, user_profile):
+        """Canonical copy of a request: stored category labels, integer age, collapsed bio whitespace."""
+        profile = dict(user_profile)
+        for col in ('sex', 'seeking', 'country', 'language', 'relationshipGoals'):
+            if profile.get(col):
+                profile[col] = self.store.canonical_value(col, profile[col])
+        if profile.get('age'):
+            profile['age'] = int(profile['age'])
+        profile['aboutMe'] = ' '.join(str(profile.get('aboutMe', '')).split())
+        return profile
+
+    def cache_key(self, profile, top_k):
+        """
+        Result cache key for a normalised profile. Only what changes the result is included:
+        category codes (unseen values share -1), age, the viewer's model user index (every
+        viewer unknown to the model shares -1), and in reciprocal mode the viewer's own profile and bio.
+        """
+        codes = tuple(self.store.code_for(col, profile.get(col, 'unknown'))
+                      for col in ('sex', 'seeking', 'country', 'language', 'relationshipGoals'))
+        viewer = (self.user_to_idx.get(profile['userId'], -1),)
+        if self.reciprocal:
+            viewer += (int(self.user_rows.get_indexer([profile['userId']])[0]), profile['aboutMe'])
+        options = (self.reciprocal, self.combine, self.diversity_shortlist, self.diversity_lambda)
+        return (codes, bool(profile.get('sex') and profile.get('seeking')), profile.get('age') or 0,
+                viewer, top_k, options, self.model_version, self.exclusion_version)
+
+    def filter_candidates(self, user_profile):
+        """Rule-based candidate set for a viewer, as rows of the profile store."""
+        filtered = apply_rules_compact(self.store, user_profile, [], [], [], [],
+                                       excluded_mask=self.excluded_mask)
+        metrics.add_candidates('apply_rules', len(filtered))
+        note_candidates(len(filtered))
+        return filtered
+
+    def score_candidates(self, user_profile, filtered, encoded=None):
+        """ML + rule blend for the filtered candidates."""
+        if self.reciprocal:
+            if encoded is None:
+                encoded = encode_user_profile(user_profile, self.label_encoders, self.text_encoder)
+            return self.score_reciprocal(user_profile, filtered, encoded)
+        scored = predict_compatibility(self.model, self.scaler, user_profile['userId'], filtered,
+                                       self.X_features, self.user_to_idx, self.profile_to_idx,
+                                       item_indices=self.item_index[filtered.index.to_numpy()],
+                                       feature_rows=self.feature_row[filtered.index.to_numpy()],
+                                       fallback_users=self.fallback_users, shadow=self.shadow)
+        if user_profile['userId'] not in self.user_to_idx:
+            metrics.increment('unknown_viewer_scored')
+        metrics.add_candidates('predict_compatibility', len(filtered))
+        return scored
+
+    def score_within_deadline(self, user_profile, filtered, deadline):
+        """
+        Score candidates in chunks, best cheap prior (rule matches, then keyword score) first,
+        checking the deadline before each chunk. Candidates left when it passes keep their
+        rule-only score (ml_score 0).
+        Returns: scored frame with an ml_scored column, number of candidates ML-scored
+        """
+        prior = (filtered['country_match'].to_numpy(dtype=np.float64) +
+                 filtered['language_match'].to_numpy(dtype=np.float64) +
+                 filtered['goal_match'].to_numpy(dtype=np.float64) +
+                 filtered['keyword_score'].to_numpy(dtype=np.float64) * 0.5)
+        order = np.argsort(-prior, kind='stable')
+        encoded = None
+        if self.reciprocal:
+            encoded = encode_user_profile(user_profile, self.label_encoders, self.text_encoder)
+        chunks = []
+        done = 0
+        while done < len(order) and time.perf_counter() < deadline:
+            rows = order[done:done + self.score_chunk_size]
+            chunks.append(self.score_candidates(user_profile, filtered.iloc[rows].copy(), encoded))
+            done += len(rows)
+        rest = filtered.iloc[order[done:]].copy()
+        rest['ml_score'] = 0.0
+        rest = blend_final_score(rest)
+        rest['ml_scored'] = False
+        for chunk in chunks:
+            chunk['ml_scored'] = True
+        scored = pd.concat(chunks + [rest])
+        ml_columns = [c for c in scored.columns if c.startswith('ml_score_')]
+        scored[ml_columns] = scored[ml_columns].fillna(0.0)
+        return scored, done
+
+    def viewer_item(self, user_profile, encoded):
+        """
+        The viewer as a model item: their own profile's features if they have one in the
+        store, otherwise the encoded request reordered to the X_features column layout.
+        Returns: item index (-1 if not a known profile), feature row
+        """
+        position = self.user_rows.get_indexer([user_profile['userId']])[0]
+        if position >= 0 and self.item_index[position] >= 0:
+            item = self.item_index[position]
+            return item, self.X_features[self.feature_row[position]].toarray().ravel()
+        # encode_user_profile puts the five categorical codes before age
+        return -1, np.concatenate([encoded[5:6], encoded[:5], encoded[6:]])
+
+    def score_reciprocal(self, user_profile, filtered, encoded):
+        """Two-sided score: viewer->candidate and candidate->viewer in one batched predict."""
+        viewer_item, viewer_features = self.viewer_item(user_profile, encoded)
+        reverse_interactions = None
+        if viewer_item >= 0 and self.interactions_by_item is not None:
+            reverse_interactions = self.interactions_by_item[viewer_item]
+        positions = filtered.index.to_numpy()
+        user_idx = self.user_to_idx.get(user_profile['userId'], -1)
+        if user_idx < 0:
+            metrics.increment('unknown_viewer_scored')
+        scored = predict_reciprocal_compatibility(
+            self.model, self.scaler, user_idx, viewer_item,
+            viewer_features, filtered, self.X_features, self.item_index[positions],
+            self.candidate_user_index[positions], reverse_interactions, self.combine,
+            feature_rows=self.feature_row[positions], fallback_users=self.fallback_users,
+            fallback_items=self.fallback_items, shadow=self.shadow)
+        metrics.add_candidates('predict_compatibility', 2 * len(filtered))
+        return scored
+
+    def select_top_k(self, scored, top_k=None):
+        """
+        Highest final_score rows, with string columns resolved for display.
+        With a diversity shortlist, the top rows are re-ranked by MMR and returned in selection order.
+        """
+        top_k = top_k or self.top_k
+        with span('top_k', len(scored)):
+            if self.diversity_shortlist > top_k:
+                top = self.rerank(scored.nlargest(self.diversity_shortlist, 'final_score'), top_k)
+            else:
+                top = scored.nlargest(top_k, 'final_score')
+            return self.store.resolve(top)
+
+    def shortlist_features(self, shortlist):
+        """TF-IDF rows (zero for profiles unknown to the model) and category codes of shortlist rows."""
+        positions = shortlist.index.to_numpy()
+        items = self.item_index[positions]
+        text_rows = self.X_features[np.maximum(self.feature_row[positions], 0)].tocsr()[:, self.text_offset:]
+        if (items < 0).any():
+            text_rows = text_rows.multiply((items >= 0)[:, None]).tocsr()
+        codes = shortlist[self.diversity_columns].to_numpy()
+        return text_rows, codes
+
+    def rerank(self, shortlist, top_k):
+        """Maximal Marginal Relevance over the shortlist."""
+        with span('rerank', len(shortlist)):
+            text_rows, codes = self.shortlist_features(shortlist)
+            order = mmr_rerank(shortlist['final_score'].to_numpy(), text_rows, codes, top_k,
+                               self.diversity_lambda)
+            return shortlist.iloc[order]
+
+    def persist(self, user_id, top_matches):
+        """Hand the top matches to the recommendation log sink, if one is attached."""
+        if self.sink is None:
+            return
+        with span('persistence', len(top_matches)):
+            self.sink.submit(user_id, top_matches)
+
+    def recommend(self, user_profile, top_k=None, time_budget_ms=None):
+        """
+        Run the full recommend pipeline for one viewer, through the result cache if one is attached.
+        With a time budget, scoring stops at the deadline and the rest fall back to rule-only
+        scores; `top_matches.attrs` then has partial=True and the scored_fraction.
+        Partial results are never cached.
+        Returns: top matches DataFrame (empty if no candidate passes the rules)
+        """
+        top_k = top_k or self.top_k
+        time_budget_ms = time_budget_ms if time_budget_ms is not None else self.time_budget_ms
+        with profile_request(self.profiler):
+            if self.result_cache is None:
+                top_matches = self.compute(user_profile, top_k, time_budget_ms)
+            else:
+                profile = self.normalise_profile(user_profile)
+                top_matches = self.result_cache.get_or_compute(
+                    self.cache_key(profile, top_k), lambda: self.compute(profile, top_k, time_budget_ms),
+                    cacheable=lambda result: not result.attrs.get('partial', False))
+            if not top_matches.empty:
+                self.persist(user_profile['userId'], top_matches)
+        return top_matches
+
+    def session_key(self, user_profile):
+        """
+        What the session's candidate set and ML scores depend on: the viewer's user index, the
+        sex/seeking codes and the exclusions. In reciprocal mode a viewer without a stored profile
+        is scored as an item from the whole request, so every field is part of the key.
+        """
+        viewer = (user_profile['userId'],)
+        if self.reciprocal:
+            position = self.user_rows.get_indexer([user_profile['userId']])[0]
+            if position < 0 or self.item_index[position] < 0:
+                viewer += tuple(user_profile.get(col) for col in
+                                ('age', 'country', 'language', 'relationshipGoals', 'aboutMe'))
+        return (viewer, bool(user_profile.get('sex') and user_profile.get('seeking')),
+                self.store.code_for('sex', user_profile.get('seeking') or 'unknown'),
+                self.store.code_for('seeking', user_profile.get('sex') or 'unknown'),
+                self.exclusion_generation)
+
+    def recommend_incremental(self, user_profile, session, top_k=None, time_budget_ms=None, persist=True):
+        """
+        Interactive re-query: the sex/seeking candidate set and its ML scores live in `session`,
+        so a changed age, country, language or goal only re-slices the age window, recomputes the
+        match flags and re-blends final_score. Candidates entering the window for the first time
+        are ML-scored then (within the time budget, if any). The result cache is not used.
+        Viewers unknown to the model are answered from the cold-start tables, as in compute().
+        Pass persist=False for re-queries that should not reach the recommendation log (e.g. a UI
+        rerun on every widget change rather than an explicit search).
+        Returns: top matches DataFrame, as recommend()
+        """
+        with profile_request(self.profiler):
+            return self.requery(user_profile, session, top_k, time_budget_ms, persist)
+
+    def requery(self, user_profile, session, top_k=None, time_budget_ms=None, persist=True):
+        """recommend_incremental without the profiling hook."""
+        top_k = top_k or self.top_k
+        time_budget_ms = time_budget_ms if time_budget_ms is not None else self.time_budget_ms
+        start = time.perf_counter()
+        validate_user_profile(user_profile)
+        if self.cold_start is not None and not self.reciprocal and user_profile['userId'] not in self.user_to_idx:
+            top_matches = self.serve_cold_start(user_profile, top_k)
+            if top_matches is not None:
+                if persist and not top_matches.empty:
+                    self.persist(user_profile['userId'], top_matches)
+                return top_matches
+        key = self.session_key(user_profile)
+        reuse = session.engine is self and session.key == key
+        metrics.record_cache('query_session', reuse)
+        if not reuse:
+            session.reset(self, key, apply_rules_compact(self.store, user_profile, [], [], [], [],
+                                                         excluded_mask=self.excluded_mask, filter_age=False))
+
+        with span('age_window') as stage:
+            offsets = np.arange(len(session.base))
+            if user_profile.get('age'):
+                offsets = np.flatnonzero(age_window(session.base['age'].to_numpy(), user_profile['age']))
+            window = add_match_flags(self.store, session.base.iloc[offsets].copy(), user_profile)
+            stage.set_candidates(len(window))
+            note_candidates(len(window))
+        if window.empty:
+            logger.warning("No compatible profiles found after rule-based filtering")
+            return window
+
+        unscored = np.isnan(session.scores['ml_score'][offsets])
+        if unscored.any():
+            fresh = window[unscored].copy()
+            if time_budget_ms is None:
+                session.store_scores(self.score_candidates(user_profile, fresh))
+            else:
+                metrics.increment('deadline_requests')
+                scored, _ = self.score_within_deadline(user_profile, fresh, start + time_budget_ms / 1000.0)
+                session.store_scores(scored)
+        for col, values in session.scores.items():
+            window[col] = values[offsets]
+        ml_scored = ~np.isnan(window['ml_score'].to_numpy())
+        window[list(session.scores)] = window[list(session.scores)].fillna(0.0)
+        window = blend_final_score(window)
+
+        scored_fraction = float(ml_scored.mean())
+        if scored_fraction < 1.0:
+            metrics.increment('deadline_degraded')
+            metrics.increment('rule_only_candidates', int((~ml_scored).sum()))
+        top_matches = self.select_top_k(window, top_k)
+        top_matches.attrs['partial'] = scored_fraction < 1.0
+        top_matches.attrs['scored_fraction'] = scored_fraction
+        if persist and not top_matches.empty:
+            self.persist(user_profile['userId'], top_matches)
+        return top_matches
+
+    def serve_cold_start(self, user_profile, top_k):
+        """
+        Top-K for a viewer unknown to the model from the materialised segment tables: a lookup,
+        the exact age window and exclusions, then the usual rule blend over the stored priors.
+        Returns: top matches DataFrame (attrs['cold_start'] = True), or None if the segment is missing
+        """
+        with span('cold_start') as stage:
+            found = self.cold_start.candidates(self.store, user_profile, self.excluded_mask)
+            metrics.record_cache('cold_start', found is not None)
+            if found is None:
+                return None
+            rows, priors = found
+            stage.set_candidates(len(rows))
+            note_candidates(len(rows))
+            # Blend on arrays and build a frame only for the rows that can reach the top-K
+            table = self.store.table
+            matches = sum((table[col].to_numpy()[rows] == self.store.code_for(col, user_profile.get(col, 'unknown')))
+                          .astype(np.float64) for col in ('country', 'language', 'relationshipGoals'))
+            final_score = priors * 0.7 + matches * 0.1
+            keep = np.argsort(-final_score, kind='stable')[:max(top_k, self.diversity_shortlist)]
+            candidates = add_match_flags(self.store, table.iloc[rows[keep]].copy(), user_profile)
+            candidates['ml_score'] = priors[keep].astype(np.float64)
+            candidates = blend_final_score(candidates)
+        if candidates.empty:
+            logger.warning("No compatible profiles found in the cold-start segment")
+            top_matches = candidates
+        else:
+            top_matches = self.select_top_k(candidates, top_k)
+        top_matches.attrs['cold_start'] = True
+        top_matches.attrs['partial'] = False
+        top_matches.attrs['scored_fraction'] = 1.0
+        return top_matches
+
+    def compute(self, user_profile, top_k, time_budget_ms=None):
+        """Rules, scoring and top-K for one viewer, without caching or persistence."""
+        if self.cold_start is not None and not self.reciprocal and user_profile['userId'] not in self.user_to_idx:
+            top_matches = self.serve_cold_start(user_profile, top_k)
+            if top_matches is not None:
+                return top_matches
+        start = time.perf_counter()
+        filtered = self.filter_candidates(user_profile)
+        if filtered.empty:
+            logger.warning("No compatible profiles found after rule-based filtering")
+            return filtered
+        scored_fraction = 1.0
+        if time_budget_ms is None:
+            scored = self.score_candidates(user_profile, filtered)
+        else:
+            metrics.increment('deadline_requests')
+            scored, n_scored = self.score_within_deadline(user_profile, filtered,
+                                                          start + time_budget_ms / 1000.0)
+            scored_fraction = n_scored / len(filtered)
+            if n_scored < len(filtered):
+                metrics.increment('deadline_degraded')
+                metrics.increment('rule_only_candidates', len(filtered) - n_scored)
+                logger.warning(f"Time budget of {time_budget_ms} ms exceeded: "
+                               f"ML-scored {scored_fraction:.0%} of {len(filtered)} candidates")
+        top_matches = self.select_top_k(scored, top_k)
+        top_matches.attrs['partial'] = scored_fraction < 1.0
+        top_matches.attrs['scored_fraction'] = scored_fraction
+        return top_matches
@@ -1,30 +1,99 @@
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import LabelEncoder
-from sklearn.feature_extraction.text import TfidfVectorizer
-from scipy.sparse import hstack, csr_matrix
 import logging
 from src.data_loader import load_config
+from src.instrumentation import traced
+from src.profile_store import SUBSCRIPTION_COLUMNS, to_flag
+from src.feature_store import FeatureStore
+from src.text_features import fit_text_features
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def preprocess_data(profiles, liked, matched):
+def build_interaction_matrix(liked, matched, user_to_idx, profile_to_idx):
+    """
+    Users x profiles interaction weights: like = 1, match = 2, repeated pairs summed.
+    Interactions with a user or profile outside the maps are dropped.
+    Returns: CSR matrix
+    """
+    from scipy.sparse import csr_matrix
+
+    rows, cols, values = [], [], []
+    for frame, weight in ((liked, 1), (matched, 2)):
+        user_idx = frame['userId'].map(user_to_idx)
+        item_idx = frame['__id__'].map(profile_to_idx)
+        valid = (user_idx.notna() & item_idx.notna()).to_numpy()
+        rows.append(user_idx[valid].to_numpy(dtype=np.int64))
+        cols.append(item_idx[valid].to_numpy(dtype=np.int64))
+        values.append(np.full(int(valid.sum()), weight, dtype=np.int64))
+    rows, cols, values = np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+    shape = (len(user_to_idx), len(profile_to_idx))
+    if not len(values):
+        return csr_matrix(shape)
+    return csr_matrix((values, (rows, cols)), shape=shape)
+
+def encoder_drift(profiles, label_encoders, tfidf, profile_to_idx, categorical_cols, tfidf_params):
+    """
+    Why `profiles` cannot be encoded with saved encoders without changing what the saved model's
+    inputs mean: a category value the encoder has never seen, vectorizer settings other than
+    `tfidf_params`, or saved profiles missing (their feature rows would be reassigned).
+    Returns: reason string, or None if the saved encoders still apply
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    for col in categorical_cols:
+        if col not in profiles.columns:
+            continue
+        if col not in label_encoders:
+            return f"no saved encoder for {col}"
+        unseen = set(profiles[col].unique()) - set(label_encoders[col].classes_)
+        if unseen:
+            return f"{len(unseen)} new {col} values (e.g. {sorted(map(str, unseen))[0]!r})"
+    expected = TfidfVectorizer(**tfidf_params).get_params()
+    saved = tfidf.get_params()
+    if any(saved[key] != value for key, value in expected.items() if key != 'vocabulary'):
+        return "TF-IDF settings changed"
+    missing = len(profile_to_idx) - int(pd.Index(profiles['__id__']).isin(list(profile_to_idx)).sum())
+    if missing:
+        return f"{missing} saved profiles are gone"
+    return None
+
+@traced('preprocess_data')
+def preprocess_data(profiles, liked, matched, encoders=None):
     """
     Preprocess profiles and create interaction matrix.
+    With `encoders` (label_encoders, tfidf, user_to_idx, profile_to_idx saved with a model), the
+    profiles are encoded with them instead of refitting: codes, vocabulary and indices stay as the
+    model learned them, new users and profiles are appended to the index maps, and profiles are
+    reordered so feature rows follow profile_to_idx. Check encoder_drift first.
     Returns: processed_profiles, interaction_matrix, X_features, user_to_idx, profile_to_idx, label_encoders, tfidf
     """
+    from sklearn.preprocessing import LabelEncoder
     config = load_config()
     categorical_cols = config['preprocessing']['categorical_columns']
     tfidf_params = config['preprocessing']['tfidf_params']
     keywords = config['preprocessing']['keywords']
+    text_settings = config.get('text_features', {})
 
     try:
+        if encoders is not None:
+            label_encoders, tfidf, user_to_idx, profile_to_idx = encoders
+            # Extend copies of the saved maps; existing ids keep their index
+            user_to_idx = dict(user_to_idx)
+            profile_to_idx = dict(profile_to_idx)
+            for uid in profiles['userId'].unique():
+                user_to_idx.setdefault(uid, len(user_to_idx))
+            for pid in profiles['__id__'].unique():
+                profile_to_idx.setdefault(pid, len(profile_to_idx))
+            order = np.argsort(profiles['__id__'].map(profile_to_idx).to_numpy(dtype=np.int64), kind='stable')
+            profiles = profiles.iloc[order].reset_index(drop=True)
+
         # Label encoding for categorical columns
-        label_encoders = {}
+        if encoders is None:
+            label_encoders = {}
         for col in categorical_cols:
-            if col in profiles.columns:
+            if encoders is not None and col in label_encoders:
+                profiles[col] = label_encoders[col].transform(profiles[col]).astype(np.int64)
+            elif col in profiles.columns:
                 le = LabelEncoder()
                 unique_values = list(profiles[col].unique()) + ['unknown']
                 le.fit(unique_values)
@@ -35,12 +104,18 @@ def preprocess_data(profiles, liked, matched):
 
         # Numeric and boolean preprocessing
         profiles['age'] = pd.to_numeric(profiles['age'], errors='coerce').fillna(0).astype(np.int64)
-        for col in ['subscribed', 'subscribedEliteOne', 'subscribedEliteThree', 'subscribedEliteSix', 'subscribedEliteTwelve']:
-            profiles[col] = profiles[col].map({True: 1, False: 0, 'unknown': 0}).astype(np.int64)
+        for col in SUBSCRIPTION_COLUMNS:
+            profiles[col] = to_flag(profiles[col])
+        profiles['subscribed_score'] = profiles[SUBSCRIPTION_COLUMNS].sum(axis=1).astype(np.int8)
 
-        # TF-IDF for aboutMe
-        tfidf = TfidfVectorizer(**tfidf_params)
-        tfidf_matrix = tfidf.fit_transform(profiles['aboutMe'])
+        # TF-IDF for aboutMe (tokenised in parallel, unchanged bios served from the token cache)
+        if encoders is not None:
+            tfidf_matrix = tfidf.transform(profiles['aboutMe'].fillna('').astype(str))
+        else:
+            tfidf, tfidf_matrix = fit_text_features(profiles['aboutMe'], tfidf_params,
+                                                    cache_dir=text_settings.get('cache_dir'),
+                                                    workers=text_settings.get('workers'),
+                                                    chunk_size=text_settings.get('chunk_size', 20000))
         logger.info(f"TF-IDF matrix shape: {tfidf_matrix.shape}")
 
         # Keyword relevance
@@ -49,33 +124,21 @@ def preprocess_data(profiles, liked, matched):
         ).astype(np.float64)
 
         # Interaction matrix
-        user_ids = profiles['userId'].unique()
-        profile_ids = profiles['__id__'].unique()
-        user_to_idx = {uid: idx for idx, uid in enumerate(user_ids)}
-        profile_to_idx = {pid: idx for idx, pid in enumerate(profile_ids)}
-
-        interactions = []
-        for _, row in liked.iterrows():
-            if row['userId'] in user_to_idx and row['__id__'] in profile_to_idx:
-                interactions.append((user_to_idx[row['userId']], profile_to_idx[row['__id__']], 1))
-        for _, row in matched.iterrows():
-            if row['userId'] in user_to_idx and row['__id__'] in profile_to_idx:
-                interactions.append((user_to_idx[row['userId']], profile_to_idx[row['__id__']], 2))
-
-        if interactions:
-            rows, cols, values = zip(*interactions)
-            interaction_matrix = csr_matrix((values, (rows, cols)), shape=(len(user_ids), len(profile_ids)))
-        else:
+        if encoders is None:
+            user_ids = profiles['userId'].unique()
+            profile_ids = profiles['__id__'].unique()
+            user_to_idx = {uid: idx for idx, uid in enumerate(user_ids)}
+            profile_to_idx = {pid: idx for idx, pid in enumerate(profile_ids)}
+
+        interaction_matrix = build_interaction_matrix(liked, matched, user_to_idx, profile_to_idx)
+        if not interaction_matrix.nnz:
             logger.warning("No interactions found")
-            interaction_matrix = csr_matrix((len(user_ids), len(profile_ids)))
 
         # Combine features
-        numeric_features = ['age'] + categorical_cols + ['subscribed', 'subscribedEliteOne', 
-                                                        'subscribedEliteThree', 'subscribedEliteSix', 
-                                                        'subscribedEliteTwelve', 'keyword_score']
+        numeric_features = ['age'] + categorical_cols + SUBSCRIPTION_COLUMNS + ['keyword_score']
         X_numeric = profiles[numeric_features]
-        X_features = hstack([X_numeric.values.astype(np.float64), tfidf_matrix]).tocsr()
-        logger.info(f"Feature matrix shape: {X_features.shape}")
+        X_features = FeatureStore.from_blocks(X_numeric, tfidf_matrix)
+        logger.info(f"Feature matrix shape: {X_features.shape} ({X_features.nbytes / 1e6:.1f} MB)")
 
         return (profiles, interaction_matrix, X_features, user_to_idx, profile_to_idx, label_encoders, tfidf)
 
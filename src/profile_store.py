@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import logging
+from src.data_loader import SUBSCRIPTION_COLUMNS, TEXT_COLUMNS, to_flag  # noqa: F401 (re-exported)
+
+logger = logging.getLogger(__name__)
+
+CATEGORICAL_COLUMNS = ['country', 'language', 'sex', 'seeking', 'relationshipGoals']
+
+def keyword_scores(texts, keywords):
+    """Fraction of keywords mentioned in each text, as float32."""
+    lowered = texts.astype(str).str.lower()
+    hits = np.zeros(len(lowered), dtype=np.float32)
+    for word in keywords:
+        hits += lowered.str.contains(word.lower(), regex=False).to_numpy(dtype=np.float32)
+    return hits / max(len(keywords), 1)
+
+class ProfileStore:
+    """
+    Compact, typed profile table for the request path.
+    `table` holds narrow numeric columns (int32 category codes, uint8 age, int8 flags,
+    precomputed subscribed_score); `text` holds userName/aboutMe and is only touched
+    when the final top-K is resolved for display.
+    """
+
+    def __init__(self, table, text, categories):
+        self.table = table
+        self.text = text
+        self.categories = categories
+        self._code_lookup = {col: {label: code for code, label in enumerate(labels)}
+                             for col, labels in categories.items()}
+        self._label_lookup = {col: {str(label).strip().casefold(): label for label in labels}
+                              for col, labels in categories.items()}
+
+    @classmethod
+    def from_profiles(cls, profiles, categorical_cols=None, keywords=None):
+        """Build a store from the DataFrame returned by `load_data`."""
+        categorical_cols = categorical_cols or CATEGORICAL_COLUMNS
+        keywords = keywords or []
+        profiles = profiles.reset_index(drop=True)
+
+        table = pd.DataFrame({'__id__': profiles['__id__'].to_numpy(),
+                              'userId': profiles['userId'].to_numpy()})
+        table['age'] = (pd.to_numeric(profiles['age'], errors='coerce')
+                        .fillna(0).clip(0, 255).astype(np.uint8))
+
+        categories = {}
+        for col in categorical_cols:
+            if col not in profiles.columns:
+                logger.warning(f"Column {col} not found in profiles")
+                continue
+            codes, labels = pd.factorize(profiles[col].astype(str), sort=True)
+            table[col] = codes.astype(np.int32)
+            categories[col] = np.asarray(labels, dtype=object)
+
+        for col in SUBSCRIPTION_COLUMNS:
+            if col in profiles.columns:
+                table[col] = to_flag(profiles[col])
+            else:
+                table[col] = np.zeros(len(profiles), dtype=np.int8)
+        table['subscribed_score'] = table[SUBSCRIPTION_COLUMNS].sum(axis=1).astype(np.int8)
+
+        about = profiles['aboutMe'] if 'aboutMe' in profiles.columns else pd.Series([''] * len(profiles))
+        table['keyword_score'] = keyword_scores(about, keywords)
+
+        text = profiles[[c for c in TEXT_COLUMNS if c in profiles.columns]].copy()
+        logger.info(f"Built profile store with {len(table)} profiles")
+        return cls(table, text, categories)
+
+    def __len__(self):
+        return len(self.table)
+
+    def subset(self, rows):
+        """Store holding only the given row positions (re-indexed from 0), sharing category labels."""
+        return ProfileStore(self.table.iloc[rows].reset_index(drop=True),
+                            self.text.iloc[rows].reset_index(drop=True), self.categories)
+
+    def code_for(self, col, value):
+        """Category code for a raw value, or -1 if the value never occurs."""
+        return self._code_lookup.get(col, {}).get(str(value), -1)
+
+    def canonical_value(self, col, value):
+        """Stored label matching value up to case and surrounding whitespace, else the stripped value."""
+        text = str(value).strip()
+        return self._label_lookup.get(col, {}).get(text.casefold(), text)
+
+    def resolve(self, frame):
+        """
+        Decode category codes and attach text columns for a (small) subset of `table` rows.
+        Returns: copy of frame with string categorical columns plus userName/aboutMe
+        """
+        resolved = frame.copy()
+        positions = frame.index.to_numpy()
+        for col, labels in self.categories.items():
+            if col in resolved.columns:
+                codes = resolved[col].to_numpy()
+                resolved[col] = np.where(codes >= 0, labels[np.clip(codes, 0, None)], 'unknown')
+        for col in self.text.columns:
+            resolved[col] = self.text[col].to_numpy()[positions]
+        return resolved
+
+    def memory_usage(self, include_text=False):
+        """Bytes used by the hot table (and optionally the text columns)."""
+        total = int(self.table.memory_usage(deep=True).sum())
+        if include_text:
+            total += int(self.text.memory_usage(deep=True).sum())
+        return total
+
+def memory_footprint_report(profiles, store):
+    """
+    Compare per-profile memory of the loaded DataFrame with the compact store.
+    Returns: dict of byte counts per profile and the hot-table reduction factor
+    """
+    n = max(len(profiles), 1)
+    dataframe_bytes = int(profiles.memory_usage(deep=True).sum())
+    hot_bytes = store.memory_usage()
+    total_bytes = store.memory_usage(include_text=True)
+    report = {
+        'profiles': len(profiles),
+        'dataframe_bytes_per_profile': dataframe_bytes / n,
+        'store_hot_bytes_per_profile': hot_bytes / n,
+        'store_total_bytes_per_profile': total_bytes / n,
+        'hot_reduction_factor': dataframe_bytes / hot_bytes if hot_bytes else float('inf'),
+    }
+    logger.info(f"Profile memory: {report['dataframe_bytes_per_profile']:.0f} B/profile (DataFrame) vs "
+                f"{report['store_hot_bytes_per_profile']:.0f} B/profile (hot store)")
+    return report
@@ -0,0 +1,210 @@
+import os
+import glob
+import queue
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import closing
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Reason bitmask, in the order the UIs list reasons
+REASON_COUNTRY = 1
+REASON_LANGUAGE = 2
+REASON_GOAL = 4
+REASON_HIGH_ML = 8
+REASON_SUBSCRIBED = 16
+
+REASON_LABELS = [
+    (REASON_COUNTRY, "Country match"),
+    (REASON_LANGUAGE, "Language match"),
+    (REASON_GOAL, "Relationship goals match"),
+    (REASON_HIGH_ML, "High ML compatibility"),
+    (REASON_SUBSCRIBED, "Subscribed user"),
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recommendations (
+    viewer_id TEXT NOT NULL,
+    candidate_id TEXT NOT NULL,
+    score REAL NOT NULL,
+    reasons INTEGER NOT NULL,
+    model_version TEXT,
+    created_at REAL NOT NULL
+)
+"""
+
+_STOP = object()
+_FLUSH = object()
+
+def reason_bitmask(top_matches):
+    """Vectorised reason bitmask for each row of a scored frame."""
+    mask = np.zeros(len(top_matches), dtype=np.int64)
+    if 'country_match' in top_matches:
+        mask |= np.where(top_matches['country_match'].to_numpy(dtype=bool), REASON_COUNTRY, 0)
+    if 'language_match' in top_matches:
+        mask |= np.where(top_matches['language_match'].to_numpy(dtype=bool), REASON_LANGUAGE, 0)
+    if 'goal_match' in top_matches:
+        mask |= np.where(top_matches['goal_match'].to_numpy(dtype=bool), REASON_GOAL, 0)
+    if 'ml_score' in top_matches:
+        mask |= np.where(top_matches['ml_score'].to_numpy(dtype=float) > 0.5, REASON_HIGH_ML, 0)
+    if 'subscribed_score' in top_matches:
+        mask |= np.where(top_matches['subscribed_score'].to_numpy() > 0, REASON_SUBSCRIBED, 0)
+    return mask
+
+def decode_reasons(mask):
+    """Human-readable reasons for a bitmask."""
+    return [label for bit, label in REASON_LABELS if int(mask) & bit]
+
+class RecommendationSink:
+    """
+    Buffered, asynchronous recommendation log.
+    Requests enqueue records on a bounded queue and return immediately; a background
+    writer thread batch-appends them to rotating SQLite files in `log_dir`.
+    """
+
+    def __init__(self, log_dir, batch_size=500, flush_interval=1.0, max_queue_size=10000,
+                 max_file_bytes=64 * 1024 * 1024, model_version=None):
+        self.log_dir = log_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_file_bytes = max_file_bytes
+        self.model_version = model_version
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._conn = None
+        self._path = None
+        self._flushed = threading.Event()
+
+    def start(self):
+        """Start the background writer thread."""
+        if self._thread is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="recommendation-sink", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, viewer_id, top_matches, model_version=None, block=False):
+        """
+        Enqueue one request's top matches. Never touches disk on the caller's thread.
+        Returns: True if enqueued, False if the queue was full and the record was dropped
+        """
+        now = time.time()
+        version = model_version or self.model_version
+        records = list(zip(
+            [str(viewer_id)] * len(top_matches),
+            top_matches['__id__'].astype(str).tolist(),
+            top_matches['final_score'].astype(float).tolist(),
+            reason_bitmask(top_matches).tolist(),
+            [version] * len(top_matches),
+            [now] * len(top_matches),
+        ))
+        try:
+            self._queue.put(records, block=block)
+            return True
+        except queue.Full:
+            self.dropped += len(records)
+            logger.warning(f"Recommendation sink queue full, dropped {len(records)} records")
+            return False
+
+    def flush(self, timeout=5.0):
+        """Ask the writer to flush everything queued so far and wait for it."""
+        if self._thread is None:
+            return
+        self._flushed.clear()
+        self._queue.put(_FLUSH)
+        self._flushed.wait(timeout)
+
+    def close(self, timeout=10.0):
+        """Drain the queue, flush and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error("Recommendation sink did not drain before timeout")
+        self._thread = None
+        logger.info(f"Recommendation sink closed: {self.written} written, {self.dropped} dropped")
+
+    def _run(self):
+        batch = []
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(self.flush_interval - (time.monotonic() - last_flush), 0.01)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._write(batch)
+                self._close_file()
+                return
+            if item is _FLUSH:
+                self._write(batch)
+                batch = []
+                last_flush = time.monotonic()
+                self._flushed.set()
+                continue
+            if item:
+                batch.extend(item)
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if len(batch) >= self.batch_size or (batch and due):
+                self._write(batch)
+                batch = []
+                last_flush = time.monotonic()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            conn = self._connection()
+            with conn:
+                conn.executemany("INSERT INTO recommendations VALUES (?, ?, ?, ?, ?, ?)", batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.error(f"Error writing recommendation log batch: {e}")
+
+    def _connection(self):
+        if self._conn is not None and file_bytes(self._path) >= self.max_file_bytes:
+            self._close_file()
+        if self._conn is None:
+            self._path = self._next_path()
+            self._conn = sqlite3.connect(self._path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(_SCHEMA)
+            logger.info(f"Writing recommendation log to {self._path}")
+        return self._conn
+
+    def _next_path(self):
+        existing = sorted(glob.glob(os.path.join(self.log_dir, "recommendations-*.sqlite")))
+        if existing and file_bytes(existing[-1]) < self.max_file_bytes:
+            return existing[-1]
+        index = int(os.path.basename(existing[-1])[16:21]) + 1 if existing else 1
+        return os.path.join(self.log_dir, f"recommendations-{index:05d}.sqlite")
+
+    def _close_file(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+def file_bytes(path):
+    """Size of a SQLite log file including its write-ahead log, where committed rows sit until a checkpoint."""
+    wal = path + "-wal"
+    return os.path.getsize(path) + (os.path.getsize(wal) if os.path.exists(wal) else 0)
+
+def read_recommendation_log(log_dir):
+    """Read all rotated recommendation log files into a DataFrame (for analysis and tests)."""
+    frames = []
+    for path in sorted(glob.glob(os.path.join(log_dir, "recommendations-*.sqlite"))):
+        with closing(sqlite3.connect(path)) as conn:
+            frames.append(pd.read_sql_query("SELECT * FROM recommendations", conn))
+    if not frames:
+        return pd.DataFrame(columns=['viewer_id', 'candidate_id', 'score', 'reasons',
+                                     'model_version', 'created_at'])
+    return pd.concat(frames, ignore_index=True)
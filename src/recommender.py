@@ -1,77 +1,290 @@
 import numpy as np
-from sklearn.ensemble import GradientBoostingRegressor
-from sklearn.preprocessing import StandardScaler
-import streamlit as st
 import time
 import logging
-import joblib
 import os
+from src.instrumentation import traced
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def train_model(interaction_matrix, X_features):
+def training_rows(interaction_matrix, X_features):
+    """
+    Model inputs for every observed interaction: [user index, item index, item features].
+    Returns: X (one batched row gather), y (interaction weight normalised to [0, 1])
+    """
+    interactions = interaction_matrix.tocsr().tocoo()
+    nonzero = interactions.data != 0
+    rows, cols = interactions.row[nonzero], interactions.col[nonzero]
+    values = interactions.data[nonzero] / 2.0  # Normalize to [0, 1]
+    X = np.column_stack([rows, cols, X_features[cols].toarray()])
+    return X, values
+
+# Learner settings used when none are given (tuned with src.sweep)
+DEFAULT_MODEL_PARAMS = {'n_estimators': 50, 'max_depth': 3, 'random_state': 42}
+
+@traced('train_model')
+def train_model(interaction_matrix, X_features, params=None):
     """
     Train Gradient Boosting Regressor for compatibility prediction.
+    `params` overrides DEFAULT_MODEL_PARAMS.
     Returns: trained model, scaler
     """
     start_time = time.time()
-    num_users, num_items = interaction_matrix.shape
-    rows, cols = interaction_matrix.nonzero()
-    values = interaction_matrix.data / 2.0  # Normalize to [0, 1]
-    
-    # Prepare features
-    X_train = []
-    for user_idx, item_idx in zip(rows, cols):
-        features = X_features[item_idx].toarray().flatten()
-        X_train.append(np.concatenate([[user_idx, item_idx], features]))
-    X_train = np.array(X_train)
-    
-    # Labels
-    y_train = values
-    
+    X_train, y_train = training_rows(interaction_matrix, X_features)
+    model, scaler = fit_model(X_train, y_train, params)
+    logger.info(f"Model Training Time: {time.time() - start_time:.2f} seconds")
+    return model, scaler
+
+def fit_model(X_train, y_train, params=None):
+    """
+    Fit the scaler and booster on prepared training rows (see training_rows).
+    Returns: trained model, scaler
+    """
+    from sklearn.ensemble import GradientBoostingRegressor
+    from sklearn.preprocessing import StandardScaler
+
     scaler = StandardScaler()
     X_scaled = scaler.fit_transform(X_train)
-    
-    model = GradientBoostingRegressor(n_estimators=50, max_depth=3, random_state=42)
+    model = GradientBoostingRegressor(**{**DEFAULT_MODEL_PARAMS, **(params or {})})
     model.fit(X_scaled, y_train)
-    
-    logger.info(f"Model Training Time: {time.time() - start_time:.2f} seconds")
     return model, scaler
 
-def predict_compatibility(model, scaler, user_id, filtered_profiles, X_features, user_to_idx, profile_to_idx):
+@traced('extend_model')
+def extend_model(model, scaler, interaction_matrix, X_features, n_stages=20):
+    """
+    Warm-start a trained booster: add `n_stages` trees fit to the residuals of the current
+    ensemble on `interaction_matrix` (typically only the interactions since the last training).
+    The scaler is kept as is so the new trees see the same input scaling as the old ones.
+    Returns: extended copy of the model (the input model is not modified)
+    """
+    import copy
+
+    start_time = time.time()
+    X_new, y_new = training_rows(interaction_matrix, X_features)
+    if not len(y_new):
+        logger.warning("No new interactions: model left unchanged")
+        return model
+    model = copy.deepcopy(model)
+    model.set_params(warm_start=True, n_estimators=model.n_estimators_ + n_stages)
+    model.fit(scaler.transform(X_new), y_new)
+    logger.info(f"Added {n_stages} boosting stages on {len(y_new)} interactions in "
+                f"{time.time() - start_time:.2f} seconds")
+    return model
+
+@traced('predict_compatibility')
+def predict_compatibility(model, scaler, user_id, filtered_profiles, X_features, user_to_idx, profile_to_idx,
+                          item_indices=None, feature_rows=None, fallback_users=None, shadow=None):
     """
     Predict compatibility scores for filtered profiles.
+    `item_indices` (model item index per row, -1 if unknown) skips the id lookups when precomputed.
+    `feature_rows` (row of X_features per row) is for partial feature matrices, e.g. a shard's.
+    A viewer missing from user_to_idx gets item_prior_scores over `fallback_users`
+    (default: reference_users of user_to_idx).
+    A `shadow` scorer (src.shadow_scoring) is handed the same design matrix after the live predict.
     Returns: filtered_profiles with ml_score and final_score
     """
-    item_indices = [profile_to_idx[pid] for pid in filtered_profiles['__id__'] if pid in profile_to_idx]
-    if not item_indices:
-        st.error("No valid profiles for ML prediction.")
+    if item_indices is None:
+        item_indices = filtered_profiles['__id__'].map(profile_to_idx).fillna(-1).to_numpy(dtype=np.int64)
+    known = item_indices >= 0
+    item_indices = item_indices[known]
+    feature_rows = item_indices if feature_rows is None else feature_rows[known]
+    if not len(item_indices):
+        logger.error("No valid profiles for ML prediction.")
         return filtered_profiles
     
-    user_indices = np.full(len(item_indices), user_to_idx.get(user_id, 0))
-    X_pred = [np.concatenate([[u, i], X_features[i].toarray().flatten()]) 
-              for u, i in zip(user_indices, item_indices)]
-    X_pred = scaler.transform(X_pred)
-    scores = model.predict(X_pred)
-    
-    filtered_profiles['ml_score'] = 0.0
-    profile_ids = filtered_profiles['__id__'].values
-    for idx, score in zip(item_indices, scores):
-        filtered_profiles.loc[filtered_profiles['__id__'] == profile_ids[idx], 'ml_score'] = score
+    if user_id in user_to_idx:
+        user_indices = np.full(len(item_indices), user_to_idx[user_id])
+        # One batched row gather instead of a toarray() per candidate
+        X_pred = np.column_stack([user_indices, item_indices, X_features[feature_rows].toarray()])
+        start = time.perf_counter_ns()
+        scores = model.predict(scaler.transform(X_pred))
+        if shadow is not None:
+            shadow.submit(X_pred, scores, time.perf_counter_ns() - start)
+    else:
+        # Unknown viewer: item-side scores rather than another user's
+        if fallback_users is None:
+            fallback_users = reference_users(len(user_to_idx))
+        scores = item_prior_scores(model, scaler, X_features, item_indices, feature_rows, fallback_users, shadow)
     
-    filtered_profiles['final_score'] = (filtered_profiles['ml_score'] * 0.7 + 
-                                       filtered_profiles['country_match'].astype(int) * 0.1 + 
-                                       filtered_profiles['language_match'].astype(int) * 0.1 + 
-                                       filtered_profiles['goal_match'].astype(int) * 0.1)
-    
-    return filtered_profiles
+    ml_scores = np.zeros(len(filtered_profiles))
+    ml_scores[known] = scores
+    filtered_profiles['ml_score'] = ml_scores
+    return blend_final_score(filtered_profiles)
+
+def reference_users(n_users, n=4):
+    """Evenly spaced user indices whose predictions are averaged to marginalise the user out."""
+    return np.unique(np.linspace(0, max(n_users - 1, 0), n).round().astype(np.int64))
+
+def item_prior_scores(model, scaler, X_features, item_indices, feature_rows=None, users=(0,), shadow=None):
+    """
+    User-independent model score per item: the prediction averaged over `users` (see
+    reference_users), in one batched predict. Used for viewers the model has never seen.
+    Returns: float array of len(item_indices)
+    """
+    item_indices = np.asarray(item_indices, dtype=np.int64)
+    feature_rows = item_indices if feature_rows is None else np.asarray(feature_rows, dtype=np.int64)
+    if not len(item_indices):
+        return np.zeros(0)
+    users = np.asarray(users, dtype=np.int64)
+    features = X_features[feature_rows].toarray()
+    X_pred = np.column_stack([np.repeat(users, len(item_indices)), np.tile(item_indices, len(users)),
+                              np.tile(features, (len(users), 1))])
+    start = time.perf_counter_ns()
+    scores = model.predict(scaler.transform(X_pred)).reshape(len(users), len(item_indices)).mean(axis=0)
+    if shadow is not None:
+        shadow.submit(X_pred, scores, time.perf_counter_ns() - start, groups=len(users))
+    return scores
+
+def blend_final_score(scored):
+    """Blend ml_score with the rule matches into final_score."""
+    scored['final_score'] = (scored['ml_score'] * 0.7 + 
+                             scored['country_match'].astype(int) * 0.1 + 
+                             scored['language_match'].astype(int) * 0.1 + 
+                             scored['goal_match'].astype(int) * 0.1)
+    return scored
+
+def combine_scores(forward, reverse, method='harmonic'):
+    """
+    Combine viewer->candidate and candidate->viewer scores.
+    The harmonic mean rewards mutual interest: it is low if either side is low.
+    """
+    forward = np.clip(forward, 0.0, None)
+    reverse = np.clip(reverse, 0.0, None)
+    if method == 'harmonic':
+        total = forward + reverse
+        return np.divide(2 * forward * reverse, total, out=np.zeros_like(total), where=total > 0)
+    if method == 'geometric':
+        return np.sqrt(forward * reverse)
+    if method == 'min':
+        return np.minimum(forward, reverse)
+    if method == 'mean':
+        return (forward + reverse) / 2
+    raise ValueError(f"Unknown score combination method: {method}")
+
+@traced('predict_compatibility')
+def predict_reciprocal_compatibility(model, scaler, user_idx, viewer_item, viewer_features, filtered_profiles,
+                                     X_features, item_indices, candidate_user_indices,
+                                     reverse_interactions=None, combine='harmonic', feature_rows=None,
+                                     fallback_users=None, fallback_items=None, shadow=None):
+    """
+    Score both directions of each pair in one batched model call.
+    Forward rows are (viewer as user, candidate as item); reverse rows are (candidate as user,
+    viewer as item). The scaler is applied to the candidate feature block and the viewer's
+    feature row once each instead of to the stacked matrix. A viewer unknown to the model
+    (`user_idx` -1) gets forward scores averaged over `fallback_users`, and one without a stored
+    profile (`viewer_item` -1) gets reverse scores averaged over `fallback_items`, as
+    item_prior_scores does, rather than borrowing user or item 0. Candidates without a user index
+    (-1 in `candidate_user_indices`) get the reverse score averaged over `fallback_users`: their
+    reverse rows only differ in the user, so that is one prediction per fallback user shared by
+    all of them. `reverse_interactions` is a row of the transposed interaction matrix (who
+    liked/matched the viewer), used as a floor for the reverse score of candidates that are users.
+    `feature_rows` and `shadow` are as for predict_compatibility; the shadow compares raw model
+    outputs for both directions, before the reverse floor and combination.
+    Returns: filtered_profiles with ml_score_forward, ml_score_reverse, ml_score and final_score
+    """
+    known = item_indices >= 0
+    items = item_indices[known]
+    candidate_users = candidate_user_indices[known]
+    feature_rows = items if feature_rows is None else feature_rows[known]
+    n = len(items)
+    if not n:
+        logger.error("No valid profiles for ML prediction.")
+        return filtered_profiles
+
+    is_user = candidate_users >= 0
+    n_users = int(is_user.sum())
+    reverse_users = candidate_users[is_user]
+    if fallback_users is None:
+        fallback_users = reference_users(max(int(candidate_users.max()), user_idx) + 1)
+    fallback_users = np.asarray(fallback_users, dtype=np.int64)
+    if n_users < n:
+        reverse_users = np.concatenate([reverse_users, fallback_users])
+    forward_users = np.array([user_idx]) if user_idx >= 0 else fallback_users
+    if viewer_item >= 0:
+        viewer_items = np.array([viewer_item])
+    else:
+        viewer_items = np.asarray(fallback_items if fallback_items is not None else
+                                  np.sort(items)[reference_users(n)], dtype=np.int64)
+
+    # Forward block: one copy of the candidates per forward user; reverse block: one copy of
+    # the reverse users per viewer item
+    mean, scale = scaler.mean_, scaler.scale_
+    n_forward = n * len(forward_users)
+    X_pred = np.empty((n_forward + len(reverse_users) * len(viewer_items), len(mean)))
+    X_pred[:n_forward, 0] = (np.repeat(forward_users, n) - mean[0]) / scale[0]
+    X_pred[:n_forward, 1] = (np.tile(items, len(forward_users)) - mean[1]) / scale[1]
+    X_pred[:n_forward, 2:] = np.tile((X_features[feature_rows].toarray() - mean[2:]) / scale[2:],
+                                     (len(forward_users), 1))
+    X_pred[n_forward:, 0] = (np.tile(reverse_users, len(viewer_items)) - mean[0]) / scale[0]
+    X_pred[n_forward:, 1] = (np.repeat(viewer_items, len(reverse_users)) - mean[1]) / scale[1]
+    X_pred[n_forward:, 2:] = (np.asarray(viewer_features, dtype=np.float64) - mean[2:]) / scale[2:]
+    start = time.perf_counter_ns()
+    scores = model.predict(X_pred)
+    if shadow is not None:
+        # Already scaled by the live scaler; the shadow undoes that off the request thread
+        shadow.submit(X_pred, scores, time.perf_counter_ns() - start, scaled_by=scaler)
+
+    forward = scores[:n_forward].reshape(len(forward_users), n).mean(axis=0)
+    reverse_scores = scores[n_forward:].reshape(len(viewer_items), len(reverse_users)).mean(axis=0)
+    reverse = np.empty(n)
+    reverse[is_user] = reverse_scores[:n_users]
+    if n_users < n:
+        reverse[~is_user] = reverse_scores[n_users:].mean()
+    if reverse_interactions is not None and n_users:
+        # Observed likes (1) and matches (2) of the viewer, normalised like the training labels
+        observed = np.zeros(n)
+        observed[is_user] = np.asarray(reverse_interactions[:, candidate_users[is_user]].todense()).ravel() / 2.0
+        reverse = np.maximum(reverse, observed)
+
+    for column, values in (('ml_score_forward', forward), ('ml_score_reverse', reverse),
+                           ('ml_score', combine_scores(forward, reverse, combine))):
+        column_scores = np.zeros(len(filtered_profiles))
+        column_scores[known] = values
+        filtered_profiles[column] = column_scores
+    return blend_final_score(filtered_profiles)
+
+_version_cache = {}
+
+def model_version(models_dir="models"):
+    """
+    Short content hash of the saved model artifact, used to tag logged recommendations.
+    Cached per (path, mtime, size) so repeated calls do not re-hash the pickle.
+    Returns: hex digest prefix, or 'untrained' if no model has been saved
+    """
+    import hashlib
+
+    path = os.path.join(models_dir, "matchmaking_model.pkl")
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 'untrained'
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _version_cache:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        _version_cache[key] = digest.hexdigest()[:12]
+    return _version_cache[key]
+
+def fitted_version(model, scaler=None):
+    """
+    Short content hash of an in-memory model and scaler, for engines not given the version of
+    a saved artifact. Unlike id(model), it cannot be reused by a different model after the
+    first one is garbage-collected.
+    Returns: hex digest prefix
+    """
+    import hashlib
+    import pickle
+
+    return hashlib.sha1(pickle.dumps((model, scaler), protocol=4)).hexdigest()[:12]
 
 def load_model_and_encoders(models_dir="models"):
     """
     Load trained model and encoders from models_dir.
     Returns: model, scaler, label_encoders, tfidf, user_to_idx, profile_to_idx
     """
+    import joblib
+
     try:
         model = joblib.load(os.path.join(models_dir, "matchmaking_model.pkl"))
         scaler = joblib.load(os.path.join(models_dir, "scaler.pkl"))
@@ -0,0 +1,259 @@
+import argparse
+import glob
+import os
+import random
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FILE = "requests.collapsed"
+
+# Innermost matching frame names the stage a sample is charged to (names as in instrumentation)
+STAGE_FRAMES = {
+    'apply_rules_compact': 'apply_rules',
+    'add_match_flags': 'apply_rules',
+    'encode_user_profile': 'encode_user_profile',
+    'predict_compatibility': 'predict_compatibility',
+    'predict_reciprocal_compatibility': 'predict_compatibility',
+    'item_prior_scores': 'predict_compatibility',
+    'select_top_k': 'top_k',
+    'rerank': 'rerank',
+    'persist': 'persistence',
+    'serve_cold_start': 'cold_start',
+}
+
+# Request being served on this thread, for note_candidates()
+_local = threading.local()
+
+def note_candidates(n):
+    """Record the candidate count of the request being profiled on this thread (no-op otherwise)."""
+    request = getattr(_local, 'request', None)
+    if request is not None:
+        request.candidates = int(n)
+
+def candidate_bucket(n):
+    """Power-of-two upper bound of a candidate count, so files aggregate across similar requests."""
+    if n is None:
+        return "candidates=unknown"
+    return f"candidates<={1 << max(int(n) - 1, 0).bit_length()}"
+
+def frame_label(code):
+    return f"{os.path.splitext(os.path.basename(code.co_filename))[0]}:{code.co_name}"
+
+class _NoopRequest:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP_REQUEST = _NoopRequest()
+
+class ProfiledRequest:
+    """One request watched by the sampler: sampled from its start, or once it passes slow_ms."""
+
+    __slots__ = ('profiler', 'thread_id', 'sampled', 'start', 'candidates', 'stacks', 'root', 'elapsed')
+
+    def __init__(self, profiler, sampled):
+        self.profiler = profiler
+        self.thread_id = threading.get_ident()
+        self.sampled = sampled
+        self.candidates = None
+        self.stacks = Counter()
+        self.root = None
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        # Frames above the one entering the request (callers of recommend) are left out of its stacks
+        self.root = sys._getframe(1).f_back
+        self.start = time.perf_counter()
+        _local.request = self
+        self.profiler._watch(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        _local.request = None
+        self.profiler._unwatch(self)
+        slow = self.profiler.slow_s is not None and self.elapsed >= self.profiler.slow_s
+        if (self.sampled or slow) and self.stacks:
+            self.profiler.write(self, 'slow' if slow else 'sampled')
+        return False
+
+    def collect(self, frame):
+        """Fold one stack snapshot (sampler thread) into the request's counts."""
+        labels = []
+        stage = 'other'
+        while frame is not None and frame is not self.root:
+            label = STAGE_FRAMES.get(frame.f_code.co_name)
+            if label is not None and stage == 'other':
+                stage = label
+            labels.append(frame_label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        self.stacks[(stage, ";".join(labels))] += 1
+
+class RequestProfiler:
+    """
+    Opt-in sampling profiler for the recommend pipeline. A fraction of requests is sampled from
+    the start and any request running longer than slow_ms is sampled from that point on: a
+    background thread snapshots the request thread's stack every interval_ms, so unsampled
+    requests only pay for a random draw and a dict insert. Stacks are written as collapsed-stack
+    lines (flamegraph.pl / speedscope input) prefixed with the stage, candidate-count bucket
+    and reason, to a file rotated by size.
+    """
+
+    def __init__(self, out_dir, sample_rate=0.01, slow_ms=None, interval_ms=2.0, max_bytes=5 * 1024 * 1024,
+                 backups=5, seed=None):
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, PROFILE_FILE)
+        self.sample_rate = sample_rate
+        self.slow_s = slow_ms / 1000.0 if slow_ms is not None else None
+        self.interval = interval_ms / 1000.0
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.random = random.Random(seed)
+        self.active = {}
+        self.requests_profiled = 0
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def request(self):
+        """Context manager around one request; returns a shared no-op when it cannot be profiled."""
+        sampled = self.random.random() < self.sample_rate
+        if not sampled and self.slow_s is None:
+            return _NOOP_REQUEST
+        return ProfiledRequest(self, sampled)
+
+    def _watch(self, request):
+        with self._lock:
+            self.active[request.thread_id] = request
+            # is_alive: a forked batch worker inherits the object but not the thread
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _unwatch(self, request):
+        with self._lock:
+            if self.active.get(request.thread_id) is request:
+                del self.active[request.thread_id]
+
+    def _run(self):
+        while not self._stopped:
+            # Collecting under the lock: once _unwatch returns, a request's stacks are final
+            with self._lock:
+                active = bool(self.active)
+                now = time.perf_counter()
+                frames = sys._current_frames() if active else {}
+                for request in self.active.values():
+                    if request.sampled or now - request.start >= self.slow_s:
+                        frame = frames.get(request.thread_id)
+                        if frame is not None:
+                            request.collect(frame)
+                del frames
+            if not active:
+                self._wake.wait(1.0)
+                self._wake.clear()
+                continue
+            time.sleep(self.interval)
+
+    def write(self, request, reason):
+        """Append a request's collapsed stacks, rotating the file first if it would exceed max_bytes."""
+        bucket = candidate_bucket(request.candidates)
+        lines = [f"stage:{stage};{bucket};{reason};{stack} {count}\n"
+                 for (stage, stack), count in request.stacks.items()]
+        content = "".join(lines)
+        with self._lock:
+            os.makedirs(self.out_dir, exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(content) > self.max_bytes:
+                self.rotate()
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(content)
+            self.requests_profiled += 1
+            self.samples += sum(request.stacks.values())
+        if reason == 'slow':
+            logger.warning(f"Slow request ({request.elapsed * 1000:.1f} ms, {bucket}) profiled to {self.path}")
+
+    def rotate(self):
+        """requests.collapsed -> .1 -> .2 ..., dropping the oldest beyond `backups`."""
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+
+def profile_request(profiler):
+    """Context manager profiling one request with `profiler`, or a no-op without one."""
+    if profiler is None:
+        return _NOOP_REQUEST
+    return profiler.request()
+
+def create_profiler(config):
+    """Request profiler from the `profiling` config section, or None when disabled."""
+    settings = config.get('profiling', {})
+    if not settings.get('enabled', False):
+        return None
+    return RequestProfiler(settings.get('out_dir', 'log/profiles'), settings.get('sample_rate', 0.01),
+                           settings.get('slow_ms'), settings.get('interval_ms', 2.0),
+                           int(settings.get('max_mb', 5) * 1024 * 1024), settings.get('backups', 5))
+
+def load_collapsed(paths):
+    """Merge collapsed-stack files. Returns: Counter of stack line -> samples."""
+    stacks = Counter()
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if stack and count.isdigit():
+                    stacks[stack] += int(count)
+    return stacks
+
+def summarise(stacks, top=15):
+    """
+    Samples per stage and the frames with most self samples (the leaf of each stack).
+    Returns: dict with 'total', 'stages' and 'self'
+    """
+    stages, leaves = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        stages[frames[0]] += count
+        leaves[frames[-1]] += count
+    return {'total': sum(stacks.values()), 'stages': dict(stages.most_common()),
+            'self': dict(leaves.most_common(top))}
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise request profiles (collapsed stacks)")
+    parser.add_argument("profile_dir", help="Directory holding requests.collapsed[.N] files")
+    parser.add_argument("--merged", default=None, help="Also write all stacks to one collapsed file")
+    args = parser.parse_args()
+    stacks = load_collapsed(sorted(glob.glob(os.path.join(args.profile_dir, PROFILE_FILE + "*"))))
+    if args.merged:
+        with open(args.merged, 'w', encoding='utf-8') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    summary = summarise(stacks)
+    print(f"{summary['total']} samples")
+    for title in ('stages', 'self'):
+        print(f"\nBy {title}:")
+        for name, count in summary[title].items():
+            print(f"  {count / max(summary['total'], 1):6.1%}  {name}")
+
+if __name__ == "__main__":
+    main()
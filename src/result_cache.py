@@ -0,0 +1,101 @@
+import threading
+import logging
+from collections import OrderedDict
+from src.instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+class _Flight:
+    """One in-progress computation that concurrent identical misses wait on."""
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+def frame_size(frame):
+    """Approximate in-memory size of a cached DataFrame in bytes."""
+    return int(frame.memory_usage(deep=True).sum())
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of top-K result frames, bounded by total memory rather than entry count.
+    Concurrent misses for the same key are single-flighted: one caller computes, the others wait.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, name='result_cache'):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        """
+        Cached value for key, or compute() it once for all concurrent callers.
+        `cacheable(value)` can veto storing a result (e.g. partial results).
+        Returns: a copy of the cached frame
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                metrics.record_cache(self.name, True)
+                return entry[0].copy()
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        metrics.record_cache(self.name, False)
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value.copy()
+
+        produced = False
+        try:
+            flight.value = compute()
+            produced = True
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            try:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                    if produced and (cacheable is None or cacheable(flight.value)):
+                        self._store(key, flight.value)
+            finally:
+                flight.event.set()
+        return flight.value.copy()
+
+    def _store(self, key, value):
+        size = frame_size(value)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import time
+import logging
+from src.data_loader import load_config, load_data
+from src.preprocessing import preprocess_data, build_interaction_matrix, encoder_drift
+from src.profile_store import ProfileStore
+from src.recommender import train_model, extend_model, load_model_and_encoders, model_version
+from src.pipeline import MatchEngine
+from src.evaluation import load_interactions, time_split, replay_holdout, holdout_rmse, _split_frames
+from src.utils import save_models
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FILE = "training_history.json"
+MODES = ('auto', 'full', 'incremental')
+
+def load_history(models_dir):
+    """Training history of a models directory, oldest first ([] if none)."""
+    path = os.path.join(models_dir, HISTORY_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def record_training(models_dir, entry):
+    """Append one training entry to the history (written atomically)."""
+    history = load_history(models_dir) + [entry]
+    path = os.path.join(models_dir, HISTORY_FILE)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return history
+
+def retrain(data_dir=None, models_dir=None, mode='auto', n_stages=None):
+    """
+    Retrain the saved model. 'full' trains from scratch on every interaction; 'incremental'
+    loads the previous artifact and adds boosting stages fit on the interactions appended to
+    the CSVs since the last checkpoint (row offsets in the history); 'auto' is incremental
+    when there is a checkpoint to extend. Increments encode the data with the checkpoint's
+    encoders, vectorizer and index maps (new users/profiles appended); when those no longer fit
+    (new categories, changed TF-IDF settings, removed profiles) the run falls back to a full
+    retrain and records why. Each run is saved and appended to the history with its content
+    version and the version it extends.
+    Returns: the history entry for this run
+    """
+    config = load_config()
+    data_dir = data_dir or config['data']['data_dir']
+    models_dir = models_dir or config['model']['models_dir']
+    n_stages = n_stages or config.get('retraining', {}).get('incremental_stages', 20)
+    if mode not in MODES:
+        raise ValueError(f"Unknown retraining mode: {mode}")
+
+    (profiles, liked, matched, *_) = load_data(data_dir=data_dir)
+    if profiles is None:
+        raise ValueError("Failed to load data for retraining")
+
+    history = load_history(models_dir)
+    last = history[-1] if history else None
+    model, scaler, encoders = None, None, None
+    fallback_reason = None
+    if mode != 'full' and last is not None:
+        model, scaler, *encoders = load_model_and_encoders(models_dir)
+        if model is not None and model_version(models_dir) != last['version']:
+            logger.warning("Saved model does not match the training history; running a full retrain")
+            model = None
+    if mode == 'incremental' and model is None:
+        raise ValueError(f"No checkpoint to extend in {models_dir}; run a full retrain first")
+    if model is not None:
+        # New trees are fit on rows encoded exactly as the checkpoint's trees saw them
+        label_encoders, tfidf, _, profile_to_idx = encoders
+        fallback_reason = encoder_drift(profiles, label_encoders, tfidf, profile_to_idx,
+                                        config['preprocessing']['categorical_columns'],
+                                        config['preprocessing']['tfidf_params'])
+        if fallback_reason:
+            logger.warning(f"Saved encoders no longer fit the data ({fallback_reason}); running a full retrain")
+            model, encoders = None, None
+    (_, interaction_matrix, X_features, user_to_idx, profile_to_idx,
+     label_encoders, tfidf) = preprocess_data(profiles, liked, matched, encoders)
+
+    start = time.perf_counter()
+    if model is None:
+        mode = 'full'
+        model, scaler = train_model(interaction_matrix, X_features)
+        new_interactions = int(interaction_matrix.nnz)
+    else:
+        mode = 'incremental'
+        recent = build_interaction_matrix(liked.iloc[last['liked_rows']:], matched.iloc[last['matched_rows']:],
+                                          user_to_idx, profile_to_idx)
+        new_interactions = int(recent.nnz)
+        model = extend_model(model, scaler, recent, X_features, n_stages)
+    seconds = time.perf_counter() - start
+
+    save_models(model, scaler, label_encoders, tfidf, user_to_idx, profile_to_idx, models_dir=models_dir)
+    entry = {
+        'version': model_version(models_dir),
+        'parent': last['version'] if mode == 'incremental' else None,
+        'mode': mode,
+        'stages': int(model.n_estimators_),
+        'new_interactions': new_interactions,
+        'liked_rows': len(liked),
+        'matched_rows': len(matched),
+        'seconds': seconds,
+        'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    if fallback_reason:
+        entry['fallback_reason'] = fallback_reason
+    record_training(models_dir, entry)
+    logger.info(f"Retrained ({mode}) model {entry['version']} in {seconds:.2f}s "
+                f"on {new_interactions} interactions")
+    return entry
+
+def compare_retraining(data_dir=None, recent_fraction=0.1, n_stages=None, k=5, holdout_per_user=1,
+                       min_history=2, max_users=None, workers=1, seed=0):
+    """
+    Full retrain vs warm-start increment on the same data. Training interactions are split in
+    time: a base model is trained on the older (1 - recent_fraction), then either extended with
+    the recent interactions or rebuilt from scratch on all of them. Both are replayed against
+    the same time-split holdout.
+    Returns: dict with seconds, holdout RMSE and ranking metrics per strategy
+    """
+    config = load_config()
+    n_stages = n_stages or config.get('retraining', {}).get('incremental_stages', 20)
+    (profiles, liked, matched, blocked_ids, declined_ids,
+     deleted_ids, reported_ids) = load_data(data_dir=data_dir)
+    if profiles is None:
+        raise ValueError("Failed to load data for the retraining comparison")
+    store = ProfileStore.from_profiles(profiles, config['preprocessing']['categorical_columns'],
+                                       config['preprocessing']['keywords'])
+    events = load_interactions(liked, matched)
+    train_events, holdout_events = time_split(events, holdout_per_user, min_history)
+    cut = int(len(train_events) * (1 - recent_fraction))
+    train_liked, train_matched = _split_frames(train_events)
+    (_, interaction_matrix, X_features, user_to_idx, profile_to_idx,
+     label_encoders, tfidf) = preprocess_data(profiles, train_liked, train_matched)
+    base_matrix = build_interaction_matrix(*_split_frames(train_events.iloc[:cut]), user_to_idx, profile_to_idx)
+    recent_matrix = build_interaction_matrix(*_split_frames(train_events.iloc[cut:]), user_to_idx, profile_to_idx)
+    holdout_matrix = build_interaction_matrix(*_split_frames(holdout_events), user_to_idx, profile_to_idx)
+    base_model, scaler = train_model(base_matrix, X_features)
+
+    results = {'train_interactions': int(interaction_matrix.nnz), 'recent_interactions': int(recent_matrix.nnz),
+               'stages': n_stages}
+    start = time.perf_counter()
+    full_model, full_scaler = train_model(interaction_matrix, X_features)
+    results['full'] = {'seconds': time.perf_counter() - start}
+    start = time.perf_counter()
+    incremental_model = extend_model(base_model, scaler, recent_matrix, X_features, n_stages)
+    results['incremental'] = {'seconds': time.perf_counter() - start}
+
+    for name, model, model_scaler in (('full', full_model, full_scaler), ('incremental', incremental_model, scaler)):
+        engine = MatchEngine(store, X_features, model, model_scaler, label_encoders, tfidf, user_to_idx,
+                             profile_to_idx, blocked_ids, declined_ids, deleted_ids, reported_ids)
+        metrics = replay_holdout(engine, store, interaction_matrix, holdout_events, k=k, workers=workers,
+                                 max_users=max_users, seed=seed)
+        results[name].update({key: value for key, value in metrics.items() if key != 'workers'})
+        results[name]['holdout_rmse'] = holdout_rmse(model, model_scaler, holdout_matrix, X_features)
+    results['speedup'] = results['full']['seconds'] / max(results['incremental']['seconds'], 1e-9)
+    logger.info(f"Retraining comparison: {results}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Full or incremental (warm-start) model retraining")
+    parser.add_argument("--data_dir", default=None, help="Data directory (defaults to config)")
+    parser.add_argument("--models_dir", default=None, help="Models directory (defaults to config)")
+    parser.add_argument("--mode", default="auto", choices=MODES, help="Retraining mode")
+    parser.add_argument("--stages", type=int, default=None,
+                        help="Boosting stages added per increment (defaults to config retraining.incremental_stages)")
+    parser.add_argument("--compare", action="store_true",
+                        help="Compare a full retrain with an increment on the recent interactions instead")
+    parser.add_argument("--recent_fraction", type=float, default=0.1, help="--compare: share of recent interactions")
+    parser.add_argument("--max_users", type=int, default=None, help="--compare: evaluate a sample of users")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.compare:
+        result = compare_retraining(args.data_dir, args.recent_fraction, args.stages, max_users=args.max_users)
+    else:
+        result = retrain(args.data_dir, args.models_dir, args.mode, args.stages)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
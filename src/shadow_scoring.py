@@ -0,0 +1,354 @@
+import argparse
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import logging
+from collections import deque
+import numpy as np
+from src.instrumentation import LatencyHistogram, QUANTILES, metrics
+
+logger = logging.getLogger(__name__)
+
+# Score histogram range: the model regresses on interaction labels scaled to [0, 1]
+SCORE_BINS = np.linspace(0.0, 1.0, 21)
+
+_STOP = object()
+
+class ScoreStats:
+    """Running count, mean, spread and a fixed-bin histogram of one model's scores."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.bins = np.zeros(len(SCORE_BINS) - 1, dtype=np.int64)
+
+    def add(self, scores):
+        self.count += len(scores)
+        self.total += float(scores.sum())
+        self.total_sq += float(np.dot(scores, scores))
+        self.min = min(self.min, float(scores.min()))
+        self.max = max(self.max, float(scores.max()))
+        # Out-of-range scores land in the end bins
+        self.bins += np.histogram(np.clip(scores, SCORE_BINS[0], SCORE_BINS[-1]), SCORE_BINS)[0]
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        mean = self.total / self.count
+        cumulative = np.cumsum(self.bins)
+        quantiles = {f"p{q * 100:g}": float(SCORE_BINS[1:][np.searchsorted(cumulative, q * self.count)])
+                     for q in (0.05, 0.25, 0.5, 0.75, 0.95)}
+        summary = {'count': self.count, 'mean': mean, 'std': max(self.total_sq / self.count - mean ** 2, 0.0) ** 0.5,
+                   'min': self.min, 'max': self.max}
+        summary.update(quantiles)
+        summary['histogram'] = self.bins.tolist()
+        return summary
+
+def _latency_summary(histogram):
+    summary = {f"p{q * 100:g}_ms": histogram.percentile(q) / 1e6 for q in QUANTILES}
+    summary['mean_ms'] = histogram.total / max(histogram.count, 1) / 1e6
+    return summary
+
+def _distribution(values):
+    if not values:
+        return {'count': 0}
+    values = np.asarray(values)
+    return {'count': len(values), 'mean': float(values.mean()), 'p10': float(np.percentile(values, 10)),
+            'min': float(values.min())}
+
+class ShadowScorer:
+    """
+    Scores the live model's candidate batches with a second model version, off the request
+    thread. The live path hands over the design matrix it just predicted on (no copy) with its
+    scores and latency; background workers scale it with the shadow's own scaler, predict, and
+    record both score distributions, per-batch rank agreement (Spearman, Kendall, top-k overlap)
+    and both models' predict latency. Batches are dropped, never waited for, when max_pending
+    are already queued, so a slow shadow model cannot add request latency beyond CPU contention
+    (set `block` for offline comparisons that must see every batch).
+    """
+
+    def __init__(self, model, scaler, version='shadow', live_version='live', sample_rate=1.0, workers=1,
+                 max_pending=8, top_k=10, log_interval=60.0, report_path=None, history=10000, seed=None):
+        self.model = model
+        self.scaler = scaler
+        self.version = version
+        self.live_version = live_version
+        self.sample_rate = sample_rate
+        self.workers = workers
+        self.top_k = top_k
+        self.log_interval = log_interval
+        self.report_path = report_path
+        self.block = False
+        self.closed = False
+        self.random = np.random.default_rng(seed)
+        self.batches = 0
+        self.rows = 0
+        self.dropped = 0
+        self.errors = 0
+        self.live_latency = LatencyHistogram()
+        self.shadow_latency = LatencyHistogram()
+        self.live_scores = ScoreStats()
+        self.shadow_scores = ScoreStats()
+        self.abs_diff_total = 0.0
+        self.spearman = deque(maxlen=history)
+        self.kendall = deque(maxlen=history)
+        self.top_k_overlap = deque(maxlen=history)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._last_log = time.monotonic()
+
+    def submit(self, X_pred, live_scores, live_ns, groups=1, scaled_by=None):
+        """
+        Queue one live batch for shadow scoring from the request thread (waits only if `block` is set).
+        `groups` > 1 means rows are `groups` stacked copies whose predictions the live path averaged
+        (item_prior_scores); `scaled_by` is the live scaler when X_pred is already scaled.
+        Returns: True if queued, False if sampled out or dropped
+        """
+        if self.sample_rate < 1.0 and self.random.random() >= self.sample_rate:
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put((X_pred, live_scores, live_ns, groups, scaled_by), block=self.block)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            metrics.increment('shadow_dropped')
+            return False
+
+    def _ensure_started(self):
+        # is_alive: a forked batch worker inherits the scorer but not its threads
+        if len(self._threads) == self.workers and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f"shadow-scorer-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self.score(*item)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                logger.error(f"Shadow scoring failed: {e}")
+            finally:
+                self._queue.task_done()
+            if self.log_interval and time.monotonic() - self._last_log >= self.log_interval:
+                self._last_log = time.monotonic()
+                self.log_summary()
+
+    def score(self, X_pred, live_scores, live_ns, groups=1, scaled_by=None):
+        """Shadow-predict one batch and fold the comparison into the running stats."""
+        from scipy.stats import kendalltau, spearmanr
+
+        if scaled_by is not None:
+            X_pred = X_pred * scaled_by.scale_ + scaled_by.mean_
+        start = time.perf_counter_ns()
+        shadow_scores = self.model.predict(self.scaler.transform(X_pred))
+        if groups > 1:
+            shadow_scores = shadow_scores.reshape(groups, -1).mean(axis=0)
+        shadow_ns = time.perf_counter_ns() - start
+
+        live_scores = np.asarray(live_scores, dtype=np.float64)
+        rank = {}
+        if len(live_scores) > 1 and np.ptp(live_scores) > 0 and np.ptp(shadow_scores) > 0:
+            rank['spearman'] = spearmanr(live_scores, shadow_scores)[0]
+            rank['kendall'] = kendalltau(live_scores, shadow_scores)[0]
+        k = min(self.top_k, len(live_scores))
+        if k:
+            live_top = np.argpartition(-live_scores, k - 1)[:k]
+            shadow_top = np.argpartition(-shadow_scores, k - 1)[:k]
+            rank['top_k_overlap'] = len(np.intersect1d(live_top, shadow_top)) / k
+        with self._lock:
+            self.batches += 1
+            self.rows += len(live_scores)
+            self.live_latency.record(live_ns)
+            self.shadow_latency.record(shadow_ns)
+            self.live_scores.add(live_scores)
+            self.shadow_scores.add(shadow_scores)
+            self.abs_diff_total += float(np.abs(shadow_scores - live_scores).sum())
+            for name, value in rank.items():
+                getattr(self, name).append(float(value))
+
+    def snapshot(self):
+        """
+        JSON-serialisable comparison so far.
+        Returns: dict with batch counts, 'live' and 'shadow' (scores, latency) and 'agreement'
+        """
+        with self._lock:
+            return {
+                'versions': {'live': self.live_version, 'shadow': self.version},
+                'batches': self.batches, 'rows': self.rows, 'dropped': self.dropped, 'errors': self.errors,
+                'live': {'scores': self.live_scores.summary(), 'latency': _latency_summary(self.live_latency)},
+                'shadow': {'scores': self.shadow_scores.summary(), 'latency': _latency_summary(self.shadow_latency)},
+                'agreement': {'spearman': _distribution(self.spearman), 'kendall': _distribution(self.kendall),
+                              'top_k_overlap': _distribution(self.top_k_overlap),
+                              'mean_abs_diff': self.abs_diff_total / max(self.rows, 1)},
+            }
+
+    def log_summary(self):
+        """One log line comparing the two versions, mirrored to instrumentation gauges."""
+        snapshot = self.snapshot()
+        if not snapshot['batches']:
+            return snapshot
+        live, shadow, agreement = snapshot['live'], snapshot['shadow'], snapshot['agreement']
+        spearman = agreement['spearman'].get('mean', float('nan'))
+        kendall = agreement['kendall'].get('mean', float('nan'))
+        overlap = agreement['top_k_overlap'].get('mean', float('nan'))
+        logger.info(f"Shadow {self.version} vs {self.live_version} over {snapshot['batches']} batches "
+                    f"({snapshot['dropped']} dropped): mean score {shadow['scores']['mean']:.3f} vs "
+                    f"{live['scores']['mean']:.3f}, spearman {spearman:.3f}, kendall {kendall:.3f}, "
+                    f"top-{self.top_k} overlap {overlap:.2f}, p99 predict {shadow['latency']['p99_ms']:.2f} ms "
+                    f"vs {live['latency']['p99_ms']:.2f} ms")
+        metrics.set_gauge('shadow_spearman_mean', spearman)
+        metrics.set_gauge('shadow_kendall_mean', kendall)
+        metrics.set_gauge('shadow_top_k_overlap_mean', overlap)
+        metrics.set_gauge('shadow_predict_p99_seconds', shadow['latency']['p99_ms'] / 1e3)
+        return snapshot
+
+    def close(self, timeout=10.0):
+        """Finish queued batches, stop the workers, log and (optionally) write the final comparison."""
+        if self.closed:
+            return self.snapshot()
+        self.closed = True
+        threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+        snapshot = self.log_summary()
+        if self.report_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.report_path)), exist_ok=True)
+            with open(self.report_path, 'w') as f:
+                json.dump(snapshot, f, indent=2)
+        return snapshot
+
+def shadow_layout_mismatch(models_dir, live_tfidf=None, live_encoders=None, live_user_to_idx=None,
+                           live_profile_to_idx=None):
+    """
+    Why the artifacts saved in `models_dir` would encode inputs differently from the live ones:
+    a different TF-IDF vocabulary, different label-encoder classes, or user/profile index maps
+    that do not extend the live maps (every live id must keep its index). Only the live
+    artifacts given are checked; a missing saved artifact counts as a mismatch.
+    Returns: reason string, or None if the layouts agree
+    """
+    import joblib
+
+    def saved(name):
+        path = os.path.join(models_dir, name)
+        return joblib.load(path) if os.path.exists(path) else None
+
+    def extends(saved_map, live_map):
+        return saved_map is not None and all(saved_map.get(key) == idx for key, idx in live_map.items())
+
+    if live_tfidf is not None:
+        tfidf = saved("tfidf_vectorizer.pkl")
+        if tfidf is None or tfidf.vocabulary_ != live_tfidf.vocabulary_:
+            return "a different vocabulary"
+    if live_encoders is not None:
+        encoders = saved("label_encoders.pkl") or {}
+        for col, encoder in live_encoders.items():
+            if col not in encoders or list(encoders[col].classes_) != list(encoder.classes_):
+                return f"different {col} categories"
+    if live_user_to_idx is not None and not extends(saved("user_to_idx.pkl"), live_user_to_idx):
+        return "different user indices"
+    if live_profile_to_idx is not None and not extends(saved("profile_to_idx.pkl"), live_profile_to_idx):
+        return "different profile indices"
+    return None
+
+def load_shadow_model(models_dir, live_scaler, live_tfidf=None, live_encoders=None, live_user_to_idx=None,
+                      live_profile_to_idx=None):
+    """
+    Load the model and scaler saved by save_models in `models_dir` for shadow scoring. The
+    shadow scores the live feature matrix, so its scaler must take as many features and its
+    vectorizer, label encoders and index maps must encode like the live ones (see
+    shadow_layout_mismatch).
+    Returns: model, scaler (None, None if missing or incompatible)
+    """
+    import joblib
+
+    try:
+        model = joblib.load(os.path.join(models_dir, "matchmaking_model.pkl"))
+        scaler = joblib.load(os.path.join(models_dir, "scaler.pkl"))
+    except FileNotFoundError as e:
+        logger.error(f"Shadow model not found: {e}")
+        return None, None
+    if getattr(scaler, 'n_features_in_', None) != getattr(live_scaler, 'n_features_in_', None):
+        logger.error(f"Shadow model in {models_dir} expects {getattr(scaler, 'n_features_in_', None)} features, "
+                     f"live model {getattr(live_scaler, 'n_features_in_', None)}; not shadow scoring")
+        return None, None
+    reason = shadow_layout_mismatch(models_dir, live_tfidf, live_encoders, live_user_to_idx, live_profile_to_idx)
+    if reason:
+        logger.error(f"Shadow model in {models_dir} was trained with {reason}; not shadow scoring")
+        return None, None
+    return model, scaler
+
+def create_shadow(config, live_scaler, live_tfidf=None, live_encoders=None, live_user_to_idx=None,
+                  live_profile_to_idx=None):
+    """Shadow scorer from the `shadow` config section, or None when disabled or not loadable."""
+    from src.recommender import model_version
+
+    settings = config.get('shadow', {})
+    if not settings.get('enabled', False):
+        return None
+    models_dir = settings.get('models_dir', 'models/shadow')
+    model, scaler = load_shadow_model(models_dir, live_scaler, live_tfidf, live_encoders, live_user_to_idx,
+                                      live_profile_to_idx)
+    if model is None:
+        return None
+    scorer = ShadowScorer(model, scaler, version=model_version(models_dir),
+                          live_version=model_version(config['model']['models_dir']),
+                          sample_rate=settings.get('sample_rate', 1.0), workers=settings.get('workers', 1),
+                          max_pending=settings.get('max_pending', 8), top_k=settings.get('top_k', 10),
+                          log_interval=settings.get('log_interval_seconds', 60),
+                          report_path=settings.get('report_path'))
+    logger.info(f"Shadow scoring model {scorer.version} from {models_dir} against {scorer.live_version}")
+    atexit.register(scorer.close)
+    return scorer
+
+def main():
+    parser = argparse.ArgumentParser(description="Shadow-score a candidate model version against the live one")
+    parser.add_argument("shadow_dir", help="Models directory of the candidate version (save_models layout)")
+    parser.add_argument("--data_dir", default=None, help="Dataset directory (defaults to config data.data_dir)")
+    parser.add_argument("--profiles", default=None,
+                        help="JSONL file of recorded profiles (defaults to profiles sampled from the store)")
+    parser.add_argument("--queries", type=int, default=200, help="Sampled profiles when --profiles is not given")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for profile sampling")
+    parser.add_argument("--output", default=None, help="Write the comparison to a JSON file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from src.data_loader import load_config
+    from src.load_generator import load_engine, load_profiles
+
+    # A copy: load_config() is memoised and shared by the rest of the process
+    config = dict(load_config())
+    config['shadow'] = dict(config.get('shadow', {}), enabled=True, models_dir=args.shadow_dir, sample_rate=1.0,
+                            log_interval_seconds=0, report_path=args.output)
+    engine, store = load_engine(config, args.data_dir)
+    if engine.shadow is None:
+        return 1
+    # Every batch is compared: requests wait for queue space instead of dropping batches
+    engine.shadow.block = True
+    for profile in load_profiles(args.profiles, store, args.queries, args.seed):
+        engine.recommend(profile)
+    print(json.dumps(engine.shadow.close(), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import heapq
+import multiprocessing
+import threading
+import zlib
+import logging
+from collections import ChainMap
+import numpy as np
+import pandas as pd
+from src.pipeline import MatchEngine
+from src.diversity import mmr_rerank
+from src.instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+PARTITIONS = ('hash', 'country')
+
+def hash_partition(ids, n_shards):
+    """Stable shard per id (crc32, so it does not depend on PYTHONHASHSEED)."""
+    return np.fromiter((zlib.crc32(str(i).encode()) % n_shards for i in ids), dtype=np.int64, count=len(ids))
+
+def country_partition(country_codes, n_shards):
+    """
+    Whole countries per shard, greedily balanced by profile count (largest country first).
+    Returns: shard per row
+    """
+    country_codes = np.asarray(country_codes, dtype=np.int64)
+    if not len(country_codes):
+        return np.zeros(0, dtype=np.int64)
+    codes, counts = np.unique(country_codes, return_counts=True)
+    loads = np.zeros(n_shards, dtype=np.int64)
+    owner = np.zeros(codes.max() + 1, dtype=np.int64)
+    for i in np.argsort(-counts, kind='stable'):
+        shard = int(np.argmin(loads))
+        owner[codes[i]] = shard
+        loads[shard] += counts[i]
+    return owner[country_codes]
+
+def build_shards(store, X_features, user_to_idx, profile_to_idx, excluded_ids=(), n_shards=2, partition='hash'):
+    """
+    Split the profile store, feature matrix and id maps into self-contained shards.
+    Each shard keeps global model indices (the model was trained on them) but only its own
+    rows of X_features, addressed through `feature_rows`.
+    Returns: list of shard dicts
+    """
+    if partition == 'hash':
+        assignment = hash_partition(store.table['__id__'].to_numpy(), n_shards)
+    elif partition == 'country':
+        assignment = country_partition(store.table['country'].to_numpy(), n_shards)
+    else:
+        raise ValueError(f"Unknown partition scheme: {partition}")
+
+    excluded_ids = set(excluded_ids)
+    shards = []
+    for shard_id in range(n_shards):
+        rows = np.flatnonzero(assignment == shard_id)
+        shard_store = store.subset(rows)
+        ids = shard_store.table['__id__']
+        items = ids.map(profile_to_idx).fillna(-1).to_numpy(dtype=np.int64)
+        users = shard_store.table['userId']
+        shards.append({
+            'shard_id': shard_id,
+            'store': shard_store,
+            'X_features': X_features[np.maximum(items, 0)],
+            'feature_rows': np.arange(len(rows), dtype=np.int64),
+            'profile_to_idx': {pid: int(item) for pid, item in zip(ids, items) if item >= 0},
+            'user_to_idx': {uid: user_to_idx[uid] for uid in users if uid in user_to_idx},
+            'n_users': len(user_to_idx),
+            'excluded_ids': set(ids[ids.isin(excluded_ids)]) if excluded_ids else set(),
+            'countries': set(store.categories['country'][np.unique(shard_store.table['country'])])
+                         if 'country' in store.categories and len(rows) else set(),
+        })
+        logger.info(f"Shard {shard_id}: {len(rows)} profiles")
+    return shards
+
+def serve_shard(conn, shard, model, scaler, label_encoders, tfidf, engine_kwargs):
+    """
+    Worker process loop: build a MatchEngine over one shard and answer coordinator messages.
+    Messages: ('recommend', (profile, viewer_user_idx, top_k, time_budget_ms, with_text)),
+    ('exclusions', ids), ('add_exclusions', ids), or None to stop. A recommend reply is
+    (top-K frame, TF-IDF rows of its profiles if with_text else None).
+    """
+    engine = MatchEngine(shard['store'], shard['X_features'], model, scaler, label_encoders, tfidf,
+                         shard['user_to_idx'], shard['profile_to_idx'], blocked_ids=shard['excluded_ids'],
+                         feature_rows=shard['feature_rows'], n_users=shard['n_users'], **engine_kwargs)
+    shard_users = engine.user_to_idx
+    conn.send(('ready', len(shard['store'])))
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        kind, payload = message
+        try:
+            if kind == 'recommend':
+                user_profile, viewer_user_idx, top_k, time_budget_ms, with_text = payload
+                # The viewer usually lives in another shard: the coordinator supplies their model index
+                engine.user_to_idx = (ChainMap({user_profile['userId']: viewer_user_idx}, shard_users)
+                                      if viewer_user_idx is not None else shard_users)
+                top = engine.compute(user_profile, top_k, time_budget_ms)
+                text_rows = engine.shortlist_features(top)[0] if with_text and not top.empty else None
+                conn.send(('ok', (top, text_rows)))
+            elif kind == 'exclusions':
+                engine.set_exclusions(payload)
+                conn.send(('ok', None))
+            elif kind == 'add_exclusions':
+                conn.send(('ok', engine.add_exclusions(payload)))
+            else:
+                conn.send(('error', f"Unknown message {kind}"))
+        except Exception as e:
+            logger.error(f"Shard {shard['shard_id']} failed: {e}")
+            conn.send(('error', repr(e)))
+    conn.close()
+
+def merge_top_k(frames, top_k):
+    """Global top-K from per-shard top-K frames with a heap over (score, shard, row)."""
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    if not frames:
+        empty = pd.DataFrame()
+        empty.attrs['partial'] = False
+        empty.attrs['scored_fraction'] = 1.0
+        return empty
+    best = heapq.nlargest(top_k, ((score, shard, row)
+                                  for shard, frame in enumerate(frames)
+                                  for row, score in enumerate(frame['final_score'].to_numpy())),
+                          key=lambda entry: entry[0])
+    merged = pd.concat([frames[shard].iloc[[row]] for _, shard, row in best], ignore_index=True)
+    merged.attrs['partial'] = any(frame.attrs.get('partial', False) for frame in frames)
+    merged.attrs['scored_fraction'] = min(frame.attrs.get('scored_fraction', 1.0) for frame in frames)
+    return merged
+
+def merge_diverse(replies, top_k, shortlist_size, diversity_lambda=0.7,
+                  diversity_columns=('country', 'language', 'relationshipGoals')):
+    """
+    Global MMR top-K from per-shard (unreranked shortlist frame, TF-IDF rows) replies: the
+    global shortlist is heap-merged first, then re-ranked once, as MatchEngine.select_top_k does.
+    Returns: top matches DataFrame in selection order
+    """
+    from scipy.sparse import vstack
+
+    # Tag rows with their position in the stacked text rows so they survive the merge
+    frames, offset = [], 0
+    for frame, _ in replies:
+        frames.append(frame.assign(_text_row=np.arange(offset, offset + len(frame))))
+        offset += len(frame)
+    shortlist = merge_top_k(frames, shortlist_size)
+    if shortlist.empty:
+        return shortlist
+    text_rows = vstack([rows for frame, rows in replies if not frame.empty]).tocsr()
+    with span('rerank', len(shortlist)):
+        columns = [col for col in diversity_columns if col in shortlist.columns]
+        order = mmr_rerank(shortlist['final_score'].to_numpy(), text_rows[shortlist['_text_row'].to_numpy()],
+                           shortlist[columns].to_numpy(), top_k, diversity_lambda)
+        top_matches = shortlist.iloc[order].drop(columns='_text_row').reset_index(drop=True)
+    top_matches.attrs = dict(shortlist.attrs)
+    return top_matches
+
+class ShardedMatchEngine:
+    """
+    Coordinator for a partitioned deployment: each shard is served by its own worker process.
+    A query is scattered to the relevant shards, each computes a local top-K in parallel,
+    and the results are merged with a heap. With a diversity shortlist, shards return their
+    top `diversity_shortlist` rows unreranked and MMR runs once over the merged shortlist, as
+    in MatchEngine.select_top_k. Persistence happens once, in the coordinator.
+    """
+
+    def __init__(self, shards, model, scaler, label_encoders, tfidf, user_to_idx, sink=None, top_k=5,
+                 engine_kwargs=None, start_method='spawn'):
+        self.shards = shards
+        self.model = model
+        self.scaler = scaler
+        self.label_encoders = label_encoders
+        self.tfidf = tfidf
+        self.user_to_idx = user_to_idx
+        self.sink = sink
+        self.top_k = top_k
+        self.engine_kwargs = dict(engine_kwargs or {})
+        # Re-ranking needs the global shortlist, so it is taken away from the shard engines
+        self.diversity_shortlist = self.engine_kwargs.pop('diversity_shortlist', 0)
+        self.diversity_lambda = self.engine_kwargs.get('diversity_lambda', 0.7)
+        self.diversity_columns = self.engine_kwargs.get('diversity_columns',
+                                                        ('country', 'language', 'relationshipGoals'))
+        self.start_method = start_method
+        self.countries = [shard['countries'] for shard in shards]
+        self._conns = []
+        self._processes = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start one worker process per shard and wait until every shard has built its engine."""
+        context = multiprocessing.get_context(self.start_method)
+        for shard in self.shards:
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=serve_shard, name=f"shard-{shard['shard_id']}", daemon=True,
+                                      args=(child_conn, shard, self.model, self.scaler, self.label_encoders,
+                                            self.tfidf, self.engine_kwargs))
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+        for conn in self._conns:
+            status, size = conn.recv()
+            logger.info(f"Shard worker {status} with {size} profiles")
+        # Shard data now lives in the workers
+        self.shards = None
+        return self
+
+    def relevant_shards(self, user_profile, scope='all'):
+        """Shards to query: all of them, or with scope='country' only those holding the viewer's country."""
+        if scope == 'country':
+            local = [i for i, countries in enumerate(self.countries) if user_profile.get('country') in countries]
+            if local:
+                return local
+        return list(range(len(self._conns)))
+
+    def _scatter(self, targets, message):
+        for i in targets:
+            self._conns[i].send(message)
+        results = [self._conns[i].recv() for i in targets]
+        errors = [payload for status, payload in results if status != 'ok']
+        if errors:
+            raise RuntimeError(f"Shard errors: {errors}")
+        return [payload for _, payload in results]
+
+    def recommend(self, user_profile, top_k=None, time_budget_ms=None, scope='all'):
+        """
+        Scatter the query, gather local top-K frames and merge them.
+        Returns: top matches DataFrame (empty if no shard has a candidate)
+        """
+        top_k = top_k or self.top_k
+        diverse = self.diversity_shortlist > top_k
+        targets = self.relevant_shards(user_profile, scope)
+        payload = (user_profile, self.user_to_idx.get(user_profile['userId']),
+                   self.diversity_shortlist if diverse else top_k, time_budget_ms, diverse)
+        with self._lock, span('scatter_gather', len(targets)):
+            replies = self._scatter(targets, ('recommend', payload))
+        if not diverse:
+            return self.persist(user_profile, merge_top_k([frame for frame, _ in replies], top_k))
+        return self.persist(user_profile, merge_diverse(replies, top_k, self.diversity_shortlist,
+                                                        self.diversity_lambda, self.diversity_columns))
+
+    def persist(self, user_profile, top_matches):
+        """Hand the merged top matches to the sink, if one is attached. Returns: top_matches"""
+        if not top_matches.empty and self.sink is not None:
+            with span('persistence', len(top_matches)):
+                self.sink.submit(user_profile['userId'], top_matches)
+        return top_matches
+
+    def set_exclusions(self, excluded_ids):
+        """Broadcast a new exclusion set to every shard."""
+        excluded_ids = set(excluded_ids)
+        with self._lock:
+            self._scatter(range(len(self._conns)), ('exclusions', excluded_ids))
+
+    def add_exclusions(self, profile_ids):
+        """Broadcast additional excluded ids to every shard (each flips only rows it holds)."""
+        profile_ids = set(profile_ids)
+        with self._lock:
+            self._scatter(range(len(self._conns)), ('add_exclusions', profile_ids))
+
+    def close(self, timeout=10.0):
+        """Stop the shard workers."""
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._conns, self._processes = [], []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,318 @@
+import argparse
+import os
+import sqlite3
+import logging
+import numpy as np
+import pandas as pd
+from src.data_loader import (load_config, validate_csv_header, profile_dtypes, fill_missing,
+                             coerce_profile_columns, to_flag, SUBSCRIPTION_COLUMNS)
+
+logger = logging.getLogger(__name__)
+
+EXCLUSION_KINDS = ('blocked', 'declined', 'deleted', 'reported')
+
+# Created after the bulk load. idx_profiles_rules covers the whole apply_rules query:
+# (sex, seeking) equality + age range scan, with the match columns and id read from the index.
+_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_profiles_user ON profiles(userId, __id__)",
+    "CREATE INDEX IF NOT EXISTS idx_profiles_rules ON profiles("
+    "sex, seeking, age, country, language, relationshipGoals, __id__)",
+    "CREATE INDEX IF NOT EXISTS idx_liked_user ON liked(userId, __id__)",
+    "CREATE INDEX IF NOT EXISTS idx_matched_user ON matched(userId, __id__)",
+]
+
+def connect(db_path):
+    """SQLite connection in WAL mode, so readers are not blocked by an import or exclusion update."""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _quote(col):
+    return '"' + col.replace('"', '""') + '"'
+
+def _profile_rows(chunk, columns, start, updated_at_column=None):
+    """
+    Rows for the staging table: sequence number, the parsed timestamp as ISO-8601 text (NULL
+    when missing or unparseable, as dedupe_profiles treats it), then columns with NaN as NULL.
+    """
+    chunk = chunk.copy()
+    for col in SUBSCRIPTION_COLUMNS:
+        if col in chunk:
+            chunk[col] = to_flag(chunk[col]).astype(int)
+    if 'age' in chunk:
+        chunk['age'] = pd.to_numeric(chunk['age'], errors='coerce')
+    values = chunk[columns].astype(object).where(chunk[columns].notna(), None)
+    seq = np.arange(start, start + len(chunk)).tolist()
+    updated = [None] * len(chunk)
+    if updated_at_column in chunk:
+        parsed = pd.to_datetime(chunk[updated_at_column], errors='coerce', utc=True)
+        updated = parsed.dt.strftime('%Y-%m-%dT%H:%M:%S.%f').astype(object).where(parsed.notna(), None).tolist()
+    return [(s, u, *row) for s, u, row in zip(seq, updated, values.itertuples(index=False, name=None))]
+
+def source_files(config, data_dir=None):
+    """The seven CSVs named in config['data'], as {config key: path}."""
+    files = config['data']
+    data_dir = data_dir or files['data_dir']
+    keys = ['profiles_file', 'liked_file', 'matched_file'] + [f'{kind}_file' for kind in EXCLUSION_KINDS]
+    return {key: os.path.join(data_dir, files[key]) for key in keys}
+
+def source_signature(paths):
+    """(key, mtime_ns, size) per source CSV, with -1s for missing files."""
+    signature = []
+    for key, path in sorted(paths.items()):
+        try:
+            stat = os.stat(path)
+            signature.append((key, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append((key, -1, -1))
+    return signature
+
+def import_needed(db_path, paths):
+    """True when the database is missing, unreadable or was imported from different CSVs."""
+    if not os.path.exists(db_path):
+        return True
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            recorded = conn.execute("SELECT file, mtime_ns, size FROM sources ORDER BY file").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return True
+    return recorded != source_signature(paths)
+
+def import_csvs(data_dir=None, db_path=None, chunk_size=100_000):
+    """
+    (Re)build the SQLite store from the seven CSVs named in config['data'].
+    Profiles are deduplicated on __id__ with last-write-wins (latest updatedAt, else last row),
+    keeping the winning row's position, as in load_data. Timestamps are parsed as there, so a
+    missing or unparseable one loses to any valid one. The database is built next to `db_path` and moved into place only once
+    complete, with the CSVs' mtimes and sizes in a `sources` table, so a failed import leaves
+    the previous database (or none) behind.
+    Returns: dict of row counts per table
+    """
+    config = load_config()
+    files = config['data']
+    data_dir = data_dir or files['data_dir']
+    db_path = db_path or sqlite_path(config, data_dir)
+    required_cols = files['required_columns']
+    updated_at_column = files.get('updated_at_column')
+
+    profiles_path = os.path.join(data_dir, files['profiles_file'])
+    header = validate_csv_header(profiles_path, required_cols, files['profiles_file'])
+    columns = [c for c in header if c in required_cols or c == updated_at_column]
+    column_sql = ', '.join(_quote(c) for c in columns)
+    # Taken before reading, so a CSV rewritten during the import triggers another one
+    signature = source_signature(source_files(config, data_dir))
+
+    tmp_path = db_path + ".tmp"
+    _remove_database(tmp_path)
+    conn = connect(tmp_path)
+    counts = {}
+    try:
+        with conn:
+            conn.execute(f"CREATE TABLE profiles (seq INTEGER NOT NULL, {column_sql}, PRIMARY KEY (__id__))")
+            conn.execute(f"CREATE TEMP TABLE staging (seq INTEGER NOT NULL, updated_key TEXT, {column_sql})")
+            placeholders = ', '.join(['?'] * (len(columns) + 2))
+            start = 0
+            for chunk in pd.read_csv(profiles_path, usecols=columns, dtype=str, chunksize=chunk_size):
+                conn.executemany(f"INSERT INTO staging VALUES ({placeholders})",
+                                 _profile_rows(chunk, columns, start, updated_at_column))
+                start += len(chunk)
+            # Same winner as dedupe_profiles: latest parsed timestamp (missing or unparseable ones
+            # sort first, so they lose), then file order
+            order = 'seq DESC'
+            if updated_at_column in columns:
+                order = "updated_key DESC NULLS LAST, seq DESC"
+            conn.execute(f"""
+                INSERT INTO profiles
+                SELECT seq, {column_sql} FROM (
+                    SELECT *, ROW_NUMBER() OVER (PARTITION BY __id__ ORDER BY {order}) AS rank
+                    FROM staging)
+                WHERE rank = 1 ORDER BY seq""")
+            conn.execute("DROP TABLE staging")
+            counts['profiles'] = conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+            if start - counts['profiles']:
+                logger.info(f"Dropped {start - counts['profiles']} duplicate profiles on __id__")
+
+            for table, key in (('liked', 'liked_file'), ('matched', 'matched_file')):
+                path = os.path.join(data_dir, files[key])
+                validate_csv_header(path, ['userId', '__id__'], files[key])
+                conn.execute(f"CREATE TABLE {table} (userId TEXT NOT NULL, __id__ TEXT NOT NULL)")
+                counts[table] = 0
+                for chunk in pd.read_csv(path, usecols=['userId', '__id__'], dtype=str, chunksize=chunk_size):
+                    conn.executemany(f"INSERT INTO {table} VALUES (?, ?)",
+                                     chunk[['userId', '__id__']].itertuples(index=False, name=None))
+                    counts[table] += len(chunk)
+
+            conn.execute("CREATE TABLE exclusions (__id__ TEXT NOT NULL, kind TEXT NOT NULL, "
+                         "PRIMARY KEY (__id__, kind)) WITHOUT ROWID")
+            for kind in EXCLUSION_KINDS:
+                path = os.path.join(data_dir, files[f'{kind}_file'])
+                validate_csv_header(path, ['__id__'], files[f'{kind}_file'])
+                ids = pd.read_csv(path, usecols=['__id__'], dtype=str)['__id__'].dropna()
+                conn.executemany("INSERT OR IGNORE INTO exclusions VALUES (?, ?)", ((i, kind) for i in ids))
+                counts[kind] = len(ids)
+
+            for statement in _INDEXES:
+                conn.execute(statement)
+            conn.execute("CREATE TABLE sources (file TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER)")
+            conn.executemany("INSERT INTO sources VALUES (?, ?, ?)", signature)
+            conn.execute("ANALYZE")
+        # Fold the WAL into the file so the rename moves a complete database
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        # Sidecars of the replaced database must not be replayed into the new one
+        _remove_database(db_path, suffixes=('-wal', '-shm'))
+        os.replace(tmp_path, db_path)
+    except BaseException:
+        conn.close()
+        _remove_database(tmp_path)
+        raise
+    logger.info(f"Imported CSVs from {data_dir} into {db_path}: {counts}")
+    return counts
+
+def _remove_database(path, suffixes=('', '-wal', '-shm')):
+    for suffix in suffixes:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def sqlite_path(config, data_dir=None):
+    """Database path: config data.sqlite_file, relative to the data directory."""
+    data_dir = data_dir or config['data']['data_dir']
+    return os.path.join(data_dir, config['data'].get('sqlite_file', 'profiles.sqlite'))
+
+class SQLiteProfileStore:
+    """
+    Indexed SQLite backend for profiles, interactions and exclusions.
+    `load_data()` returns the same tuple as data_loader.load_data; the query methods push
+    the apply_rules filters into SQL so candidate fetches are index range scans.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = connect(db_path)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def profile_columns(self):
+        return [row[1] for row in self.conn.execute("PRAGMA table_info(profiles)") if row[1] != 'seq']
+
+    def load_data(self):
+        """
+        Everything load_data returns, read from the database.
+        Returns: profiles_df, liked_df, matched_df, blocked_ids, declined_ids, deleted_ids, reported_ids
+        """
+        config = load_config()
+        categorical_cols = config.get('preprocessing', {}).get('categorical_columns', [])
+        columns = self.profile_columns()
+        profiles = pd.read_sql_query(
+            f"SELECT {', '.join(_quote(c) for c in columns)} FROM profiles ORDER BY seq", self.conn)
+        profiles = fill_missing(coerce_profile_columns(profiles.astype(profile_dtypes(columns, categorical_cols))))
+        liked = pd.read_sql_query("SELECT userId, __id__ FROM liked ORDER BY rowid", self.conn)
+        matched = pd.read_sql_query("SELECT userId, __id__ FROM matched ORDER BY rowid", self.conn)
+        exclusions = [self.exclusions(kind) for kind in EXCLUSION_KINDS]
+        logger.info(f"Loaded {len(profiles)} profiles, {len(liked)} liked, {len(matched)} matched from {self.db_path}")
+        return (profiles, liked, matched, *exclusions)
+
+    def exclusions(self, kind):
+        return [row[0] for row in self.conn.execute("SELECT __id__ FROM exclusions WHERE kind = ?", (kind,))]
+
+    def add_exclusions(self, kind, ids):
+        """Record new exclusions (e.g. a block) without re-importing."""
+        if kind not in EXCLUSION_KINDS:
+            raise ValueError(f"Unknown exclusion kind: {kind}")
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO exclusions VALUES (?, ?)", ((i, kind) for i in ids))
+
+    def _rules_where(self, user_profile):
+        """WHERE clause and parameters equivalent to apply_rules for this viewer."""
+        clauses = ["NOT EXISTS (SELECT 1 FROM exclusions e WHERE e.__id__ = p.__id__)"]
+        params = []
+        if user_profile.get('seeking') and user_profile.get('sex'):
+            clauses += ["p.sex = ?", "p.seeking = ?"]
+            params += [user_profile['seeking'], user_profile['sex']]
+        if user_profile.get('age'):
+            age = float(user_profile['age'])
+            clauses.append("p.age BETWEEN ? AND ?")
+            params += [age - 5, age + 5]
+        return ' AND '.join(clauses), params
+
+    def _candidate_query(self, user_profile, columns):
+        where, params = self._rules_where(user_profile)
+        select = ', '.join(f"p.{_quote(c)}" for c in columns)
+        sql = (f"SELECT {select}, p.country = ? AS country_match, p.language = ? AS language_match, "
+               f"p.relationshipGoals = ? AS goal_match FROM profiles p WHERE {where} ORDER BY p.seq")
+        matches = [user_profile.get('country', 'unknown'), user_profile.get('language', 'unknown'),
+                   user_profile.get('relationshipGoals', 'unknown')]
+        return sql, matches + params
+
+    def candidate_ids(self, user_profile):
+        """Ids of profiles passing the rules, read from the covering index."""
+        where, params = self._rules_where(user_profile)
+        return [row[0] for row in self.conn.execute(f"SELECT p.__id__ FROM profiles p WHERE {where}", params)]
+
+    def filter_profiles(self, user_profile, columns=None):
+        """
+        apply_rules in SQL: candidate rows (all profile columns by default) with match flags.
+        Returns: DataFrame in file order with country_match, language_match, goal_match
+        """
+        columns = columns or self.profile_columns()
+        sql, params = self._candidate_query(user_profile, columns)
+        filtered = pd.read_sql_query(sql, self.conn, params=params)
+        for col in ('country_match', 'language_match', 'goal_match'):
+            filtered[col] = filtered[col].fillna(0).astype(bool)
+        logger.info(f"Filtered to {len(filtered)} profiles in SQL")
+        return filtered
+
+    def query_plan(self, user_profile):
+        """EXPLAIN QUERY PLAN details for the candidate id query."""
+        where, params = self._rules_where(user_profile)
+        sql = f"EXPLAIN QUERY PLAN SELECT p.__id__ FROM profiles p WHERE {where}"
+        return [row[-1] for row in self.conn.execute(sql, params)]
+
+    def profile(self, profile_id):
+        """One profile by __id__ (primary-key lookup), or None."""
+        frame = pd.read_sql_query("SELECT * FROM profiles WHERE __id__ = ?", self.conn, params=[profile_id])
+        return None if frame.empty else frame.drop(columns=['seq']).iloc[0].to_dict()
+
+    def profiles_for_user(self, user_id):
+        """Profile ids owned by a userId (covering index lookup)."""
+        return [row[0] for row in self.conn.execute("SELECT __id__ FROM profiles WHERE userId = ?", (user_id,))]
+
+def load_sqlite_data(data_dir=None):
+    """
+    load_data for the sqlite backend: imports the CSVs on first use and again whenever one of
+    them has changed since the last import.
+    Returns: the load_data tuple, or all None if the import fails
+    """
+    config = load_config()
+    db_path = sqlite_path(config, data_dir)
+    try:
+        if import_needed(db_path, source_files(config, data_dir)):
+            import_csvs(data_dir, db_path)
+        with SQLiteProfileStore(db_path) as store:
+            return store.load_data()
+    except (FileNotFoundError, ValueError, sqlite3.Error, pd.errors.DatabaseError) as e:
+        logger.error(f"Error loading SQLite store {db_path}: {e}")
+        return None, None, None, None, None, None, None
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the CSV datasets into an indexed SQLite store")
+    parser.add_argument("--data_dir", default=None, help="CSV directory (defaults to config)")
+    parser.add_argument("--db", default=None, help="Database path (defaults to data.sqlite_file in data_dir)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    print(import_csvs(args.data_dir, args.db))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+import time
+import logging
+import numpy as np
+from src.data_loader import load_config, load_data
+from src.preprocessing import preprocess_data, build_interaction_matrix
+from src.profile_store import ProfileStore
+from src.recommender import training_rows, fit_model
+from src.pipeline import MatchEngine
+from src.parallel import fork_map
+from src.evaluation import load_interactions, time_split, replay_holdout, holdout_rmse, _split_frames
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRID = {'n_estimators': [50, 100], 'max_depth': [3, 5], 'learning_rate': [0.05, 0.1]}
+
+def parameter_grid(grid):
+    """Every combination of a {param: [values]} grid, in a stable order."""
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+def random_search(grid, n, seed=0):
+    """`n` distinct random combinations from the grid."""
+    configs = parameter_grid(grid)
+    picks = np.random.default_rng(seed).choice(len(configs), size=min(n, len(configs)), replace=False)
+    return [configs[i] for i in sorted(picks)]
+
+def design_fingerprint(interaction_matrix, X_features):
+    """Content digest of the inputs to the training design matrix."""
+    digest = hashlib.sha1()
+    for matrix in (interaction_matrix.tocsr(), X_features.tocsr()):
+        for array in (matrix.indptr, matrix.indices, matrix.data):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(str(matrix.shape).encode())
+    return digest.hexdigest()[:16]
+
+def _save_npy(path, array):
+    with open(path + ".tmp", 'wb') as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+def cached_design_matrix(interaction_matrix, X_features, cache_dir):
+    """
+    Training rows for `interaction_matrix`, built once per content fingerprint and stored as
+    .npy files that workers open memory-mapped, so they share the page cache instead of each
+    assembling and holding their own copy.
+    Returns: design matrix path, labels path
+    """
+    fingerprint = design_fingerprint(interaction_matrix, X_features)
+    design_path = os.path.join(cache_dir, f"design_{fingerprint}.npy")
+    labels_path = os.path.join(cache_dir, f"labels_{fingerprint}.npy")
+    if os.path.exists(design_path) and os.path.exists(labels_path):
+        logger.info(f"Reusing cached design matrix {design_path}")
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        X, y = training_rows(interaction_matrix, X_features)
+        _save_npy(design_path, X)
+        _save_npy(labels_path, y)
+        logger.info(f"Cached {X.shape} design matrix to {design_path}")
+    return design_path, labels_path
+
+def evaluate_config(state, params):
+    """
+    Train one learner setting on the shared design matrix (`state`, built by sweep) and measure it.
+    Returns: dict of params, train_seconds, predict latency, holdout RMSE and ranking metrics
+    """
+    X = np.load(state['design_path'], mmap_mode='r')
+    y = np.load(state['labels_path'], mmap_mode='r')
+    start = time.perf_counter()
+    model, scaler = fit_model(X, y, params)
+    train_seconds = time.perf_counter() - start
+
+    sample = scaler.transform(state['predict_sample'])
+    latencies = []
+    for _ in range(3):
+        start = time.perf_counter()
+        model.predict(sample)
+        latencies.append(time.perf_counter() - start)
+
+    engine = MatchEngine(state['store'], state['X_features'], model, scaler, *state['engine_args'])
+    metrics = replay_holdout(engine, state['store'], state['interaction_matrix'], state['holdout_events'],
+                             k=state['k'], workers=1, max_users=state['max_users'], seed=state['seed'])
+    metrics.pop('workers', None)
+    result = {'params': params, 'train_seconds': train_seconds,
+              'predict_ms_per_1k_rows': min(latencies) / len(sample) * 1e6,
+              'holdout_rmse': holdout_rmse(model, scaler, state['holdout_matrix'], state['X_features'])}
+    result.update(metrics)
+    logger.info(f"Sweep {params}: {result}")
+    return result
+
+def sweep(configs, data_dir=None, k=5, holdout_per_user=1, min_history=2, max_users=200, workers=None,
+          cache_dir=None, seed=0):
+    """
+    Evaluate learner settings on a time split. Data is loaded and the design matrix cached once;
+    the configurations then run across a pool of forked workers sharing it.
+    Returns: list of per-configuration results, best holdout NDCG first
+    """
+    config = load_config()
+    cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "matchmaking_sweep")
+    (profiles, liked, matched, blocked_ids, declined_ids,
+     deleted_ids, reported_ids) = load_data(data_dir=data_dir)
+    if profiles is None:
+        raise ValueError("Failed to load data for the sweep")
+    store = ProfileStore.from_profiles(profiles, config['preprocessing']['categorical_columns'],
+                                       config['preprocessing']['keywords'])
+    events = load_interactions(liked, matched)
+    train_events, holdout_events = time_split(events, holdout_per_user, min_history)
+    (_, interaction_matrix, X_features, user_to_idx, profile_to_idx,
+     label_encoders, tfidf) = preprocess_data(profiles, *_split_frames(train_events))
+    design_path, labels_path = cached_design_matrix(interaction_matrix, X_features, cache_dir)
+
+    design = np.load(design_path, mmap_mode='r')
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(len(design), size=min(1000, len(design)), replace=False))
+    state = dict(
+        design_path=design_path, labels_path=labels_path, predict_sample=np.asarray(design[sample_rows]),
+        store=store, X_features=X_features, interaction_matrix=interaction_matrix,
+        holdout_events=holdout_events,
+        holdout_matrix=build_interaction_matrix(*_split_frames(holdout_events), user_to_idx, profile_to_idx),
+        engine_args=(label_encoders, tfidf, user_to_idx, profile_to_idx,
+                     blocked_ids, declined_ids, deleted_ids, reported_ids),
+        k=k, max_users=max_users, seed=seed)
+
+    workers = workers if workers is not None else min(os.cpu_count() or 1, max(len(configs), 1))
+    start = time.perf_counter()
+    results = list(fork_map(evaluate_config, configs, state, workers))
+    logger.info(f"Swept {len(configs)} configurations in {time.perf_counter() - start:.2f}s "
+                f"with {workers} workers")
+    return sorted(results, key=lambda result: (-result[f'ndcg@{k}'], result['holdout_rmse']))
+
+def main():
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep for the compatibility model")
+    parser.add_argument("--data_dir", default=None, help="Data directory (defaults to config)")
+    parser.add_argument("--grid", default=json.dumps(DEFAULT_GRID),
+                        help="JSON object of parameter -> list of values")
+    parser.add_argument("--random", type=int, default=None, help="Evaluate N random combinations instead of all")
+    parser.add_argument("--k", type=int, default=5, help="Cut-off for ranking metrics")
+    parser.add_argument("--max_users", type=int, default=200, help="Held-out users replayed per configuration")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes")
+    parser.add_argument("--cache_dir", default=None, help="Where the design matrix is cached")
+    parser.add_argument("--out", default=None, help="Write results JSON to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    grid = json.loads(args.grid)
+    configs = random_search(grid, args.random) if args.random else parameter_grid(grid)
+    results = sweep(configs, args.data_dir, k=args.k, max_users=args.max_users, workers=args.workers,
+                    cache_dir=args.cache_dir)
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import os
+import logging
+import numpy as np
+import pandas as pd
+from src.data_loader import load_config
+
+logger = logging.getLogger(__name__)
+
+COUNTRIES = [
+    ('Nigeria', 'English'), ('Kenya', 'Swahili'), ('South Africa', 'English'), ('Ghana', 'English'),
+    ('Egypt', 'Arabic'), ('Ethiopia', 'Amharic'), ('Tanzania', 'Swahili'), ('Uganda', 'English'),
+    ('Morocco', 'Arabic'), ('Cameroon', 'French'), ('Senegal', 'French'), ('Ivory Coast', 'French'),
+    ('Zimbabwe', 'English'), ('Zambia', 'English'), ('Rwanda', 'Kinyarwanda'), ('Algeria', 'Arabic'),
+    ('Tunisia', 'Arabic'), ('Angola', 'Portuguese'), ('Mozambique', 'Portuguese'), ('Botswana', 'English'),
+    ('Namibia', 'English'), ('Malawi', 'English'), ('Mali', 'French'), ('DR Congo', 'French'),
+    ('United Kingdom', 'English'), ('United States', 'English'), ('France', 'French'),
+    ('Germany', 'German'), ('Canada', 'English'), ('Brazil', 'Portuguese'),
+]
+LANGUAGES = sorted({language for _, language in COUNTRIES} | {'Yoruba', 'Zulu', 'Hausa', 'Igbo', 'Spanish'})
+RELATIONSHIP_GOALS = ['Long-term', 'Marriage', 'Casual', 'Friendship', 'Not sure', 'unknown']
+RELATIONSHIP_WEIGHTS = [0.38, 0.22, 0.15, 0.12, 0.08, 0.05]
+
+BIO_WORDS = (
+    "love soccer football music travel family faith god friends movies cooking dancing reading "
+    "partner relationship fun honest caring kind loyal adventure beach church laugh smile life "
+    "business work gym fitness nature food wine coffee art fashion photography nursing teacher "
+    "engineer student doctor entrepreneur africa city village sunset weekend hiking running "
+    "respect trust communication simple genuine serious romantic passionate ambitious humble"
+).split()
+BIO_PHRASES = ['soul mate', 'looking for love', 'true love', 'serious relationship', 'life partner',
+               'big soccer fan', 'football every weekend']
+
+def zipf_weights(n, exponent):
+    """Normalised Zipf weights for ranks 1..n."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+def _ids(prefix, indices):
+    return prefix + pd.Series(indices).astype(str).str.zfill(9)
+
+def generate_profiles(rng, start, count):
+    """One chunk of synthetic profiles with Zipf-skewed country/language and realistic ages."""
+    country_idx = rng.choice(len(COUNTRIES), size=count, p=zipf_weights(len(COUNTRIES), 1.1))
+    country = np.array([c for c, _ in COUNTRIES], dtype=object)[country_idx]
+    primary_language = np.array([l for _, l in COUNTRIES], dtype=object)[country_idx]
+    other_language = np.array(LANGUAGES, dtype=object)[
+        rng.choice(len(LANGUAGES), size=count, p=zipf_weights(len(LANGUAGES), 1.0))]
+    language = np.where(rng.random(count) < 0.8, primary_language, other_language)
+
+    # Right-skewed ages: most users in their 20s and 30s, clipped to the supported 18-70 range
+    age = np.clip(np.round(18 + rng.gamma(shape=2.2, scale=5.5, size=count)), 18, 70).astype(int)
+    sex = rng.choice(['Male', 'Female', 'unknown'], size=count, p=[0.56, 0.42, 0.02])
+    opposite = np.where(sex == 'Male', 'Female', 'Male')
+    seeking = np.where(rng.random(count) < 0.95, opposite, sex)
+    seeking = np.where(sex == 'unknown', 'unknown', seeking)
+
+    subscribed = rng.random(count) < 0.2
+    tier = rng.choice(4, size=count, p=[0.5, 0.25, 0.15, 0.1])
+    elite = subscribed & (rng.random(count) < 0.3)
+
+    profiles = pd.DataFrame({
+        '__id__': _ids('p', np.arange(start, start + count)),
+        'userId': _ids('u', np.arange(start, start + count)),
+        'userName': _ids('member', np.arange(start, start + count)),
+        'age': age,
+        'country': country,
+        'language': language,
+        'aboutMe': generate_bios(rng, count),
+        'sex': sex,
+        'seeking': seeking,
+        'relationshipGoals': rng.choice(RELATIONSHIP_GOALS, size=count, p=RELATIONSHIP_WEIGHTS),
+        'subscribed': subscribed,
+        'subscribedEliteOne': elite & (tier == 0),
+        'subscribedEliteThree': elite & (tier == 1),
+        'subscribedEliteSix': elite & (tier == 2),
+        'subscribedEliteTwelve': elite & (tier == 3),
+    })
+    # A small share of incomplete profiles exercises the fillna('unknown') path
+    missing = rng.random(count) < 0.02
+    profiles.loc[missing, 'country'] = np.nan
+    profiles.loc[rng.random(count) < 0.03, 'aboutMe'] = np.nan
+    return profiles
+
+def generate_bios(rng, count):
+    """Bios of 4-40 Zipf-distributed words, with keyword phrases mixed in."""
+    lengths = np.clip(rng.lognormal(mean=2.4, sigma=0.5, size=count).astype(int), 4, 40)
+    words = np.array(BIO_WORDS, dtype=object)
+    word_idx = rng.choice(len(words), size=(count, 40), p=zipf_weights(len(words), 0.9))
+    phrases = np.array(BIO_PHRASES, dtype=object)[rng.integers(len(BIO_PHRASES), size=count)]
+    with_phrase = rng.random(count) < 0.35
+    bios = []
+    for row, length, phrase, add_phrase in zip(word_idx, lengths, phrases, with_phrase):
+        text = ' '.join(words[row[:length]])
+        bios.append(f"{text} {phrase}" if add_phrase else text)
+    return bios
+
+def generate_interactions(rng, n_profiles, mean_likes=8.0, match_rate=0.12):
+    """
+    Power-law likes: per-user activity is Pareto distributed and targets follow Zipf popularity.
+    Returns: liked, matched DataFrames with userId/__id__ columns
+    """
+    activity = rng.pareto(1.5, size=n_profiles) + 1.0
+    likes_per_user = np.minimum(rng.poisson(activity / activity.mean() * mean_likes), max(n_profiles - 1, 1))
+    total = int(likes_per_user.sum())
+    likers = np.repeat(np.arange(n_profiles), likes_per_user)
+    # Zipf popularity over a random permutation of profiles
+    popularity_rank = rng.permutation(n_profiles)
+    ranks = np.minimum(rng.zipf(1.3, size=total) - 1, n_profiles - 1)
+    targets = popularity_rank[ranks]
+    keep = targets != likers
+    likers, targets = likers[keep], targets[keep]
+    pairs = pd.DataFrame({'liker': likers, 'target': targets}).drop_duplicates()
+    liked = pd.DataFrame({'userId': _ids('u', pairs['liker'].to_numpy()),
+                          '__id__': _ids('p', pairs['target'].to_numpy())})
+    matched = liked[rng.random(len(liked)) < match_rate].reset_index(drop=True)
+    return liked, matched
+
+def generate_dataset(n_profiles, out_dir, seed=0, chunk_size=500_000, config=None):
+    """
+    Write all seven CSVs named in config['data'] for a synthetic population.
+    Returns: dict of row counts per file
+    """
+    config = config or load_config()
+    files = config['data']
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    profiles_path = os.path.join(out_dir, files['profiles_file'])
+    for start in range(0, n_profiles, chunk_size):
+        chunk = generate_profiles(rng, start, min(chunk_size, n_profiles - start))
+        chunk.to_csv(profiles_path, index=False, mode='w' if start == 0 else 'a', header=start == 0)
+
+    liked, matched = generate_interactions(rng, n_profiles)
+    liked.to_csv(os.path.join(out_dir, files['liked_file']), index=False)
+    matched.to_csv(os.path.join(out_dir, files['matched_file']), index=False)
+
+    counts = {files['profiles_file']: n_profiles, files['liked_file']: len(liked),
+              files['matched_file']: len(matched)}
+    for key, rate in [('blocked_file', 0.01), ('declined_file', 0.03),
+                      ('deleted_file', 0.005), ('reported_file', 0.002)]:
+        ids = np.flatnonzero(rng.random(n_profiles) < rate)
+        pd.DataFrame({'__id__': _ids('p', ids)}).to_csv(os.path.join(out_dir, files[key]), index=False)
+        counts[files[key]] = len(ids)
+
+    logger.info(f"Generated synthetic dataset in {out_dir}: {counts}")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic matchmaking dataset")
+    parser.add_argument("--profiles", type=int, default=100_000, help="Number of profiles")
+    parser.add_argument("--out_dir", default="data/synthetic", help="Output directory")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    generate_dataset(args.profiles, args.out_dir, seed=args.seed)
+
+if __name__ == "__main__":
+    main()
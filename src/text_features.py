@@ -0,0 +1,227 @@
+import hashlib
+import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+from src.parallel import fork_map
+
+logger = logging.getLogger(__name__)
+
+def text_digests(texts):
+    """16-byte content hash per text (missing texts hash as '')."""
+    return np.array([hashlib.blake2b(str(text).encode('utf-8'), digest_size=16).digest()
+                     for text in texts], dtype='S16')
+
+def analyzer_fingerprint(tfidf_params):
+    """Digest of the settings that change tokenisation (not vocabulary selection or weighting)."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    params = TfidfVectorizer(**tfidf_params).get_params()
+    for key in ('max_features', 'min_df', 'max_df', 'vocabulary', 'dtype', 'norm', 'use_idf',
+                'smooth_idf', 'sublinear_tf'):
+        params.pop(key, None)
+    return hashlib.sha1(repr(sorted(params.items(), key=lambda item: item[0])).encode()).hexdigest()[:12]
+
+def _tokenise_chunk(analyzer, texts):
+    """Tokens of a chunk as chunk-local ids: (terms in first-seen order, per-text lengths, flat local ids)."""
+    local = {}
+    lengths = np.empty(len(texts), dtype=np.int64)
+    flat = []
+    for i, text in enumerate(texts):
+        tokens = analyzer(text)
+        lengths[i] = len(tokens)
+        flat.extend(local.setdefault(term, len(local)) for term in tokens)
+    return list(local), lengths, np.array(flat, dtype=np.int32)
+
+class TokenCache:
+    """
+    Token-id arrays per text content hash. Ids index an append-only term dictionary, so entries
+    stay valid as new bios add terms; only texts whose hash is not cached are tokenised.
+    """
+
+    def __init__(self):
+        self.terms = []
+        self.term_ids = {}
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def term_array(self):
+        return np.array(self.terms, dtype=object)
+
+    def add_chunk(self, digests, terms, lengths, local_ids):
+        """Map a tokenised chunk's local term ids to dictionary ids and store it per digest."""
+        remap = np.empty(len(terms), dtype=np.int32)
+        for i, term in enumerate(terms):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                term_id = self.term_ids[term] = len(self.terms)
+                self.terms.append(term)
+            remap[i] = term_id
+        ids = remap[local_ids] if len(local_ids) else local_ids
+        for digest, part in zip(digests, np.split(ids, np.cumsum(lengths)[:-1])):
+            self.entries[digest] = part
+
+    def save(self, path):
+        """Persist as one .npz (term dictionary, digests, offsets, flat ids), written atomically."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        digests = list(self.entries)
+        parts = [self.entries[d] for d in digests]
+        lengths = np.fromiter((len(p) for p in parts), dtype=np.int64, count=len(parts))
+        with open(path + ".tmp", 'wb') as f:
+            np.savez(f, terms=np.array(self.terms, dtype=str), digests=np.array(digests, dtype='S16'),
+                     lengths=lengths, ids=np.concatenate(parts) if parts else np.empty(0, dtype=np.int32))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        cache = cls()
+        with np.load(path, allow_pickle=False) as data:
+            cache.terms = data['terms'].tolist()
+            cache.term_ids = {term: i for i, term in enumerate(cache.terms)}
+            parts = np.split(data['ids'], np.cumsum(data['lengths'])[:-1]) if len(data['lengths']) else []
+            cache.entries = dict(zip(data['digests'].tolist(), parts))
+        return cache
+
+def tokenise(texts, tfidf_params, cache=None, workers=None, chunk_size=20000):
+    """
+    Token ids for every text, through the cache: cached texts are looked up by content hash,
+    the rest are tokenised with the vectorizer's own analyzer in chunks across forked workers.
+    Returns: cache, list of token-id arrays (one per text)
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    cache = cache if cache is not None else TokenCache()
+    texts = pd.Series(texts, dtype=object).fillna('').astype(str).to_numpy()
+    digests = text_digests(texts)
+    missing = np.flatnonzero(~pd.Index(digests).isin(list(cache.entries))) if len(cache) else np.arange(len(texts))
+    # Identical bios are tokenised once
+    _, first = np.unique(digests[missing], return_index=True)
+    missing = missing[np.sort(first)]
+    if len(missing):
+        analyzer = TfidfVectorizer(**tfidf_params).build_analyzer()
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        workers = workers if workers is not None else min(os.cpu_count() or 1, len(chunks))
+        results = list(fork_map(_tokenise_chunk, [texts[rows] for rows in chunks], analyzer, workers))
+        for rows, (terms, lengths, local_ids) in zip(chunks, results):
+            cache.add_chunk(digests[rows].tolist(), terms, lengths, local_ids)
+    logger.info(f"Tokenised {len(missing)} of {len(texts)} texts ({len(texts) - len(missing)} cache hits)")
+    return cache, [cache.entries[digest] for digest in digests.tolist()]
+
+def select_vocabulary(terms, counts, params):
+    """
+    Vocabulary selection as TfidfVectorizer.fit does it: terms in sorted order, filtered by
+    min_df/max_df, then the max_features most frequent ones (same argsort, so same tie-breaks).
+    Returns: positions into `terms` of the selected terms, in sorted term order
+    """
+    n_docs = counts.shape[0]
+    order = np.argsort(terms.astype(str), kind='stable')
+    counts = counts[:, order]
+    df = np.bincount(counts.indices, minlength=counts.shape[1])
+    tfs = np.asarray(counts.sum(axis=0)).ravel()
+    min_df, max_df = params.get('min_df', 1), params.get('max_df', 1.0)
+    min_count = min_df if isinstance(min_df, (int, np.integer)) else min_df * n_docs
+    max_count = max_df if isinstance(max_df, (int, np.integer)) else max_df * n_docs
+    mask = (df >= min_count) & (df <= max_count) & (df > 0)
+    keep = np.flatnonzero(mask)
+    max_features = params.get('max_features')
+    if max_features is not None and len(keep) > max_features:
+        keep = np.sort(keep[(-tfs[keep]).argsort()[:max_features]])
+    return order[keep]
+
+def fit_text_features(texts, tfidf_params, cache_dir=None, workers=None, chunk_size=20000):
+    """
+    TF-IDF features equivalent to TfidfVectorizer(**tfidf_params).fit_transform(texts), built
+    from cached token ids: only new or edited bios are tokenised, in parallel chunks. The
+    returned vectorizer is a regular fitted TfidfVectorizer (fixed vocabulary and idf_), so it
+    pickles and transforms exactly as before.
+    Returns: fitted vectorizer, CSR tf-idf matrix
+    """
+    from scipy.sparse import csr_matrix
+    from sklearn.feature_extraction.text import TfidfVectorizer, TfidfTransformer
+
+    start = time.perf_counter()
+    vectorizer = TfidfVectorizer(**tfidf_params)
+    params = vectorizer.get_params()
+    cache_path = None
+    cache = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, f"tokens_{analyzer_fingerprint(tfidf_params)}.npz")
+        if os.path.exists(cache_path):
+            cache = TokenCache.load(cache_path)
+    n_cached = len(cache) if cache is not None else 0
+    cache, token_ids = tokenise(texts, tfidf_params, cache, workers, chunk_size)
+    if cache_path and len(cache) != n_cached:
+        cache.save(cache_path)
+
+    lengths = np.fromiter((len(ids) for ids in token_ids), dtype=np.int64, count=len(token_ids))
+    flat = np.concatenate(token_ids) if len(token_ids) else np.empty(0, dtype=np.int32)
+    counts = csr_matrix((np.ones(len(flat), dtype=np.int64), (np.repeat(np.arange(len(token_ids)), lengths), flat)),
+                        shape=(len(token_ids), len(cache.terms)))
+    counts.sum_duplicates()
+    selected = select_vocabulary(cache.term_array(), counts, params)
+    if not len(selected):
+        raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+    counts = counts[:, selected].astype(np.float64)
+
+    vectorizer.set_params(vocabulary={term: i for i, term in enumerate(cache.term_array()[selected])})
+    transformer = TfidfTransformer(norm=params['norm'], use_idf=params['use_idf'],
+                                   smooth_idf=params['smooth_idf'], sublinear_tf=params['sublinear_tf'])
+    tfidf_matrix = transformer.fit_transform(counts)
+    if params['use_idf']:
+        vectorizer.idf_ = transformer.idf_
+    else:
+        vectorizer.fit(list(pd.Series(texts, dtype=object).fillna('').astype(str)[:1]))
+    logger.info(f"Text features for {len(token_ids)} bios in {time.perf_counter() - start:.2f}s")
+    return vectorizer, tfidf_matrix.tocsr()
+
+class FrozenVocabulary:
+    """
+    Serve-time single-document TF-IDF: the fitted vocabulary as a sorted term array (looked up
+    with searchsorted) plus idf weights, skipping the vectorizer's per-call validation and
+    sparse-matrix round trip. Tokenisation is the vectorizer's own analyzer.
+    """
+
+    def __init__(self, terms, idf, analyzer, norm='l2', sublinear_tf=False):
+        self.terms = np.asarray(terms, dtype=str)
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.analyzer = analyzer
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+
+    @classmethod
+    def from_vectorizer(cls, tfidf):
+        """Freeze a fitted TfidfVectorizer (or return None if it uses custom, non-sorted indices)."""
+        vocabulary = tfidf.vocabulary_
+        terms = sorted(vocabulary, key=vocabulary.get)
+        if terms != sorted(terms):
+            return None
+        idf = tfidf.idf_ if tfidf.use_idf else np.ones(len(terms))
+        return cls(terms, idf, tfidf.build_analyzer(), tfidf.norm, tfidf.sublinear_tf)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def transform_one(self, text):
+        """Dense tf-idf row for one document, equal to tfidf.transform([text]).toarray()[0]."""
+        row = np.zeros(len(self.terms))
+        tokens = self.analyzer(str(text))
+        if not tokens:
+            return row
+        tokens = np.asarray(tokens, dtype=str)
+        positions = np.minimum(np.searchsorted(self.terms, tokens), len(self.terms) - 1)
+        positions = positions[self.terms[positions] == tokens]
+        if not len(positions):
+            return row
+        np.add.at(row, positions, 1.0)
+        if self.sublinear_tf:
+            present = row > 0
+            row[present] = np.log(row[present]) + 1.0
+        row *= self.idf
+        if self.norm == 'l2':
+            row /= np.sqrt(np.dot(row, row))
+        elif self.norm == 'l1':
+            row /= np.abs(row).sum()
+        return row
@@ -1,19 +1,20 @@
-import joblib
 import os
+import atexit
 import pandas as pd
 import logging
 from src.data_loader import load_config
+from src.recommendation_sink import RecommendationSink, reason_bitmask, decode_reasons
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def save_models(model, scaler, label_encoders, tfidf, user_to_idx, profile_to_idx, models_dir=None):
     """
     Save trained models and encoders to models_dir.
     """
+    import joblib
+
     config = load_config()
-    models_dir = models_dir or config['models_dir']
+    models_dir = models_dir or config['model']['models_dir']
     
     try:
         os.makedirs(models_dir, exist_ok=True)
@@ -28,23 +29,35 @@ def save_models(model, scaler, label_encoders, tfidf, user_to_idx, profile_to_id
         logger.error(f"Error saving models: {e}")
         raise
 
+def create_recommendation_sink(model_version=None):
+    """
+    Create and start the asynchronous recommendation log configured under `recommendation_log`.
+    The sink is drained at interpreter exit; callers may close() it earlier.
+    """
+    config = load_config()
+    log_config = config.get('recommendation_log', {})
+    log_dir = log_config.get('log_dir') or os.path.join(config['data']['data_dir'], 'recommendation_log')
+    sink = RecommendationSink(
+        log_dir,
+        batch_size=log_config.get('batch_size', 500),
+        flush_interval=log_config.get('flush_interval_seconds', 1.0),
+        max_queue_size=log_config.get('max_queue_size', 10000),
+        max_file_bytes=int(log_config.get('max_file_mb', 64) * 1024 * 1024),
+        model_version=model_version
+    )
+    atexit.register(sink.close)
+    return sink.start()
+
 def save_recommendations(top_matches, output_dir=None):
     """
     Save top matches to CSV.
     """
     config = load_config()
-    output_dir = output_dir or config['data_dir']
+    output_dir = output_dir or config['data']['data_dir']
     
     try:
         recommendations = top_matches[['__id__', 'userName', 'final_score']].copy()
-        recommendations['reasons'] = top_matches.apply(
-            lambda row: [
-                "Country match" if row['country_match'] else None,
-                "Language match" if row['language_match'] else None,
-                "Relationship goals match" if row['goal_match'] else None,
-                "High ML compatibility" if row['ml_score'] > 0.5 else None,
-                "Subscribed user" if row['subscribed_score'] > 0 else None
-            ], axis=1)
+        recommendations['reasons'] = [decode_reasons(mask) for mask in reason_bitmask(top_matches)]
         os.makedirs(output_dir, exist_ok=True)
         output_path = os.path.join(output_dir, "recommendations.csv")
         recommendations.to_csv(output_path, index=False)
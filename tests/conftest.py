@@ -0,0 +1,52 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+import pandas as pd
+from src.profile_store import ProfileStore
+from src.preprocessing import preprocess_data
+from src.recommender import train_model
+
+@pytest.fixture
+def engine_inputs():
+    """Small end-to-end dataset: 8 profiles with likes and matches."""
+    n = 8
+    profiles = pd.DataFrame({
+        '__id__': [f'profile{i}' for i in range(n)],
+        'userId': [f'user{i}' for i in range(n)],
+        'userName': [f'Name{i}' for i in range(n)],
+        'age': [25, 26, 27, 28, 29, 30, 24, 45],
+        'country': ['Kenya', 'Nigeria'] * 4,
+        'language': ['Swahili', 'English'] * 4,
+        'aboutMe': ['Love soccer', 'Enjoy music', 'Seeking soul mate', 'Football fan',
+                    'Love travel', 'Partner wanted', 'Soccer and love', 'Reading'],
+        'sex': ['Female', 'Male'] * 4,
+        'seeking': ['Male', 'Female'] * 4,
+        'relationshipGoals': ['Long-term', 'Casual'] * 4,
+        'subscribed': [True, False] * 4,
+        'subscribedEliteOne': [False] * n,
+        'subscribedEliteThree': [False] * n,
+        'subscribedEliteSix': [False] * n,
+        'subscribedEliteTwelve': [False] * n
+    })
+    liked = pd.DataFrame({'userId': ['user1', 'user3', 'user5'], '__id__': ['profile0', 'profile2', 'profile4']})
+    matched = pd.DataFrame({'userId': ['user1', 'user5'], '__id__': ['profile2', 'profile6']})
+    store = ProfileStore.from_profiles(profiles, keywords=['love', 'soccer'])
+    (_, interaction_matrix, X_features, user_to_idx, profile_to_idx,
+     label_encoders, tfidf) = preprocess_data(profiles.copy(), liked, matched)
+    model, scaler = train_model(interaction_matrix, X_features)
+    return store, X_features, model, scaler, label_encoders, tfidf, user_to_idx, profile_to_idx
+
+@pytest.fixture
+def user_profile():
+    return {
+        'userId': 'user1',
+        'age': 27,
+        'sex': 'Male',
+        'seeking': 'Female',
+        'country': 'Kenya',
+        'language': 'Swahili',
+        'relationshipGoals': 'Long-term',
+        'aboutMe': 'Looking for true love and enjoy soccer'
+    }
@@ -7,7 +7,8 @@ import pandas as pd
 import numpy as np
 from sklearn.preprocessing import LabelEncoder
 from sklearn.feature_extraction.text import TfidfVectorizer
-from src.agent import apply_rules, encode_user_profile, validate_user_profile
+from src.agent import apply_rules, apply_rules_compact, encode_user_profile, validate_user_profile
+from src.profile_store import ProfileStore
 from src.data_loader import load_config
 
 @pytest.fixture
@@ -90,4 +91,15 @@ def test_encode_user_profile(sample_user_profile, sample_label_encoders, sample_
     assert len(user_features) >= 12 + 50, "Features should include numeric (12) + TF-IDF (50)"
     assert user_features[5] == 27, "Age should be 27"
     assert user_features[6:11].sum() == 0, "Subscribed flags should be 0"
-    assert user_features[11] > 0, "Keyword score should be positive due to love"
\ No newline at end of file
+    assert user_features[11] > 0, "Keyword score should be positive due to love"
+
+def test_apply_rules_compact(sample_profiles, sample_user_profile):
+    store = ProfileStore.from_profiles(sample_profiles)
+    filtered = apply_rules_compact(store, sample_user_profile, ['profile3'], [], [], [])
+    
+    assert filtered.shape[0] == 1, "Should filter to 1 profile"
+    assert filtered['__id__'].iloc[0] == 'profile1', "Profile1 should be selected"
+    assert filtered['country_match'].iloc[0] == True, "Country should match"
+    assert filtered['goal_match'].iloc[0] == True, "Relationship goals should match"
+    assert filtered['subscribed_score'].iloc[0] == 1, "Subscribed score should be 1"
+    assert store.resolve(filtered)['userName'].iloc[0] == 'Amani', "Resolved name should be Amani"
@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import io
+import json
+import pytest
+from src.batch import check_profile, run_batch
+from src.pipeline import MatchEngine
+
+class ListSink:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, user_id, top_matches):
+        self.submitted.append((user_id, len(top_matches)))
+
+def batch_input(user_profile, n=5):
+    lines = []
+    for i in range(n):
+        lines.append(json.dumps(dict(user_profile, userId=f'user{i % 8}')))
+    lines.insert(2, json.dumps(dict(user_profile, age=12)))
+    lines.insert(4, "not json")
+    lines.insert(5, "")
+    return "\n".join(lines) + "\n"
+
+def test_check_profile(user_profile):
+    check_profile(user_profile)
+    with pytest.raises(ValueError, match="Age"):
+        check_profile(dict(user_profile, age=90))
+    with pytest.raises(ValueError, match="Missing"):
+        check_profile({k: v for k, v in user_profile.items() if k != 'aboutMe'})
+
+def test_run_batch_ordered_with_errors(engine_inputs, user_profile):
+    sink = ListSink()
+    out = io.StringIO()
+    summary = run_batch(MatchEngine(*engine_inputs), io.StringIO(batch_input(user_profile)), out,
+                        chunk_size=2, sink=sink, top_k=3)
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert summary['requests'] == 7, "Every non-blank line should produce a record"
+    assert summary['errors'] == 2, "Invalid profile and malformed JSON should be reported"
+    assert [r['line'] for r in records] == sorted(r['line'] for r in records), "Output should keep input order"
+    assert 'Age' in records[2]['error'], "Validation error should be reported for its line"
+    assert 'error' in records[4], "Malformed JSON should be reported for its line"
+    assert all(len(r['matches']) <= 3 for r in records if 'matches' in r), "Matches should respect top_k"
+    assert len(sink.submitted) == sum(1 for r in records if r.get('matches')), \
+        "Non-empty results should be persisted once each"
+
+def test_run_batch_workers_match_serial(engine_inputs, user_profile):
+    text = batch_input(user_profile)
+    serial, parallel = io.StringIO(), io.StringIO()
+    run_batch(MatchEngine(*engine_inputs), io.StringIO(text), serial, chunk_size=2)
+    run_batch(MatchEngine(*engine_inputs), io.StringIO(text), parallel, chunk_size=2, workers=2)
+    assert parallel.getvalue() == serial.getvalue(), "Worker pool should produce the serial output"
@@ -0,0 +1,45 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+import pandas as pd
+from src.synthetic import generate_dataset
+from src.data_loader import load_data
+from src.benchmark import run_benchmarks, compare_to_baseline
+
+@pytest.fixture
+def synthetic_dir(tmp_path):
+    data_dir = tmp_path / "synthetic"
+    generate_dataset(600, str(data_dir), seed=1)
+    return str(data_dir)
+
+def test_generate_dataset_loads(synthetic_dir):
+    profiles, liked, matched, blocked_ids, declined_ids, deleted_ids, reported_ids = load_data(data_dir=synthetic_dir)
+    assert profiles is not None, "Synthetic data should pass schema validation"
+    assert len(profiles) == 600, "Expected 600 profiles"
+    assert len(liked) > len(matched) > 0, "Matches should be a subset of likes"
+    assert profiles['age'].between(18, 70).all(), "Ages should be in the supported range"
+
+def test_generate_dataset_is_skewed_and_seeded(synthetic_dir, tmp_path):
+    profiles = pd.read_csv(os.path.join(synthetic_dir, "Profiles.csv"))
+    counts = profiles['country'].value_counts()
+    assert counts.iloc[0] > 3 * counts.iloc[-1], "Country distribution should be Zipf-skewed"
+    generate_dataset(600, str(tmp_path / "again"), seed=1)
+    again = pd.read_csv(tmp_path / "again" / "Profiles.csv")
+    pd.testing.assert_frame_equal(profiles, again, obj="Same seed should give identical data")
+
+def test_run_benchmarks_tiny(tmp_path):
+    results = run_benchmarks(['300'], str(tmp_path), n_queries=3, profile_memory=True)
+    stages = results['tiers']['300']['stages']
+    for stage in ['load_data', 'preprocess_data', 'train_model', 'apply_rules']:
+        assert stage in stages, f"{stage} should be benchmarked"
+    assert stages['load_data']['peak_mb'] > 0, "Memory should be profiled"
+    assert compare_to_baseline(results, results) == [], "A run should not regress against itself"
+
+def test_compare_to_baseline_flags_regressions():
+    baseline = {'tiers': {'small': {'stages': {'apply_rules': {'seconds': 1.0, 'peak_mb': 10.0}}}}}
+    current = {'tiers': {'small': {'stages': {'apply_rules': {'seconds': 1.5, 'peak_mb': 10.5}}}}}
+    regressions = compare_to_baseline(current, baseline, threshold=0.25)
+    assert len(regressions) == 1, "Only the time regression exceeds the threshold"
+    assert 'small/apply_rules seconds' in regressions[0], "Regression should name tier, stage and metric"
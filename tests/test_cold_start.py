@@ -0,0 +1,70 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from src.cold_start import build_cold_start_tables, ColdStartTable, load_cold_start
+from src.agent import add_match_flags
+from src.pipeline import MatchEngine
+from src.recommender import predict_compatibility, item_prior_scores, reference_users
+
+def build_tables(engine_inputs, out_dir):
+    store, X_features, model, scaler, _, _, user_to_idx, profile_to_idx = engine_inputs
+    # profile2 received a like and a match, profile0 a like
+    interaction_matrix = csr_matrix(([1.0, 2.0, 1.0], ([0, 1, 2], [2, 2, 0])),
+                                    shape=(len(user_to_idx), len(profile_to_idx)))
+    return build_cold_start_tables(store, X_features, model, scaler, interaction_matrix, profile_to_idx,
+                                   str(out_dir), top_n=3, model_version='v1')
+
+def test_unknown_viewer_not_scored_as_user_zero(engine_inputs, user_profile):
+    store, X_features, model, scaler, _, _, user_to_idx, profile_to_idx = engine_inputs
+    candidates = add_match_flags(store, store.table.iloc[[0, 2, 4]].copy(), user_profile)
+    scored = predict_compatibility(model, scaler, 'newcomer', candidates.copy(), X_features,
+                                   user_to_idx, profile_to_idx)
+    items = candidates['__id__'].map(profile_to_idx).to_numpy()
+    expected = item_prior_scores(model, scaler, X_features, items, users=reference_users(len(user_to_idx)))
+    assert np.allclose(scored['ml_score'], expected), "Unknown viewers should get item-side prior scores"
+
+def test_build_and_lookup(engine_inputs, user_profile, tmp_path):
+    store = engine_inputs[0]
+    meta = build_tables(engine_inputs, tmp_path)
+    assert meta['segments'] > 0 and meta['entries'] <= 3 * meta['segments'], "Segments should hold at most top_n rows"
+    table = ColdStartTable(str(tmp_path))
+    assert isinstance(table.rows, np.memmap), "Tables should be memory-mapped"
+    viewer = dict(user_profile, userId='newcomer')
+    rows, priors = table.candidates(store, viewer)
+    candidates = store.table.iloc[rows]
+    assert (candidates['sex'] == store.code_for('sex', 'Female')).all(), "Segment should match the seeking rule"
+    assert (abs(candidates['age'].astype(int) - viewer['age']) <= 5).all(), "The exact age window should be applied"
+    excluded = store.table['__id__'].isin([candidates['__id__'].iloc[0]]).to_numpy()
+    rows_after, _ = table.candidates(store, viewer, excluded)
+    assert len(rows_after) == len(rows) - 1, "Excluded profiles should be filtered out"
+    assert table.candidates(store, dict(viewer, age=90)) is None, "Missing segments should return None"
+
+def test_engine_serves_unknown_viewers_from_tables(engine_inputs, user_profile, tmp_path):
+    build_tables(engine_inputs, tmp_path)
+    engine = MatchEngine(*engine_inputs, blocked_ids=['profile2'], cold_start=ColdStartTable(str(tmp_path)))
+    top_matches = engine.recommend(dict(user_profile, userId='newcomer'), top_k=2)
+    assert top_matches.attrs.get('cold_start'), "Unknown viewers should be served from the tables"
+    assert 0 < len(top_matches) <= 2, "Should return at most top_k matches"
+    assert 'profile2' not in top_matches['__id__'].tolist(), "Exclusions should apply to cold-start results"
+    assert top_matches['country'].iloc[0] in ('Kenya', 'Nigeria'), "Columns should be resolved for display"
+    known = engine.recommend(user_profile, top_k=2)
+    assert not known.attrs.get('cold_start'), "Known viewers should take the full scoring pass"
+
+def test_load_cold_start_rejects_other_profile_sets(engine_inputs, tmp_path):
+    store = engine_inputs[0]
+    build_tables(engine_inputs, tmp_path)
+    config = {'cold_start': {'enabled': True, 'table_dir': str(tmp_path)}}
+    assert load_cold_start(config, store, 'v1') is not None, "Tables built for this store should load"
+    assert load_cold_start(config, store.subset(np.arange(4)), 'v1') is None, "Stale tables should be ignored"
+    assert load_cold_start({'cold_start': {'enabled': False, 'table_dir': str(tmp_path)}}, store, 'v1') is None
+
+def test_load_cold_start_rejects_other_model_versions(engine_inputs, tmp_path):
+    store = engine_inputs[0]
+    build_tables(engine_inputs, tmp_path / "tables")
+    config = {'cold_start': {'enabled': True, 'table_dir': str(tmp_path / "tables")},
+              'model': {'models_dir': str(tmp_path / "models")}}
+    assert load_cold_start(config, store, 'v2') is None, "Tables from a replaced model should be ignored"
+    assert load_cold_start(config, store) is None, "With no saved model the live version is 'untrained'"
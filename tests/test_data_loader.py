@@ -6,7 +6,7 @@ import pytest
 import pandas as pd
 import os
 import yaml
-from src.data_loader import load_data, load_config, validate_csv_schema
+from src.data_loader import load_data, load_config, validate_csv_schema, validate_csv_header, dedupe_profiles
 
 @pytest.fixture
 def data_dir(tmp_path):
@@ -117,4 +117,59 @@ def test_load_config_missing():
     assert config is not None, "Config should not be None for missing file"
     assert isinstance(config, dict), "Config should be a dictionary"
     assert "preprocessing" in config, "Default config should have 'preprocessing'"
-    assert "categorical_columns" in config["preprocessing"], "Default config should have 'categorical_columns'"
\ No newline at end of file
+    assert "categorical_columns" in config["preprocessing"], "Default config should have 'categorical_columns'"
+
+def test_dedupe_profiles_last_row_wins():
+    """Test key-based deduplication by row order."""
+    profiles = pd.DataFrame({'__id__': ['a', 'b', 'a'], 'userName': ['old', 'Bob', 'new']})
+    deduped = dedupe_profiles(profiles, key='__id__')
+    assert len(deduped) == 2, "Expected 2 profiles after dedupe"
+    assert deduped.loc[deduped['__id__'] == 'a', 'userName'].iloc[0] == 'new', "Last row should win"
+
+def test_dedupe_profiles_updated_at_wins():
+    """Test key-based deduplication by updatedAt column."""
+    profiles = pd.DataFrame({
+        '__id__': ['a', 'b', 'a'],
+        'userName': ['newer', 'Bob', 'older'],
+        'updatedAt': ['2024-03-01', '2024-01-01', '2024-02-01']
+    })
+    deduped = dedupe_profiles(profiles, key='__id__', updated_at_column='updatedAt')
+    assert deduped['__id__'].tolist() == ['a', 'b'], "Original row order should be kept"
+    assert deduped['userName'].iloc[0] == 'newer', "Latest updatedAt should win"
+
+def test_dedupe_profiles_invalid_updated_at_loses():
+    """Test that missing or unparseable timestamps never win last-write-wins."""
+    profiles = pd.DataFrame({
+        '__id__': ['a', 'a', 'b', 'b'],
+        'userName': ['valid', 'garbage', 'valid', 'missing'],
+        'updatedAt': ['2024-03-01', 'garbage', '2024-01-01', None]
+    })
+    deduped = dedupe_profiles(profiles, key='__id__', updated_at_column='updatedAt')
+    assert deduped['userName'].tolist() == ['valid', 'valid'], "A valid timestamp should beat a bad one"
+
+def test_validate_csv_header(tmp_path):
+    """Test header validation before the body is parsed."""
+    path = tmp_path / "Profiles.csv"
+    path.write_text("__id__,userId\n1,user1\n")
+    assert validate_csv_header(str(path), ['__id__'], "Profiles.csv") == ['__id__', 'userId']
+    with pytest.raises(ValueError):
+        validate_csv_header(str(path), ['__id__', 'age'], "Profiles.csv")
+
+def test_load_data_explicit_dtypes(data_dir, config_file):
+    """Test that load_data parses with narrow dtypes."""
+    profiles = load_data(data_dir=data_dir)[0]
+    assert isinstance(profiles['country'].dtype, pd.CategoricalDtype), "Categorical columns should be category dtype"
+    assert profiles['subscribed'].dtype == bool, "Subscription flags should stay boolean"
+    assert profiles['__id__'].tolist() == ['1', '2'], "IDs should be parsed as strings"
+
+def test_load_data_coerces_dirty_values(data_dir, config_file):
+    """Test that unparseable flags and ages are coerced instead of failing the load."""
+    path = os.path.join(data_dir, "Profiles.csv")
+    profiles = pd.read_csv(path, dtype=str)
+    profiles.loc[0, 'subscribed'] = 'unknown'
+    profiles.loc[1, 'age'] = 'thirty'
+    profiles.to_csv(path, index=False)
+    loaded = load_data(data_dir=data_dir)[0]
+    assert loaded is not None, "A dirty cell should not fail the whole load"
+    assert loaded['subscribed'].tolist() == [False, False], "Unrecognised flags should be False"
+    assert loaded['age'].iloc[0] == 25 and pd.isna(loaded['age'].iloc[1]), "Non-numeric ages should be NaN"
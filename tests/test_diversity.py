@@ -0,0 +1,51 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+import numpy as np
+from scipy.sparse import csr_matrix
+from src.diversity import pair_similarity, mmr_rerank, diversity_metrics
+
+@pytest.fixture
+def shortlist():
+    """Four candidates: rows 0-2 are near-duplicates, row 3 differs in text and country."""
+    text_rows = csr_matrix(np.array([
+        [1.0, 0.0, 0.0],
+        [1.0, 0.0, 0.0],
+        [0.8, 0.6, 0.0],
+        [0.0, 0.0, 1.0],
+    ]))
+    codes = np.array([[0, 1], [0, 1], [0, 1], [2, 1]])
+    relevance = np.array([0.9, 0.89, 0.88, 0.7])
+    return relevance, text_rows, codes
+
+def test_pair_similarity(shortlist):
+    _, text_rows, codes = shortlist
+    similarity = pair_similarity(text_rows, codes, 0)
+    assert similarity[0] == pytest.approx(1.0), "A row should be fully similar to itself"
+    assert similarity[3] == pytest.approx(0.25), "Only the shared category should count"
+
+def test_mmr_rerank_promotes_diverse_candidate(shortlist):
+    relevance, text_rows, codes = shortlist
+    order = mmr_rerank(relevance, text_rows, codes, k=2, mmr_lambda=0.5)
+    assert order[0] == 0, "The most relevant candidate should be picked first"
+    assert order[1] == 3, "The dissimilar candidate should beat near-duplicates"
+
+def test_mmr_rerank_lambda_one_is_relevance_order(shortlist):
+    relevance, text_rows, codes = shortlist
+    order = mmr_rerank(relevance, text_rows, codes, k=4, mmr_lambda=1.0)
+    assert order.tolist() == [0, 1, 2, 3], "lambda=1 should ignore diversity"
+
+def test_mmr_rerank_short_list(shortlist):
+    relevance, text_rows, codes = shortlist
+    assert len(mmr_rerank(relevance, text_rows, codes, k=10)) == 4, "k is capped at the shortlist size"
+    assert len(mmr_rerank(relevance[:0], text_rows[:0], codes[:0], k=3)) == 0
+
+def test_diversity_metrics(shortlist):
+    _, text_rows, codes = shortlist
+    clustered = diversity_metrics(text_rows[:3], codes[:3], ['country', 'goal'])
+    mixed = diversity_metrics(text_rows[[0, 3]], codes[[0, 3]], ['country', 'goal'])
+    assert mixed['intra_list_diversity'] > clustered['intra_list_diversity'], "Mixed list should be more diverse"
+    assert mixed['distinct_country'] == 2
+    assert clustered['distinct_goal'] == 1
@@ -0,0 +1,43 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from src.evaluation import time_split, ranking_metrics, evaluate
+from src.synthetic import generate_dataset
+
+def test_time_split_holds_out_most_recent():
+    events = pd.DataFrame({
+        'userId': ['u1', 'u1', 'u1', 'u2', 'u1'],
+        '__id__': ['a', 'b', 'c', 'a', 'd'],
+        'weight': [1, 1, 2, 1, 1],
+        'order': [0, 1, 2, 3, 4]
+    })
+    train, holdout = time_split(events, holdout_per_user=1, min_history=2)
+    assert holdout['__id__'].tolist() == ['d'], "u1's latest interaction should be held out"
+    assert 'u2' in train['userId'].tolist(), "Users with too little history stay in training"
+    assert len(train) == 4, "Everything else is training data"
+
+def test_ranking_metrics():
+    # user 0: relevant item 1 recommended at rank 0; user 1: relevant item 2 not recommended
+    holdout = csr_matrix(([1.0, 1.0], ([0, 1], [1, 2])), shape=(2, 4))
+    rec_users = np.array([0, 0, 1, 1])
+    rec_items = np.array([1, 0, 0, 3])
+    rec_ranks = np.array([0, 1, 0, 1])
+    metrics = ranking_metrics(rec_users, rec_items, rec_ranks, holdout, k=2, eval_users=np.array([0, 1]))
+    assert metrics['precision@2'] == pytest.approx(0.25), "One hit out of four slots"
+    assert metrics['recall@2'] == pytest.approx(0.5), "One of two users fully recalled"
+    assert metrics['ndcg@2'] == pytest.approx(0.5), "Perfect NDCG for user 0, zero for user 1"
+    assert metrics['coverage'] == pytest.approx(0.75), "Three of four items recommended"
+
+def test_evaluate_on_synthetic_data(tmp_path):
+    data_dir = str(tmp_path / "synthetic")
+    generate_dataset(400, data_dir, seed=3)
+    metrics = evaluate(data_dir, k=5, workers=1, max_users=50)
+    assert 0 < metrics['users'] <= 50, "Should evaluate the sampled held-out users"
+    for name in ['precision@5', 'recall@5', 'ndcg@5', 'coverage']:
+        assert 0.0 <= metrics[name] <= 1.0, f"{name} should be a rate"
+    assert metrics['replay_seconds'] > 0, "Replay time should be reported"
@@ -0,0 +1,101 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import numpy as np
+from src import instrumentation
+from src.event_ingest import EventIngestor, append_events, start_ingestion, stop_ingestion
+from src.pipeline import MatchEngine
+from src.result_cache import ResultCache
+
+def test_block_event_removes_profile_from_results(engine_inputs, user_profile, tmp_path):
+    engine = MatchEngine(*engine_inputs, result_cache=ResultCache())
+    before = engine.recommend(user_profile, top_k=5)
+    target = before['__id__'].iloc[0]
+    log = tmp_path / "events.jsonl"
+    append_events(str(log), [{'type': 'delete', '__id__': target},
+                             {'type': 'like', 'userId': 'user1', '__id__': 'profile4'}])
+    with open(log, 'a', encoding='utf-8') as f:
+        f.write("not json\n")
+    ingestor = EventIngestor(engine, str(log), str(tmp_path / "checkpoint.json"))
+    assert ingestor.catch_up() == 2, "Both valid events should be applied"
+    assert ingestor.malformed == 1, "Malformed lines should be counted and skipped"
+    after = engine.recommend(user_profile, top_k=5)
+    assert target not in after['__id__'].tolist(), "Deleted profiles should drop out without a restart"
+    assert ingestor.interactions['__id__'] == ['profile4'], "Likes should reach the interaction store"
+
+def test_checkpoint_resumes_state_and_position(engine_inputs, tmp_path):
+    log = tmp_path / "events.jsonl"
+    checkpoint = str(tmp_path / "checkpoint.json")
+    append_events(str(log), [{'type': 'block', '__id__': 'profile2'}])
+    first = EventIngestor(MatchEngine(*engine_inputs), str(log), checkpoint)
+    first.catch_up()
+    append_events(str(log), [{'type': 'report', '__id__': 'profile4'}])
+
+    engine = MatchEngine(*engine_inputs)
+    second = EventIngestor(engine, str(log), checkpoint)
+    assert second.restore(), "The checkpoint should be found"
+    assert 'profile2' in engine.excluded_ids, "Checkpointed exclusions should be re-applied"
+    assert second.catch_up() == 1, "Only events after the checkpoint should be read"
+    assert {'profile2', 'profile4'} <= engine.excluded_ids
+    assert engine.excluded_mask.sum() == 2, "Only the excluded rows should be flagged"
+
+def test_segments_and_partial_lines(engine_inputs, tmp_path):
+    log_dir = tmp_path / "events"
+    log_dir.mkdir()
+    (log_dir / "events-000001.jsonl").write_text('{"type":"block","__id__":"profile0"}\n{"type":"blo')
+    (log_dir / "events-000002.jsonl").write_text('{"type":"block","__id__":"profile2"}\n')
+    engine = MatchEngine(*engine_inputs)
+    ingestor = EventIngestor(engine, str(log_dir), batch_bytes=16)
+    assert ingestor.catch_up() == 2, "Segments should be read in order, skipping an uncommitted tail"
+    assert ingestor.segment.endswith("events-000002.jsonl")
+    assert ingestor.backlog_bytes() == 0
+
+def test_background_ingestion_reports_lag(engine_inputs, tmp_path):
+    log = tmp_path / "events.jsonl"
+    log.touch()
+    engine = MatchEngine(*engine_inputs)
+    ingestor = EventIngestor(engine, str(log), str(tmp_path / "checkpoint.json"), poll_interval=0.01)
+    instrumentation.metrics.reset()
+    instrumentation.enable()
+    try:
+        thread, stop = start_ingestion(ingestor)
+        append_events(str(log), [{'type': 'block', '__id__': 'profile6', 'ts': time.time() - 1.0}])
+        deadline = time.time() + 5
+        while 'profile6' not in engine.excluded_ids and time.time() < deadline:
+            time.sleep(0.01)
+        assert stop_ingestion(thread, stop, timeout=5), "The thread should exit once stopped"
+        snapshot = instrumentation.metrics.snapshot()
+    finally:
+        instrumentation.disable()
+        instrumentation.metrics.reset()
+    assert 'profile6' in engine.excluded_ids, "The tailing thread should apply new events"
+    assert ingestor.lag_seconds >= 0.0 and 'ingest_lag_seconds' in snapshot['gauges'], "Lag should be exposed"
+    assert snapshot['counters']['ingest_events'] == 1
+    assert os.path.exists(tmp_path / "checkpoint.json"), "Stopping should checkpoint"
+
+def test_checkpoint_writes_only_new_events(engine_inputs, tmp_path):
+    log = tmp_path / "events.jsonl"
+    checkpoint = str(tmp_path / "checkpoint.json")
+    ingestor = EventIngestor(MatchEngine(*engine_inputs), str(log), checkpoint, compact_after=2)
+    for batch in ([{'type': 'like', 'userId': 'user1', '__id__': 'profile4'}, {'type': 'block', '__id__': 'profile2'}],
+                  [{'type': 'match', 'userId': 'user2', '__id__': 'profile0'}, {'type': 'block', '__id__': 'profile2'}]):
+        append_events(str(log), batch)
+        ingestor.catch_up()
+    assert len(ingestor.deltas) == 2, "Each checkpoint with new events should add one delta"
+    with np.load(tmp_path / ingestor.deltas[-1]) as delta:
+        assert delta['__id__'].tolist() == ['profile0'], "A delta should hold only interactions since the last one"
+        assert delta['exclusion_id'].tolist() == [], "Repeated exclusions should not be written again"
+    ingestor.catch_up()
+    assert len(ingestor.deltas) == 2, "A checkpoint without new events should not add a delta"
+
+    append_events(str(log), [{'type': 'report', '__id__': 'profile6'}])
+    ingestor.catch_up()
+    assert len(ingestor.deltas) == 1, "Deltas past compact_after should be folded into one file"
+    assert len(list(tmp_path.glob("checkpoint.json.delta-*.npz"))) == 1, "Superseded deltas should be removed"
+    engine = MatchEngine(*engine_inputs)
+    restored = EventIngestor(engine, str(log), checkpoint)
+    assert restored.restore()
+    assert restored.interactions == ingestor.interactions
+    assert {'profile2', 'profile6'} <= engine.excluded_ids
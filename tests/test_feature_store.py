@@ -0,0 +1,38 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.sparse import csr_matrix
+from src.feature_store import FeatureStore, narrow_dtype, csr_nbytes
+
+@pytest.fixture
+def blocks():
+    numeric = pd.DataFrame({'age': [25, 40, 33], 'country': [0, 2, 1], 'subscribed': np.array([1, 0, 1], dtype=np.int8),
+                            'keyword_score': [0.5, 0.0, 0.25]})
+    text = csr_matrix(np.array([[0.0, 0.6, 0.8, 0.0], [0.0, 0.0, 0.0, 0.0], [1.0, 0.0, 0.0, 0.0]]))
+    return numeric, text
+
+def test_narrow_dtype():
+    assert narrow_dtype(np.array([0, 200])) == np.uint8, "Small non-negative ints should fit uint8"
+    assert narrow_dtype(np.array([-1, 300])) == np.int16, "Negative ints should use a signed type"
+    assert narrow_dtype(np.array([0.5])) == np.float32, "Floats should be stored as float32"
+
+def test_logical_view_matches_hstack(blocks):
+    numeric, text = blocks
+    features = FeatureStore.from_blocks(numeric, text)
+    expected = np.hstack([numeric.to_numpy(dtype=np.float64), text.toarray()])
+    assert features.shape == expected.shape, "Shape should be numeric + text columns"
+    assert np.allclose(features.toarray(), expected), "Dense view should match the hstack layout"
+    assert np.allclose(features[[2, 0]].toarray(), expected[[2, 0]]), "Row gathers should keep order"
+    assert np.allclose(features[1].toarray(), expected[[1]]), "Scalar index should give one row"
+    assert np.allclose(features[1:].tocsr().toarray(), expected[1:]), "Slices and tocsr should agree"
+    assert features.toarray().dtype == np.float32, "Gathered rows should be float32"
+
+def test_smaller_than_float64_csr(blocks):
+    numeric, text = blocks
+    features = FeatureStore.from_blocks(numeric, text)
+    legacy = csr_matrix(np.hstack([numeric.to_numpy(dtype=np.float64), text.toarray()]))
+    assert features.nbytes < csr_nbytes(legacy), "Split store should use less memory"
@@ -0,0 +1,38 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.importtime import measure_import_time, deferred_violations, parse_importtime
+from src.data_loader import load_config, reload_config
+
+# Budgets relative to the CLI's unavoidable dependencies, measured in the same run, so they
+# hold on any machine: import time as a multiple of theirs (IMPORT_BUDGET_RATIO overrides it
+# on unusually noisy runners) and a cap on the modules the CLI loads on top of them
+BASELINE_MODULES = ['numpy', 'pandas', 'yaml']
+IMPORT_BUDGET_RATIO = float(os.environ.get('IMPORT_BUDGET_RATIO', 2.0))
+MAX_EXTRA_MODULES = 150
+
+def test_parse_importtime():
+    stderr = ("import time: self [us] | cumulative | imported package\n"
+              "import time:       100 |        100 |   yaml.error\n"
+              "import time:       400 |        500 | yaml\n")
+    timings = parse_importtime(stderr)
+    assert timings['yaml'] == (400, 500, 0), "Top-level module should have depth 0"
+    assert timings['yaml.error'][2] == 1, "Nested module should have depth 1"
+
+def test_cli_import_defers_heavy_modules():
+    total_ms, timings = measure_import_time(['ui.cli'])
+    assert deferred_violations(timings) == [], "streamlit/sklearn/scipy should not be imported at startup"
+    baseline_ms, baseline = measure_import_time(BASELINE_MODULES)
+    extra = len(set(timings) - set(baseline))
+    assert extra <= MAX_EXTRA_MODULES, f"CLI import loads {extra} modules beyond {BASELINE_MODULES}, " \
+                                       f"budget {MAX_EXTRA_MODULES}"
+    assert total_ms <= IMPORT_BUDGET_RATIO * baseline_ms, \
+        f"CLI import took {total_ms:.0f} ms, budget {IMPORT_BUDGET_RATIO}x the {baseline_ms:.0f} ms baseline"
+
+def test_load_config_is_memoised(tmp_path):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text("not: [valid")
+    first = load_config(config_path=str(config_path))
+    assert load_config(config_path=str(config_path)) is first, "Config should be cached per path"
+    assert reload_config(config_path=str(config_path)) is not first, "reload_config should re-read the file"
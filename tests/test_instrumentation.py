@@ -0,0 +1,60 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import pytest
+from src import instrumentation
+from src.instrumentation import LatencyHistogram, span, traced
+
+@pytest.fixture
+def enabled_metrics():
+    instrumentation.metrics.reset()
+    instrumentation.enable()
+    yield instrumentation.metrics
+    instrumentation.disable()
+    instrumentation.metrics.reset()
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for value in range(1, 10001):
+        histogram.record(value * 1000)
+    assert histogram.count == 10000, "All samples should be counted"
+    assert histogram.percentile(0.5) == pytest.approx(5_000_000, rel=0.04), "p50 within bucket precision"
+    assert histogram.percentile(0.99) == pytest.approx(9_900_000, rel=0.04), "p99 within bucket precision"
+    assert histogram.percentile(1.0) == 10_000_000, "p100 should be the max"
+
+def test_span_and_traced_record_stages(enabled_metrics):
+    @traced('stage_b')
+    def work():
+        return 42
+
+    with span('stage_a', candidates=7):
+        pass
+    assert work() == 42, "traced should return the wrapped result"
+    enabled_metrics.record_cache('results', hit=True)
+    enabled_metrics.record_cache('results', hit=False)
+    snapshot = enabled_metrics.snapshot()
+    assert snapshot['stages']['stage_a']['count'] == 1, "Span should be recorded"
+    assert snapshot['stages']['stage_a']['candidates'] == 7, "Candidate count should be recorded"
+    assert snapshot['stages']['stage_b']['count'] == 1, "Decorated call should be recorded"
+    assert snapshot['caches']['results']['hit_rate'] == 0.5, "Hit rate should be 0.5"
+
+def test_exports(enabled_metrics):
+    with span('apply_rules', candidates=3):
+        pass
+    text = enabled_metrics.to_prometheus()
+    assert 'matchmaking_stage_latency_seconds_count{stage="apply_rules"} 1' in text, "Prometheus count line"
+    assert 'matchmaking_stage_candidates_total{stage="apply_rules"} 3' in text, "Prometheus candidates line"
+    assert json.loads(enabled_metrics.to_json())['stages']['apply_rules']['count'] == 1, "JSON export"
+
+def test_disabled_span_overhead(monkeypatch):
+    instrumentation.disable()
+    clock_reads = []
+    monkeypatch.setattr(instrumentation.time, 'perf_counter_ns', lambda: clock_reads.append(1) or 0)
+    assert span('noop') is span('other', candidates=3), "Disabled spans should share one no-op object"
+    for _ in range(1000):
+        with span('noop') as active:
+            active.set_candidates(5)
+    assert not clock_reads, "Disabled spans should never read the clock"
+    assert 'noop' not in instrumentation.metrics.snapshot()['stages'], "Disabled spans should not record"
@@ -0,0 +1,63 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import time
+import urllib.error
+import urllib.request
+import pytest
+from src.pipeline import MatchEngine
+from src.load_generator import (compare_to_slo, http_target, inproc_target, load_profiles, run_load,
+                                start_server)
+
+def test_closed_loop_in_process(engine_inputs, user_profile):
+    engine = MatchEngine(*engine_inputs)
+    profiles = [dict(user_profile, userId=f'user{i}') for i in range(4)]
+    report = run_load(inproc_target(engine), profiles, concurrency=3, max_requests=20, sample_interval=0.05)
+    assert report['requests'] == 20 and report['errors'] == 0, report
+    latency = report['latency_ms']
+    assert 0 < latency['p50'] <= latency['p99'] <= latency['p99.9'] <= latency['max'], latency
+    assert report['throughput_rps'] > 0 and report['rss_mb_max'] > 0
+    assert report['timeline'][-1]['completed'] == 20, "The last resource sample should follow the run's end"
+
+def test_open_loop_counts_queueing_delay():
+    def slow(profile):
+        time.sleep(0.02)
+    report = run_load(slow, [{}], mode='open', concurrency=1, rate=200, max_requests=30, seed=1)
+    assert report['requests'] == 30, report
+    # 200 arrivals/s against one 20 ms worker: later requests wait for it
+    assert report['latency_ms']['p99'] > 100, "Queueing behind the saturated worker should count as latency"
+    with pytest.raises(ValueError, match="rate"):
+        run_load(slow, [{}], mode='open')
+
+def test_http_round_trip(engine_inputs, user_profile):
+    server, url = start_server(MatchEngine(*engine_inputs))
+    try:
+        request = urllib.request.Request(url, data=json.dumps(user_profile).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            record = json.loads(response.read())
+        assert record['userId'] == 'user1' and record['matches'], record
+        with pytest.raises(urllib.error.HTTPError):
+            http_target(url)(dict(user_profile, age=12))
+        report = run_load(http_target(url), [user_profile], concurrency=2, max_requests=10)
+        assert report['requests'] == 10 and report['errors'] == 0, report
+    finally:
+        server.shutdown()
+
+def test_load_profiles_skips_invalid(tmp_path, user_profile):
+    path = tmp_path / "profiles.jsonl"
+    path.write_text("\n".join([json.dumps(user_profile), "not json", json.dumps(dict(user_profile, age=12)), ""]))
+    assert load_profiles(str(path)) == [user_profile]
+
+def test_compare_to_slo():
+    report = {'throughput_rps': 50.0, 'error_rate': 0.0, 'rss_mb_max': 300.0,
+              'latency_ms': {'p50': 10.0, 'p99': 80.0},
+              'stages': {'predict_compatibility': {'p99_ms': 40.0}}}
+    slo = {'min_throughput_rps': 20, 'max_error_rate': 0.01, 'max_rss_mb': 1024,
+           'max_latency_ms': {'p50': 20, 'p99': 50}, 'max_stage_latency_ms': {'predict_compatibility': {'p99': 30}}}
+    violations = compare_to_slo(report, slo)
+    assert len(violations) == 2, violations
+    assert violations[0].startswith("latency p99") and violations[1].startswith("predict_compatibility p99")
+    assert compare_to_slo(report, {'min_throughput_rps': 10}) == []
@@ -0,0 +1,83 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pandas as pd
+from src.near_duplicates import NearDuplicateIndex, minhash_signatures, normalise_texts, suppressed_profile_ids
+from src.pipeline import MatchEngine
+
+BIOS = [
+    "Looking for true love and enjoy soccer on weekends",
+    "looking for TRUE love, and enjoy soccer on weekends!!",
+    "I like cooking and travelling around Africa with friends",
+    "",
+    "Send me money via western union for a visa now please",
+    "Send me money via western union for a visa now please.",
+    "send me money via Western Union for a visa now please",
+]
+
+def test_signatures_estimate_similarity():
+    signatures = minhash_signatures(normalise_texts(BIOS).to_numpy())
+    assert signatures.shape == (len(BIOS), 128), "One signature row per text"
+    assert (signatures[0] == signatures[1]).mean() > 0.8, "Near-identical bios should share most minhashes"
+    assert (signatures[0] == signatures[2]).mean() < 0.2, "Unrelated bios should share few minhashes"
+    assert (signatures[3] == 0xFFFFFFFF).all(), "Empty bios should have no signature"
+
+def test_clusters_and_suppression():
+    index = NearDuplicateIndex()
+    index.add([f"p{i}" for i in range(len(BIOS))], BIOS)
+    assert index.clusters() == [['p0', 'p1'], ['p4', 'p5', 'p6']], "Copy-pasted bios should cluster"
+    assert index.suppression_list(spam_cluster_size=5) == ['p1', 'p5', 'p6'], \
+        "The earliest profile of each cluster should be kept"
+    assert index.suppression_list(spam_cluster_size=3) == ['p1', 'p4', 'p5', 'p6'], \
+        "Large clusters should be suppressed entirely"
+
+def test_incremental_add_matches_batch(tmp_path):
+    ids = [f"p{i}" for i in range(len(BIOS))]
+    batch = NearDuplicateIndex()
+    batch.add(ids, BIOS)
+    incremental = NearDuplicateIndex()
+    incremental.add(ids[:3], BIOS[:3])
+    path = str(tmp_path / "index.npz")
+    incremental.save(path)
+    incremental = NearDuplicateIndex.load(path)
+    assert incremental.add(ids, BIOS) == len(BIOS) - 3, "Already indexed profiles should be skipped"
+    assert np.array_equal(incremental.signatures, batch.signatures), "Incremental signatures should match batch"
+    assert incremental.clusters() == batch.clusters(), "Incremental clusters should match batch"
+
+def test_edited_bio_is_rehashed():
+    ids = [f"p{i}" for i in range(len(BIOS))]
+    index = NearDuplicateIndex()
+    index.add(ids, BIOS)
+    edited = list(BIOS)
+    edited[1] = "Spanish tutor who loves hiking in the mountains"
+    assert index.add(ids, edited) == 1, "Only the edited bio should be re-hashed"
+    assert index.clusters() == [['p4', 'p5', 'p6']], "An edited bio should leave its old cluster"
+    assert index.add(ids, edited) == 0, "Unchanged bios should not be re-hashed"
+    assert np.array_equal(index.signatures, minhash_signatures(normalise_texts(edited).to_numpy())), \
+        "Re-hashed rows should match a fresh index"
+
+def test_parallel_chunks_match_serial():
+    ids = [f"p{i}" for i in range(len(BIOS))]
+    serial, parallel = NearDuplicateIndex(), NearDuplicateIndex()
+    serial.add(ids, BIOS)
+    parallel.add(ids, BIOS, workers=2, chunk_size=2)
+    assert np.array_equal(serial.signatures, parallel.signatures), "Chunked workers should give the same signatures"
+
+def test_suppressed_profiles_are_excluded(engine_inputs, user_profile):
+    store = engine_inputs[0]
+    profiles = pd.DataFrame({'__id__': store.table['__id__'], 'aboutMe': ['Love soccer and travel'] * len(store)})
+    config = {'near_duplicates': {'enabled': True, 'spam_cluster_size': 100, 'index_file': None}}
+    suppressed = suppressed_profile_ids(profiles, config)
+    assert suppressed == store.table['__id__'].tolist()[1:], "All copies but the first should be suppressed"
+    engine = MatchEngine(*engine_inputs, suppressed_ids=suppressed)
+    top_matches = engine.recommend(user_profile)
+    assert not set(top_matches['__id__']) & set(suppressed), "Suppressed profiles should not be recommended"
+
+def test_deleted_profiles_leave_clusters(tmp_path):
+    config = {'near_duplicates': {'enabled': True, 'index_file': str(tmp_path / "index.npz"), 'workers': 2}}
+    profiles = pd.DataFrame({'__id__': ['a', 'b', 'c'], 'aboutMe': [BIOS[0], BIOS[1], BIOS[2]]})
+    assert suppressed_profile_ids(profiles, config) == ['b']
+    assert suppressed_profile_ids(profiles.iloc[1:], config) == [], \
+        "Once the original is deleted, its copy should no longer be suppressed"
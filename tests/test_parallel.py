@@ -0,0 +1,30 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import itertools
+import threading
+from src import parallel
+from src.parallel import fork_map
+
+def scaled_pid(shared, item):
+    return item * shared['factor'], os.getpid()
+
+def test_fork_map_matches_serial_in_order():
+    # A lock cannot be pickled, so the workers must inherit the shared state
+    shared = {'factor': 3, 'lock': threading.Lock()}
+    serial = list(fork_map(scaled_pid, range(10), shared, workers=1))
+    forked = list(fork_map(scaled_pid, range(10), shared, workers=2))
+    assert [value for value, _ in forked] == [value for value, _ in serial] == [i * 3 for i in range(10)], \
+        "Results should come back in input order"
+    assert all(pid == os.getpid() for _, pid in serial), "workers=1 should run in this process"
+    if 'fork' in parallel.multiprocessing.get_all_start_methods():
+        assert all(pid != os.getpid() for _, pid in forked), "workers > 1 should run in forked workers"
+    assert not parallel._shared, "Shared state should be released once the map finishes"
+
+def test_fork_map_consumes_unbounded_items_lazily():
+    results = fork_map(scaled_pid, itertools.count(), {'factor': 2}, workers=2)
+    assert [value for value, _ in itertools.islice(results, 5)] == [0, 2, 4, 6, 8], \
+        "An infinite iterator should be consumed lazily"
+    results.close()
+    assert not parallel._shared, "Closing the generator should release the shared state"
@@ -0,0 +1,197 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pickle
+import pytest
+from scipy.sparse import csr_matrix
+from src import instrumentation, pipeline
+from src.pipeline import MatchEngine, QuerySession
+from src.result_cache import ResultCache
+
+def test_recommend(engine_inputs, user_profile):
+    engine = MatchEngine(*engine_inputs, blocked_ids=['profile4'])
+    top_matches = engine.recommend(user_profile, top_k=3)
+    assert 0 < len(top_matches) <= 3, "Should return at most top_k matches"
+    assert 'profile4' not in top_matches['__id__'].tolist(), "Blocked profile should be excluded"
+    assert top_matches['final_score'].is_monotonic_decreasing, "Matches should be sorted by score"
+    assert top_matches['country'].iloc[0] in ('Kenya', 'Nigeria'), "Country should be resolved to a string"
+
+def test_recommend_records_stage_metrics(engine_inputs, user_profile):
+    instrumentation.metrics.reset()
+    instrumentation.enable()
+    try:
+        MatchEngine(*engine_inputs).recommend(user_profile)
+        stages = instrumentation.metrics.snapshot()['stages']
+    finally:
+        instrumentation.disable()
+        instrumentation.metrics.reset()
+    for stage in ['apply_rules', 'predict_compatibility', 'top_k']:
+        assert stages[stage]['count'] == 1, f"{stage} should be traced once"
+    assert 'encode_user_profile' not in stages, "Only reciprocal scoring needs the encoded viewer"
+    assert stages['apply_rules']['candidates'] > 0, "Candidate counts should be recorded"
+
+def test_recommend_reciprocal(engine_inputs, user_profile):
+    store = engine_inputs[0]
+    # user0 liked profile1, the viewer's own profile
+    interaction_matrix = csr_matrix(([1.0], ([0], [1])), shape=(len(store), len(store)))
+    engine = MatchEngine(*engine_inputs, interaction_matrix=interaction_matrix, reciprocal=True)
+    filtered = engine.filter_candidates(user_profile)
+    scored = engine.score_candidates(user_profile, filtered)
+    for column in ['ml_score_forward', 'ml_score_reverse', 'ml_score', 'final_score']:
+        assert column in scored, f"Reciprocal scoring should add {column}"
+    upper = scored[['ml_score_forward', 'ml_score_reverse']].clip(lower=0).max(axis=1)
+    assert (scored['ml_score'] <= upper + 1e-9).all(), "Harmonic mean should not exceed either direction"
+    top_matches = engine.recommend(user_profile, top_k=3)
+    assert 0 < len(top_matches) <= 3, "Reciprocal mode should still return top_k matches"
+
+def test_score_encodes_viewer_only_when_reciprocal(engine_inputs, user_profile, monkeypatch):
+    calls = []
+    encode = pipeline.encode_user_profile
+    monkeypatch.setattr(pipeline, 'encode_user_profile', lambda *args: calls.append(1) or encode(*args))
+    MatchEngine(*engine_inputs).recommend(user_profile, top_k=3)
+    MatchEngine(*engine_inputs, score_chunk_size=2).recommend(user_profile, top_k=3, time_budget_ms=60_000)
+    assert not calls, "Forward-only scoring should not encode the viewer"
+    MatchEngine(*engine_inputs, reciprocal=True).recommend(user_profile, top_k=3, time_budget_ms=60_000)
+    assert len(calls) == 1, "Budgeted reciprocal scoring should encode the viewer once for all chunks"
+
+def test_reciprocal_unknown_viewer(engine_inputs, user_profile):
+    engine = MatchEngine(*engine_inputs, reciprocal=True)
+    viewer = dict(user_profile, userId='user123')
+    top_matches = engine.recommend(viewer)
+    assert not top_matches.empty, "Viewers without a stored profile should be scored from the request"
+    assert top_matches['ml_score_reverse'].notna().all(), "Reverse scores should be filled"
+
+def test_recommend_with_diversity_rerank(engine_inputs, user_profile):
+    instrumentation.metrics.reset()
+    instrumentation.enable()
+    try:
+        engine = MatchEngine(*engine_inputs, diversity_shortlist=4, diversity_lambda=0.5)
+        top_matches = engine.recommend(user_profile, top_k=2)
+        stages = instrumentation.metrics.snapshot()['stages']
+    finally:
+        instrumentation.disable()
+        instrumentation.metrics.reset()
+    assert len(top_matches) == 2, "Re-ranking should still return top_k matches"
+    assert top_matches['__id__'].is_unique, "Re-ranking should not repeat candidates"
+    assert stages['rerank']['count'] == 1, "Re-ranking latency should be recorded"
+
+def test_recommend_zero_budget_degrades_to_rules(engine_inputs, user_profile):
+    instrumentation.metrics.reset()
+    instrumentation.enable()
+    try:
+        top_matches = MatchEngine(*engine_inputs).recommend(user_profile, time_budget_ms=0)
+        counters = instrumentation.metrics.snapshot()['counters']
+    finally:
+        instrumentation.disable()
+        instrumentation.metrics.reset()
+    assert not top_matches.empty, "A blown budget should still return rule-ranked matches"
+    assert top_matches.attrs['partial'], "Result should be flagged as partial"
+    assert top_matches.attrs['scored_fraction'] == 0.0
+    assert not top_matches['ml_scored'].any(), "No candidate should be ML-scored"
+    assert (top_matches['ml_score'] == 0).all(), "Unscored candidates should fall back to rule-only scores"
+    assert counters['deadline_degraded'] == 1, "Degradation should be counted"
+    assert counters['rule_only_candidates'] > 0
+
+def test_recommend_chunked_within_budget_matches_unbounded(engine_inputs, user_profile):
+    engine = MatchEngine(*engine_inputs, score_chunk_size=2)
+    unbounded = engine.recommend(user_profile, top_k=3)
+    budgeted = engine.recommend(user_profile, top_k=3, time_budget_ms=60_000)
+    assert not budgeted.attrs['partial'], "A generous budget should score every candidate"
+    assert budgeted.attrs['scored_fraction'] == 1.0
+    assert budgeted['ml_scored'].all()
+    assert budgeted['final_score'].tolist() == pytest.approx(unbounded['final_score'].tolist()), \
+        "Chunked scoring should match scoring all candidates at once"
+
+def test_result_cache_hits_normalised_profiles(engine_inputs, user_profile):
+    cache = ResultCache()
+    engine = MatchEngine(*engine_inputs, result_cache=cache)
+    first = engine.recommend(user_profile)
+    variant = dict(user_profile, userId='user999', country=' kenya ', aboutMe='Something else')
+    anonymous = dict(user_profile, userId='user123')
+    engine.recommend(anonymous)
+    assert len(cache) == 2, "Known and anonymous viewers have different model user indices"
+    engine.recommend(variant)
+    assert len(cache) == 2, "Anonymous near-identical profiles should share an entry"
+    assert engine.recommend(user_profile)['__id__'].tolist() == first['__id__'].tolist()
+
+def test_result_cache_invalidated_by_exclusions_and_model(engine_inputs, user_profile):
+    cache = ResultCache()
+    engine = MatchEngine(*engine_inputs, result_cache=cache, model_version='v1')
+    first = engine.recommend(user_profile)
+    key = engine.cache_key(engine.normalise_profile(user_profile), engine.top_k)
+    engine.set_exclusions([])
+    assert engine.cache_key(engine.normalise_profile(user_profile), engine.top_k) == key, \
+        "An unchanged exclusion set should keep cached results"
+    blocked = first['__id__'].iloc[0]
+    engine.set_exclusions([blocked])
+    assert blocked not in engine.recommend(user_profile)['__id__'].tolist(), \
+        "New exclusions should invalidate cached results"
+    retrained = MatchEngine(*engine_inputs, blocked_ids=[blocked], result_cache=cache, model_version='v2')
+    assert retrained.cache_key(retrained.normalise_profile(user_profile), 5) != \
+        engine.cache_key(engine.normalise_profile(user_profile), 5), "A new model version should not hit"
+
+def test_result_cache_version_follows_model_content(engine_inputs, user_profile):
+    cache = ResultCache()
+    engine = MatchEngine(*engine_inputs, result_cache=cache)
+    assert MatchEngine(*engine_inputs, result_cache=cache).model_version == engine.model_version, \
+        "Engines over the same fitted model should share cached results"
+    inputs = list(engine_inputs)
+    inputs[2] = pickle.loads(pickle.dumps(engine_inputs[2]))
+    inputs[2].learning_rate = engine_inputs[2].learning_rate / 2
+    assert MatchEngine(*inputs, result_cache=cache).model_version != engine.model_version, \
+        "A different model should never hit another model's entries"
+
+def test_result_cache_skips_partial_results(engine_inputs, user_profile):
+    cache = ResultCache()
+    engine = MatchEngine(*engine_inputs, result_cache=cache)
+    assert engine.recommend(user_profile, time_budget_ms=0).attrs['partial']
+    assert len(cache) == 0, "Degraded results should not be cached"
+
+def test_recommend_incremental_matches_full_recompute(engine_inputs, user_profile):
+    engine = MatchEngine(*engine_inputs)
+    session = QuerySession()
+    for changes in [{}, {'age': 30}, {'country': 'Nigeria'}, {'age': 22, 'language': 'English'},
+                    {'relationshipGoals': 'Casual'}]:
+        profile = dict(user_profile, **changes)
+        incremental = engine.recommend_incremental(profile, session, top_k=3)
+        full = engine.recommend(profile, top_k=3)
+        assert incremental['__id__'].tolist() == full['__id__'].tolist(), f"Same top-K after {changes}"
+        assert incremental['final_score'].tolist() == pytest.approx(full['final_score'].tolist()), \
+            f"Same scores after {changes}"
+
+def test_recommend_incremental_persists_only_on_request(engine_inputs, user_profile):
+    class ListSink:
+        def __init__(self):
+            self.submitted = []
+
+        def submit(self, user_id, top_matches):
+            self.submitted.append(user_id)
+
+    sink = ListSink()
+    engine = MatchEngine(*engine_inputs, sink=sink)
+    session = QuerySession()
+    engine.recommend_incremental(user_profile, session)
+    for age in (26, 27, 28):
+        engine.recommend_incremental(dict(user_profile, age=age), session, persist=False)
+    assert sink.submitted == ['user1'], "Re-queries without persist should not reach the sink"
+
+def test_recommend_incremental_reuses_scores(engine_inputs, user_profile):
+    engine = MatchEngine(*engine_inputs)
+    session = QuerySession()
+    instrumentation.metrics.reset()
+    instrumentation.enable()
+    try:
+        engine.recommend_incremental(user_profile, session)
+        engine.recommend_incremental(dict(user_profile, country='Nigeria'), session)
+        engine.recommend_incremental(dict(user_profile, age=28), session)
+        snapshot = instrumentation.metrics.snapshot()
+        assert snapshot['stages']['predict_compatibility']['count'] == 1, \
+            "Re-queries within the scored age window should not re-run the model"
+        engine.recommend_incremental(dict(user_profile, sex='Female', seeking='Male'), session)
+        snapshot = instrumentation.metrics.snapshot()
+    finally:
+        instrumentation.disable()
+        instrumentation.metrics.reset()
+    assert snapshot['stages']['predict_compatibility']['count'] == 2, "A sex/seeking change should rescore"
+    assert snapshot['stages']['apply_rules']['count'] == 2, "Candidate sets should be built only on a new key"
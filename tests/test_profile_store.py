@@ -0,0 +1,59 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+import pandas as pd
+import numpy as np
+from src.profile_store import ProfileStore, memory_footprint_report, to_flag
+
+@pytest.fixture
+def loaded_profiles():
+    """Profiles as returned by load_data (booleans turned into object by fillna)."""
+    data = {
+        '__id__': ['profile1', 'profile2', 'profile3'],
+        'userId': ['user1', 'user2', 'user3'],
+        'userName': ['Amani', 'Juma', 'Fatima'],
+        'age': [25, 30, 28],
+        'country': ['Kenya', 'Nigeria', 'Kenya'],
+        'language': ['Swahili', 'English', 'Swahili'],
+        'aboutMe': ['Love soccer', 'Seeking soul mate', 'Enjoy football'],
+        'sex': ['Female', 'Male', 'Female'],
+        'seeking': ['Male', 'Female', 'Male'],
+        'relationshipGoals': ['Long-term', 'Long-term', 'Casual'],
+        'subscribed': [True, False, 'unknown'],
+        'subscribedEliteOne': [True, False, False],
+        'subscribedEliteThree': [False, False, False],
+        'subscribedEliteSix': [False, False, False],
+        'subscribedEliteTwelve': [False, False, False]
+    }
+    return pd.DataFrame(data)
+
+def test_to_flag():
+    flags = to_flag(pd.Series([True, False, 'unknown', 'True'], dtype=object))
+    assert flags.dtype == np.int8, "Flags should be int8"
+    assert flags.tolist() == [1, 0, 0, 1], "Unknown should map to 0"
+
+def test_from_profiles_dtypes(loaded_profiles):
+    store = ProfileStore.from_profiles(loaded_profiles, keywords=['love', 'soccer'])
+    table = store.table
+    assert table['age'].dtype == np.uint8, "Age should be uint8"
+    assert table['country'].dtype == np.int32, "Category codes should be int32"
+    assert table['subscribed'].dtype == np.int8, "Flags should be int8"
+    assert table['subscribed_score'].tolist() == [2, 0, 0], "Subscribed score should be precomputed"
+    assert 'aboutMe' not in table.columns, "aboutMe should stay out of the hot table"
+    assert table['keyword_score'].iloc[0] == pytest.approx(1.0), "Both keywords present in profile1"
+
+def test_resolve(loaded_profiles):
+    store = ProfileStore.from_profiles(loaded_profiles)
+    top = store.table.iloc[[2, 0]]
+    resolved = store.resolve(top)
+    assert resolved['country'].tolist() == ['Kenya', 'Kenya'], "Codes should decode to strings"
+    assert resolved['userName'].tolist() == ['Fatima', 'Amani'], "Text columns should follow row positions"
+    assert store.code_for('country', 'Atlantis') == -1, "Unseen values should have code -1"
+
+def test_memory_footprint_report(loaded_profiles):
+    store = ProfileStore.from_profiles(loaded_profiles)
+    report = memory_footprint_report(loaded_profiles, store)
+    assert report['profiles'] == 3, "Report should count profiles"
+    assert report['store_hot_bytes_per_profile'] < report['dataframe_bytes_per_profile'], "Hot table should be smaller"
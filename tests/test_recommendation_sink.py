@@ -0,0 +1,69 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import glob
+import pytest
+import pandas as pd
+from src.recommendation_sink import (RecommendationSink, read_recommendation_log, reason_bitmask,
+                                     decode_reasons, REASON_COUNTRY, REASON_SUBSCRIBED)
+
+@pytest.fixture
+def top_matches():
+    return pd.DataFrame({
+        '__id__': ['profile1', 'profile2'],
+        'final_score': [0.9, 0.4],
+        'ml_score': [0.8, 0.1],
+        'country_match': [True, False],
+        'language_match': [False, False],
+        'goal_match': [True, False],
+        'subscribed_score': [0, 2]
+    })
+
+def test_reason_bitmask(top_matches):
+    masks = reason_bitmask(top_matches)
+    assert masks[0] & REASON_COUNTRY, "Country match should be set for profile1"
+    assert masks[1] == REASON_SUBSCRIBED, "Only subscribed should be set for profile2"
+    assert decode_reasons(masks[0]) == ["Country match", "Relationship goals match", "High ML compatibility"]
+
+def test_sink_drains_on_close(tmp_path, top_matches):
+    sink = RecommendationSink(str(tmp_path), batch_size=1000, flush_interval=60, model_version='v1').start()
+    for viewer in range(10):
+        assert sink.submit(f"user{viewer}", top_matches), "Submit should not block or drop"
+    sink.close()
+    log = read_recommendation_log(str(tmp_path))
+    assert len(log) == 20, "All queued records should be written on close"
+    assert set(log['model_version']) == {'v1'}, "Records should carry the model version"
+
+def test_sink_flush(tmp_path, top_matches):
+    sink = RecommendationSink(str(tmp_path), batch_size=1000, flush_interval=60).start()
+    sink.submit("user1", top_matches)
+    sink.flush()
+    assert len(read_recommendation_log(str(tmp_path))) == 2, "flush should write pending records"
+    sink.close()
+
+def test_sink_rotates_files(tmp_path, top_matches):
+    sink = RecommendationSink(str(tmp_path), batch_size=1, flush_interval=60, max_file_bytes=1).start()
+    for viewer in range(3):
+        sink.submit(f"user{viewer}", top_matches)
+        sink.flush()
+    sink.close()
+    assert len(glob.glob(str(tmp_path / "recommendations-*.sqlite"))) >= 2, "Files should rotate by size"
+    assert len(read_recommendation_log(str(tmp_path))) == 6, "No records lost across rotation"
+
+def test_sink_rotation_counts_wal(tmp_path, top_matches):
+    # Committed rows stay in the -wal file until a checkpoint, well past this size limit
+    top_matches = pd.concat([top_matches] * 100, ignore_index=True)
+    sink = RecommendationSink(str(tmp_path), batch_size=1, flush_interval=60, max_file_bytes=32 * 1024).start()
+    for viewer in range(10):
+        sink.submit(f"user{viewer}", top_matches)
+        sink.flush()
+    sink.close()
+    assert len(glob.glob(str(tmp_path / "recommendations-*.sqlite"))) >= 2, "WAL growth should trigger rotation"
+    assert len(read_recommendation_log(str(tmp_path))) == 2000
+
+def test_sink_drops_when_queue_full(tmp_path, top_matches):
+    sink = RecommendationSink(str(tmp_path), max_queue_size=1)
+    assert sink.submit("user1", top_matches), "First submit fits in the queue"
+    assert not sink.submit("user2", top_matches), "Second submit should be dropped without a writer"
+    assert sink.dropped == 2, "Dropped records should be counted"
@@ -7,7 +7,8 @@ import pandas as pd
 import numpy as np
 from scipy.sparse import csr_matrix
 import joblib
-from src.recommender import train_model, predict_compatibility, load_model_and_encoders
+from src.recommender import (train_model, predict_compatibility, load_model_and_encoders, combine_scores,
+                             predict_reciprocal_compatibility)
 
 @pytest.fixture
 def mock_data():
@@ -81,4 +82,58 @@ def test_load_model_and_encoders_missing():
     assert label_encoders is None, "Label encoders should be None for missing files"
     assert tfidf is None, "TF-IDF vectorizer should be None for missing files"
     assert user_to_idx is None, "User-to-idx should be None for missing files"
-    assert profile_to_idx is None, "Profile-to-idx should be None for missing files"
\ No newline at end of file
+    assert profile_to_idx is None, "Profile-to-idx should be None for missing files"
+
+def test_combine_scores():
+    forward = np.array([0.8, 0.8, 0.0])
+    reverse = np.array([0.8, 0.2, 0.0])
+    harmonic = combine_scores(forward, reverse)
+    assert harmonic[0] == pytest.approx(0.8), "Equal scores should combine to themselves"
+    assert harmonic[1] == pytest.approx(0.32), "One-sided interest should be pulled down"
+    assert harmonic[2] == 0.0, "Zero on both sides should not divide by zero"
+    assert combine_scores(forward, reverse, 'min')[1] == pytest.approx(0.2)
+    with pytest.raises(ValueError):
+        combine_scores(forward, reverse, 'median')
+
+class UserColumnModel:
+    """Stub whose score is a tenth of the (unscaled) user index column."""
+
+    def predict(self, X):
+        return X[:, 0] / 10.0
+
+class ItemColumnModel:
+    """Stub whose score is a tenth of the (unscaled) item index column."""
+
+    def predict(self, X):
+        return X[:, 1] / 10.0
+
+class IdentityScaler:
+    mean_ = np.zeros(5)
+    scale_ = np.ones(5)
+
+def test_reciprocal_candidates_without_user_row():
+    profiles = pd.DataFrame({'country_match': [True] * 3, 'language_match': [False] * 3, 'goal_match': [False] * 3})
+    X_features = csr_matrix(np.ones((3, 3)))
+    # User 0 liked the viewer; the third candidate never acted as a user
+    reverse_interactions = csr_matrix(([1.0], ([0], [0])), shape=(1, 4))
+    scored = predict_reciprocal_compatibility(UserColumnModel(), IdentityScaler(), 3, 5, np.ones(3), profiles,
+                                              X_features, np.array([0, 1, 2]), np.array([0, 2, -1]),
+                                              reverse_interactions, fallback_users=np.array([1, 3]))
+    reverse = scored['ml_score_reverse'].tolist()
+    assert reverse[0] == 0.5, "User 0's like of the viewer should floor their reverse score"
+    assert reverse[1] == pytest.approx(0.2)
+    assert reverse[2] == pytest.approx(0.2), "A candidate with no user row should be scored over fallback users"
+
+def test_reciprocal_unknown_viewer_uses_fallbacks():
+    profiles = pd.DataFrame({'country_match': [True] * 2, 'language_match': [False] * 2, 'goal_match': [False] * 2})
+    X_features = csr_matrix(np.ones((2, 3)))
+    args = (-1, -1, np.ones(3), profiles, X_features, np.array([0, 1]), np.array([0, 2]), None)
+    scored = predict_reciprocal_compatibility(UserColumnModel(), IdentityScaler(), *args,
+                                              fallback_users=np.array([1, 3]), fallback_items=np.array([0, 2]))
+    assert scored['ml_score_forward'].tolist() == pytest.approx([0.2, 0.2]), \
+        "An unknown viewer should be scored as the mean of the fallback users, not user 0"
+    scored = predict_reciprocal_compatibility(ItemColumnModel(), IdentityScaler(), *args,
+                                              fallback_users=np.array([1, 3]), fallback_items=np.array([0, 2]))
+    assert scored['ml_score_forward'].tolist() == pytest.approx([0.0, 0.1])
+    assert scored['ml_score_reverse'].tolist() == pytest.approx([0.1, 0.1]), \
+        "A viewer without a profile row should be scored as the mean of the fallback items"
@@ -0,0 +1,52 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import glob
+import time
+from src.pipeline import MatchEngine
+from src.request_profiler import RequestProfiler, candidate_bucket, load_collapsed, note_candidates, summarise
+
+def predict_compatibility(seconds):
+    """Busy stand-in named like the pipeline stage."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def test_slow_requests_are_profiled_with_tags(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), sample_rate=0.0, slow_ms=20, interval_ms=1)
+    with profiler.request():
+        note_candidates(300)
+        predict_compatibility(0.005)
+    assert not os.path.exists(profiler.path), "Fast unsampled requests should not be written"
+    with profiler.request():
+        note_candidates(300)
+        predict_compatibility(0.1)
+    profiler.close()
+    stacks = load_collapsed([profiler.path])
+    assert stacks, "A request over slow_ms should be written"
+    stack = max(stacks, key=stacks.get)
+    assert stack.startswith("stage:predict_compatibility;candidates<=512;slow;"), stack
+    assert "test_request_profiler:predict_compatibility" in stack, "Frames should be labelled module:function"
+
+def test_rotation_by_size(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), sample_rate=1.0, interval_ms=1, max_bytes=200, backups=2)
+    for _ in range(6):
+        with profiler.request():
+            predict_compatibility(0.02)
+    profiler.close()
+    files = sorted(glob.glob(os.path.join(str(tmp_path), "requests.collapsed*")))
+    assert len(files) == 3, f"The live file plus two backups should be kept, got {files}"
+    assert summarise(load_collapsed(files))['total'] > 0
+
+def test_engine_hook(engine_inputs, user_profile, tmp_path):
+    profiler = RequestProfiler(str(tmp_path), sample_rate=1.0, interval_ms=0.5)
+    engine = MatchEngine(*engine_inputs, profiler=profiler)
+    for _ in range(50):
+        engine.recommend(user_profile)
+        if os.path.exists(profiler.path):
+            break
+    profiler.close()
+    stacks = load_collapsed([profiler.path])
+    assert any("pipeline:recommend" in stack for stack in stacks), "Stacks should start at the request"
+    assert all(stack.split(";")[1] == candidate_bucket(3) for stack in stacks), "Candidate count should be tagged"
@@ -0,0 +1,106 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import time
+import pytest
+import pandas as pd
+from src.result_cache import ResultCache, frame_size
+
+def make_frame(n):
+    return pd.DataFrame({'__id__': [f'profile{i}' for i in range(n)], 'final_score': [0.5] * n})
+
+def test_get_or_compute_caches():
+    cache = ResultCache()
+    calls = []
+    compute = lambda: calls.append(1) or make_frame(3)
+    first = cache.get_or_compute('key', compute)
+    second = cache.get_or_compute('key', compute)
+    assert len(calls) == 1, "Second lookup should be a hit"
+    assert second.equals(first)
+    second.loc[0, 'final_score'] = 0.0
+    assert cache.get_or_compute('key', compute).loc[0, 'final_score'] == 0.5, "Callers should get copies"
+
+def test_lru_eviction_by_memory():
+    entry_size = frame_size(make_frame(10))
+    cache = ResultCache(max_bytes=int(entry_size * 2.5))
+    cache.get_or_compute('a', lambda: make_frame(10))
+    cache.get_or_compute('b', lambda: make_frame(10))
+    cache.get_or_compute('a', lambda: make_frame(10))  # refresh a
+    cache.get_or_compute('c', lambda: make_frame(10))
+    assert 'a' in cache and 'c' in cache, "Recently used entries should survive"
+    assert 'b' not in cache, "Least recently used entry should be evicted"
+    assert cache.bytes <= cache.max_bytes
+    assert cache.evictions == 1
+
+def test_cacheable_veto():
+    cache = ResultCache()
+    cache.get_or_compute('key', lambda: make_frame(1), cacheable=lambda frame: False)
+    assert 'key' not in cache, "Vetoed results should not be stored"
+
+def test_single_flight():
+    cache = ResultCache()
+    calls = []
+    release = threading.Event()
+
+    def slow_compute():
+        calls.append(1)
+        release.wait(5)
+        return make_frame(2)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('key', slow_compute)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1, "Concurrent identical misses should compute once"
+    assert len(results) == 4 and all(len(r) == 2 for r in results)
+
+def test_errors_propagate_and_are_not_cached():
+    cache = ResultCache()
+
+    def failing():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('key', failing)
+    assert 'key' not in cache
+    assert len(cache.get_or_compute('key', lambda: make_frame(1))) == 1, "A later call should recompute"
+
+def test_base_exceptions_reach_waiters_and_are_not_cached():
+    class Abort(BaseException):
+        pass
+
+    cache = ResultCache()
+    release = threading.Event()
+
+    def aborted():
+        release.wait(5)
+        raise Abort()
+
+    errors = []
+
+    def wait_for_leader():
+        try:
+            cache.get_or_compute('key', aborted)
+        except BaseException as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=wait_for_leader, daemon=True)
+    leader.start()
+    time.sleep(0.05)
+    waiter = threading.Thread(target=wait_for_leader, daemon=True)
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+    assert len(errors) == 2 and all(isinstance(e, Abort) for e in errors), \
+        "The waiter should see the leader's error, not a missing value"
+    assert 'key' not in cache, "Nothing should be stored when no value was produced"
+    assert len(cache.get_or_compute('key', lambda: make_frame(1))) == 1, "A later call should recompute"
@@ -0,0 +1,70 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pandas as pd
+import pytest
+from src.retraining import retrain, compare_retraining, load_history
+from src.recommender import load_model_and_encoders
+from src.synthetic import generate_dataset
+
+@pytest.fixture
+def data_dir(tmp_path):
+    path = str(tmp_path / "synthetic")
+    generate_dataset(300, path, seed=5)
+    return path
+
+def test_incremental_retrain_extends_checkpoint(data_dir, tmp_path):
+    models_dir = str(tmp_path / "models")
+    full = retrain(data_dir, models_dir, mode='auto', n_stages=5)
+    assert full['mode'] == 'full' and full['parent'] is None, "First run has nothing to extend"
+
+    liked_path = os.path.join(data_dir, 'LikedUsers.csv')
+    liked = pd.read_csv(liked_path)
+    pd.concat([liked, liked.head(20)]).to_csv(liked_path, index=False)
+    incremental = retrain(data_dir, models_dir, mode='auto', n_stages=5)
+    assert incremental['mode'] == 'incremental', "A checkpoint should be extended"
+    assert incremental['parent'] == full['version'], "Increment should record the version it extends"
+    assert incremental['stages'] == full['stages'] + 5, "Increment should add boosting stages"
+    assert incremental['new_interactions'] > 0, "Only appended interactions are trained on"
+    assert incremental['version'] != full['version'], "Each run saves a new version"
+    assert [e['mode'] for e in load_history(models_dir)] == ['full', 'incremental'], "History should keep both runs"
+
+def test_incremental_keeps_checkpoint_encoding(data_dir, tmp_path):
+    models_dir = str(tmp_path / "models")
+    retrain(data_dir, models_dir, mode='auto', n_stages=5)
+    _, _, label_encoders, tfidf, user_to_idx, profile_to_idx = load_model_and_encoders(models_dir)
+
+    profiles_path = os.path.join(data_dir, 'Profiles.csv')
+    profiles = pd.read_csv(profiles_path, dtype=str)
+    new_profile = profiles.iloc[[3]].assign(__id__='pnew', userId='unew')
+    pd.concat([new_profile, profiles]).to_csv(profiles_path, index=False)
+    incremental = retrain(data_dir, models_dir, mode='auto', n_stages=5)
+    assert incremental['mode'] == 'incremental', "A profile with known categories should not force a full retrain"
+    _, _, saved_encoders, saved_tfidf, saved_users, saved_profiles = load_model_and_encoders(models_dir)
+    assert all(saved_users[u] == i for u, i in user_to_idx.items()), "Existing users should keep their index"
+    assert all(saved_profiles[p] == i for p, i in profile_to_idx.items()), "Existing profiles should keep their index"
+    assert saved_users['unew'] == len(user_to_idx) and saved_profiles['pnew'] == len(profile_to_idx), \
+        "New ids should be appended"
+    for col, encoder in label_encoders.items():
+        assert list(saved_encoders[col].classes_) == list(encoder.classes_), f"{col} codes should not shift"
+    assert saved_tfidf.vocabulary_ == tfidf.vocabulary_, "The vocabulary should be kept"
+
+    profiles = pd.read_csv(profiles_path, dtype=str)
+    new_country = profiles.iloc[[0]].assign(__id__='pnew2', userId='unew2', country='Atlantis')
+    pd.concat([profiles, new_country]).to_csv(profiles_path, index=False)
+    fallback = retrain(data_dir, models_dir, mode='auto', n_stages=5)
+    assert fallback['mode'] == 'full', "A new category should force a full retrain"
+    assert 'country' in fallback['fallback_reason'], "The history should record why"
+
+def test_incremental_requires_checkpoint(data_dir, tmp_path):
+    with pytest.raises(ValueError, match="No checkpoint"):
+        retrain(data_dir, str(tmp_path / "empty"), mode='incremental')
+
+def test_compare_retraining(data_dir):
+    results = compare_retraining(data_dir, recent_fraction=0.2, n_stages=5, max_users=30)
+    for name in ('full', 'incremental'):
+        assert results[name]['seconds'] > 0, f"{name} training time should be reported"
+        assert results[name]['holdout_rmse'] >= 0, f"{name} holdout error should be reported"
+        assert 'ndcg@5' in results[name], f"{name} ranking quality should be reported"
+    assert results['recent_interactions'] > 0, "The increment should train on recent interactions"
@@ -0,0 +1,90 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import copy
+import time
+import joblib
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from src.pipeline import MatchEngine
+from src.shadow_scoring import ShadowScorer, load_shadow_model
+from src.utils import save_models
+
+class ShiftedModel:
+    """Candidate version whose scores are the live model's reversed."""
+
+    def __init__(self, model, delay=0.0):
+        self.model = model
+        self.delay = delay
+
+    def predict(self, X):
+        time.sleep(self.delay)
+        return 1.0 - self.model.predict(X)
+
+def test_same_model_agrees_on_every_path(engine_inputs, user_profile):
+    model, scaler = engine_inputs[2], engine_inputs[3]
+    for kwargs, viewer in (({}, user_profile), ({}, dict(user_profile, userId='user123')),
+                           ({'reciprocal': True}, user_profile)):
+        shadow = ShadowScorer(model, scaler)
+        MatchEngine(*engine_inputs, shadow=shadow, **kwargs).recommend(viewer)
+        report = shadow.close()
+        assert report['batches'] == 1 and report['errors'] == 0, (kwargs, viewer['userId'], report)
+        assert report['agreement']['mean_abs_diff'] < 1e-9, "Identical models should score identically"
+        assert report['agreement']['top_k_overlap']['mean'] == 1.0
+        assert np.isclose(report['live']['scores']['mean'], report['shadow']['scores']['mean'])
+        assert report['live']['latency']['p50_ms'] > 0 and report['shadow']['latency']['p50_ms'] > 0
+
+def test_reversed_model_disagrees(engine_inputs, user_profile):
+    model, scaler = engine_inputs[2], engine_inputs[3]
+    shadow = ShadowScorer(ShiftedModel(model), scaler, top_k=2)
+    engine = MatchEngine(*engine_inputs, shadow=shadow)
+    baseline = engine.recommend(user_profile)
+    report = shadow.close()
+    assert report['agreement']['mean_abs_diff'] > 0
+    if report['agreement']['spearman']['count']:
+        assert report['agreement']['spearman']['mean'] < 0, "Reversed scores should rank-correlate negatively"
+    assert sum(report['shadow']['scores']['histogram']) == report['rows'], "Every shadow score should be binned"
+    assert engine.recommend(user_profile)['__id__'].tolist() == baseline['__id__'].tolist(), \
+        "Shadow scores must not change what is served"
+
+def test_slow_shadow_drops_instead_of_blocking(engine_inputs, user_profile):
+    model, scaler = engine_inputs[2], engine_inputs[3]
+    shadow = ShadowScorer(ShiftedModel(model, delay=0.2), scaler, max_pending=1)
+    engine = MatchEngine(*engine_inputs, shadow=shadow)
+    start = time.perf_counter()
+    for _ in range(5):
+        engine.score_candidates(user_profile, engine.filter_candidates(user_profile))
+    assert time.perf_counter() - start < 0.5, "Requests should not wait for the shadow model"
+    report = shadow.close()
+    assert report['dropped'] >= 2 and report['batches'] + report['dropped'] == 5, report
+
+def test_load_shadow_model_checks_feature_layout(engine_inputs, tmp_path):
+    model, scaler = engine_inputs[2], engine_inputs[3]
+    joblib.dump(model, os.path.join(str(tmp_path), "matchmaking_model.pkl"))
+    joblib.dump(scaler, os.path.join(str(tmp_path), "scaler.pkl"))
+    loaded, _ = load_shadow_model(str(tmp_path), scaler)
+    assert loaded is not None, "A model over the same features should load"
+    assert load_shadow_model(str(tmp_path), scaler, engine_inputs[5]) == (None, None), \
+        "A vocabulary that cannot be checked should be refused"
+    joblib.dump(StandardScaler().fit(np.zeros((2, 3))), os.path.join(str(tmp_path), "scaler.pkl"))
+    assert load_shadow_model(str(tmp_path), scaler) == (None, None), "A different feature count should be refused"
+    assert load_shadow_model(str(tmp_path / "missing"), scaler) == (None, None)
+
+def test_load_shadow_model_checks_encoding(engine_inputs, tmp_path):
+    _, _, model, scaler, label_encoders, tfidf, user_to_idx, profile_to_idx = engine_inputs
+    live = (scaler, tfidf, label_encoders, user_to_idx, profile_to_idx)
+    shadow_dir = str(tmp_path)
+    # A retrain that only appended new users and profiles still encodes like the live model
+    save_models(model, scaler, label_encoders, tfidf, dict(user_to_idx, new_user=len(user_to_idx)),
+                dict(profile_to_idx, new_profile=len(profile_to_idx)), shadow_dir)
+    assert load_shadow_model(shadow_dir, *live)[0] is not None, "Appended ids should be accepted"
+
+    swapped = dict(profile_to_idx, profile0=profile_to_idx['profile1'], profile1=profile_to_idx['profile0'])
+    save_models(model, scaler, label_encoders, tfidf, user_to_idx, swapped, shadow_dir)
+    assert load_shadow_model(shadow_dir, *live) == (None, None), "Re-numbered profiles should be refused"
+
+    encoders = copy.deepcopy(label_encoders)
+    encoders['country'].classes_ = np.array(['Atlantis'] + list(encoders['country'].classes_))
+    save_models(model, scaler, encoders, tfidf, user_to_idx, profile_to_idx, shadow_dir)
+    assert load_shadow_model(shadow_dir, *live) == (None, None), "Shifted category codes should be refused"
@@ -0,0 +1,80 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+import numpy as np
+import pandas as pd
+from src.pipeline import MatchEngine
+from scipy.sparse import csr_matrix
+from src.sharding import (hash_partition, country_partition, build_shards, merge_top_k, merge_diverse,
+                          ShardedMatchEngine)
+
+def test_hash_partition_is_stable():
+    ids = [f'profile{i}' for i in range(100)]
+    first = hash_partition(ids, 4)
+    assert first.tolist() == hash_partition(ids, 4).tolist(), "Assignment should be deterministic"
+    assert set(first.tolist()) == {0, 1, 2, 3}, "All shards should receive profiles"
+
+def test_country_partition_keeps_countries_together():
+    codes = np.array([0] * 50 + [1] * 30 + [2] * 20 + [3] * 10)
+    shards = country_partition(codes, 2)
+    for code in range(4):
+        assert len(set(shards[codes == code])) == 1, "A country should live in a single shard"
+    loads = np.bincount(shards, minlength=2)
+    assert abs(loads[0] - loads[1]) <= 20, "Shards should be roughly balanced"
+
+def test_build_shards_covers_store(engine_inputs):
+    store, X_features, _, _, _, _, user_to_idx, profile_to_idx = engine_inputs
+    shards = build_shards(store, X_features, user_to_idx, profile_to_idx, ['profile4'], n_shards=2,
+                          partition='country')
+    ids = sorted(pid for shard in shards for pid in shard['store'].table['__id__'])
+    assert ids == sorted(store.table['__id__']), "Every profile should be in exactly one shard"
+    for shard in shards:
+        assert shard['X_features'].shape[0] == len(shard['store']), "One feature row per shard profile"
+        assert len(shard['countries']) == 1, "Country partitioning should not split countries"
+    assert {'profile4'} == set().union(*(shard['excluded_ids'] for shard in shards))
+
+def test_merge_top_k():
+    a = pd.DataFrame({'__id__': ['a1', 'a2'], 'final_score': [0.9, 0.5]})
+    b = pd.DataFrame({'__id__': ['b1', 'b2'], 'final_score': [0.7, 0.6]})
+    merged = merge_top_k([a, pd.DataFrame(), b], 3)
+    assert merged['__id__'].tolist() == ['a1', 'b1', 'b2'], "Heap merge should keep the global top-K"
+    assert merged.attrs['partial'] is False
+    assert merge_top_k([], 3).attrs == {'partial': False, 'scored_fraction': 1.0}, \
+        "An empty merge should carry the same attrs as a served result"
+
+def test_merge_diverse_reranks_the_merged_shortlist():
+    # Shard a holds the two best scores but both are Kenyan soccer fans
+    a = pd.DataFrame({'__id__': ['a1', 'a2'], 'final_score': [0.9, 0.85], 'country': ['Kenya', 'Kenya']})
+    b = pd.DataFrame({'__id__': ['b1'], 'final_score': [0.8], 'country': ['Nigeria']})
+    text_a = csr_matrix(np.array([[1.0, 0.0], [1.0, 0.0]]))
+    text_b = csr_matrix(np.array([[0.0, 1.0]]))
+    top = merge_diverse([(a, text_a), (pd.DataFrame(), None), (b, text_b)], 2, 3, diversity_lambda=0.5,
+                        diversity_columns=('country',))
+    assert top['__id__'].tolist() == ['a1', 'b1'], "The near-copy of the first pick should give way"
+    assert list(top.columns) == ['__id__', 'final_score', 'country'] and top.attrs['partial'] is False
+
+def test_sharded_engine_matches_single_process(engine_inputs, user_profile):
+    store, X_features, model, scaler, label_encoders, tfidf, user_to_idx, profile_to_idx = engine_inputs
+    expected = MatchEngine(*engine_inputs, blocked_ids=['profile4']).recommend(user_profile, top_k=3)
+    shards = build_shards(store, X_features, user_to_idx, profile_to_idx, ['profile4'], n_shards=2)
+    with ShardedMatchEngine(shards, model, scaler, label_encoders, tfidf, user_to_idx) as engine:
+        top_matches = engine.recommend(user_profile, top_k=3)
+        assert top_matches['__id__'].tolist() == expected['__id__'].tolist(), \
+            "Scatter-gather should return the same matches as one process"
+        assert top_matches['final_score'].tolist() == pytest.approx(expected['final_score'].tolist())
+        engine.set_exclusions([expected['__id__'].iloc[0]])
+        assert expected['__id__'].iloc[0] not in engine.recommend(user_profile)['__id__'].tolist(), \
+            "Exclusion updates should reach every shard"
+
+def test_sharded_diversity_reranks_after_merge(engine_inputs, user_profile):
+    store, X_features, model, scaler, label_encoders, tfidf, user_to_idx, profile_to_idx = engine_inputs
+    expected = MatchEngine(*engine_inputs, diversity_shortlist=8, diversity_lambda=0.3).recommend(user_profile, top_k=4)
+    shards = build_shards(store, X_features, user_to_idx, profile_to_idx, n_shards=2)
+    with ShardedMatchEngine(shards, model, scaler, label_encoders, tfidf, user_to_idx,
+                            engine_kwargs={'diversity_shortlist': 8, 'diversity_lambda': 0.3}) as engine:
+        top_matches = engine.recommend(user_profile, top_k=4)
+    assert top_matches['__id__'].tolist() == expected['__id__'].tolist(), \
+        "MMR over the merged shortlist should select and order as one process does"
+    assert '_text_row' not in top_matches.columns
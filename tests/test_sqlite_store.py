@@ -0,0 +1,96 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+import pandas as pd
+from src.data_loader import load_data
+from src.profile_store import ProfileStore
+from src.agent import apply_rules_compact
+from src.synthetic import generate_dataset
+from src.sqlite_store import import_csvs, load_sqlite_data, SQLiteProfileStore
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """Synthetic CSVs plus a re-uploaded (duplicate) profile row."""
+    data_dir = str(tmp_path / "synthetic")
+    generate_dataset(300, data_dir, seed=5)
+    path = os.path.join(data_dir, 'Profiles.csv')
+    profiles = pd.read_csv(path, dtype=str)
+    duplicate = profiles.iloc[[0]].copy()
+    duplicate['aboutMe'] = 'Updated bio'
+    pd.concat([profiles, duplicate]).to_csv(path, index=False)
+    return data_dir
+
+@pytest.fixture
+def sqlite_store(data_dir, tmp_path):
+    db_path = str(tmp_path / "profiles.sqlite")
+    import_csvs(data_dir, db_path)
+    with SQLiteProfileStore(db_path) as store:
+        yield store
+
+@pytest.fixture
+def viewer():
+    return {'userId': 'u000000001', 'sex': 'Male', 'seeking': 'Female', 'age': 27,
+            'country': 'Nigeria', 'language': 'English', 'relationshipGoals': 'Long-term', 'aboutMe': ''}
+
+def test_load_data_matches_csv_loader(data_dir, sqlite_store):
+    expected = load_data(data_dir)
+    loaded = sqlite_store.load_data()
+    pd.testing.assert_frame_equal(loaded[0], expected[0])
+    updated = loaded[0].loc[loaded[0]['__id__'] == 'p000000000', 'aboutMe'].tolist()
+    assert updated == ['Updated bio'], "The last upload of a profile should win"
+    pd.testing.assert_frame_equal(loaded[1], expected[1])
+    pd.testing.assert_frame_equal(loaded[2], expected[2])
+    for got, want in zip(loaded[3:], expected[3:]):
+        assert sorted(got) == sorted(set(want)), "Exclusion lists should hold the same ids"
+
+def test_invalid_updated_at_loses_in_sql(data_dir, tmp_path):
+    path = os.path.join(data_dir, 'Profiles.csv')
+    profiles = pd.read_csv(path, dtype=str)
+    # The re-upload (last row) carries an unparseable timestamp, the original a valid one
+    profiles['updatedAt'] = ['2024-03-01'] * (len(profiles) - 1) + ['garbage']
+    profiles.to_csv(path, index=False)
+    db_path = str(tmp_path / "profiles.sqlite")
+    import_csvs(data_dir, db_path)
+    with SQLiteProfileStore(db_path) as store:
+        loaded = store.load_data()[0]
+    bio = loaded.loc[loaded['__id__'] == 'p000000000', 'aboutMe'].tolist()
+    assert bio != ['Updated bio'], "A garbage timestamp should lose to a valid one"
+    pd.testing.assert_frame_equal(loaded, load_data(data_dir)[0])
+
+def test_filter_profiles_matches_apply_rules(data_dir, sqlite_store, viewer):
+    profiles, _, _, blocked, declined, deleted, reported = load_data(data_dir)
+    store = ProfileStore.from_profiles(profiles)
+    expected = apply_rules_compact(store, viewer, blocked, declined, deleted, reported)
+    filtered = sqlite_store.filter_profiles(viewer)
+    assert filtered['__id__'].tolist() == expected['__id__'].tolist(), "SQL filter should match apply_rules"
+    assert filtered['country_match'].tolist() == expected['country_match'].tolist()
+    assert sorted(sqlite_store.candidate_ids(viewer)) == sorted(expected['__id__'])
+
+def test_candidate_query_uses_covering_index(sqlite_store, viewer):
+    plan = ' '.join(sqlite_store.query_plan(viewer))
+    assert 'COVERING INDEX idx_profiles_rules' in plan, f"Candidate fetch should be an index range scan: {plan}"
+
+def test_point_lookups_and_exclusion_updates(sqlite_store, viewer):
+    candidate = sqlite_store.candidate_ids(viewer)[0]
+    profile = sqlite_store.profile(candidate)
+    assert profile['__id__'] == candidate
+    assert sqlite_store.profiles_for_user(profile['userId']) == [candidate]
+    assert sqlite_store.profile('missing') is None
+    sqlite_store.add_exclusions('blocked', [candidate])
+    assert candidate not in sqlite_store.candidate_ids(viewer), "New exclusions should apply immediately"
+    with pytest.raises(ValueError):
+        sqlite_store.add_exclusions('muted', [candidate])
+
+def test_failed_import_is_retried(data_dir):
+    blocked = os.path.join(data_dir, 'BlockedUsers.csv')
+    os.rename(blocked, blocked + ".bak")
+    assert load_sqlite_data(data_dir)[0] is None, "A missing CSV should fail the load"
+    assert not os.path.exists(os.path.join(data_dir, 'profiles.sqlite')), "A failed import should leave no database"
+    os.rename(blocked + ".bak", blocked)
+    profiles = load_sqlite_data(data_dir)[0]
+    assert profiles is not None and len(profiles) == 300, "The import should be retried once the CSV is back"
+
+    pd.read_csv(blocked, dtype=str).iloc[:0].to_csv(blocked, index=False)
+    assert load_sqlite_data(data_dir)[3] == [], "A changed CSV should be re-imported"
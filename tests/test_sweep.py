@@ -0,0 +1,41 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from src.recommender import training_rows
+from src.sweep import parameter_grid, random_search, cached_design_matrix, sweep
+from src.synthetic import generate_dataset
+
+def test_parameter_grid_and_random_search():
+    grid = {'max_depth': [2, 3], 'n_estimators': [10, 20, 30]}
+    configs = parameter_grid(grid)
+    assert len(configs) == 6, "Grid should cover every combination"
+    assert {'max_depth': 2, 'n_estimators': 10} in configs, "Combinations should be param dicts"
+    picks = random_search(grid, 4, seed=1)
+    assert len(picks) == 4 and all(p in configs for p in picks), "Random search should sample the grid"
+    assert len({tuple(sorted(p.items())) for p in picks}) == 4, "Random picks should be distinct"
+
+def test_cached_design_matrix(tmp_path):
+    interaction_matrix = csr_matrix(([1, 2], ([0, 1], [0, 1])), shape=(2, 2))
+    X_features = csr_matrix([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+    design_path, labels_path = cached_design_matrix(interaction_matrix, X_features, str(tmp_path))
+    X, y = training_rows(interaction_matrix, X_features)
+    assert np.array_equal(np.load(design_path, mmap_mode='r'), X), "Cached rows should match training_rows"
+    assert np.array_equal(np.load(labels_path, mmap_mode='r'), y), "Cached labels should match training_rows"
+    mtime = os.stat(design_path).st_mtime_ns
+    assert cached_design_matrix(interaction_matrix, X_features, str(tmp_path))[0] == design_path, \
+        "Same inputs should map to the same cache file"
+    assert os.stat(design_path).st_mtime_ns == mtime, "Cached matrix should be reused, not rebuilt"
+
+def test_sweep_on_synthetic_data(tmp_path):
+    data_dir = str(tmp_path / "synthetic")
+    generate_dataset(300, data_dir, seed=4)
+    configs = [{'n_estimators': 10, 'max_depth': 2}, {'n_estimators': 20, 'max_depth': 3}]
+    results = sweep(configs, data_dir, max_users=20, workers=2, cache_dir=str(tmp_path / "cache"))
+    assert sorted(r['params']['n_estimators'] for r in results) == [10, 20], "Every configuration should run"
+    for result in results:
+        for key in ('train_seconds', 'predict_ms_per_1k_rows', 'holdout_rmse', 'ndcg@5'):
+            assert key in result, f"Results should record {key}"
+    assert results[0]['ndcg@5'] >= results[1]['ndcg@5'], "Results should be ordered best first"
@@ -0,0 +1,40 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pickle
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from src.text_features import fit_text_features, tokenise, FrozenVocabulary, TokenCache
+
+BIOS = pd.Series(['Love soccer and music', 'Football fan, love travel', 'Seeking my soul mate',
+                  'Love love love soccer', None, 'Partner wanted for travel and music', 'Reading'] * 3)
+PARAMS = {'max_features': 6, 'stop_words': 'english', 'min_df': 1}
+
+def test_matches_sklearn_fit_transform(tmp_path):
+    reference = TfidfVectorizer(**PARAMS)
+    expected = reference.fit_transform(BIOS.fillna(''))
+    for workers, chunk_size in ((1, 20000), (3, 4)):
+        tfidf, matrix = fit_text_features(BIOS, PARAMS, str(tmp_path), workers=workers, chunk_size=chunk_size)
+        assert tfidf.vocabulary_ == reference.vocabulary_, "Vocabulary selection should match sklearn"
+        assert np.allclose(matrix.toarray(), expected.toarray()), "TF-IDF values should match sklearn"
+    restored = pickle.loads(pickle.dumps(tfidf))
+    assert np.allclose(restored.transform(['love soccer']).toarray(), reference.transform(['love soccer']).toarray())
+
+def test_token_cache_skips_unchanged_bios(tmp_path):
+    tfidf, _ = fit_text_features(BIOS, PARAMS, str(tmp_path))
+    cache_file, = [f for f in os.listdir(tmp_path) if f.startswith('tokens_')]
+    cache = TokenCache.load(os.path.join(str(tmp_path), cache_file))
+    assert len(cache) == BIOS.fillna('').nunique(), "One cache entry per distinct bio"
+    edited = pd.concat([BIOS, pd.Series(['Brand new bio about hiking'])], ignore_index=True)
+    cache, token_ids = tokenise(edited, PARAMS, cache)
+    assert len(cache) == BIOS.fillna('').nunique() + 1, "Only the new bio should be tokenised"
+    assert [cache.terms[i] for i in token_ids[0]] == ['love', 'soccer', 'music']
+
+def test_frozen_vocabulary_transform_one():
+    for params in (PARAMS, {'sublinear_tf': True}, {'norm': 'l1', 'use_idf': False}):
+        tfidf = TfidfVectorizer(**params).fit(BIOS.fillna(''))
+        frozen = FrozenVocabulary.from_vectorizer(tfidf)
+        for text in ['love love soccer and music', 'nothing in the vocabulary', '']:
+            assert np.allclose(frozen.transform_one(text), tfidf.transform([text]).toarray()[0]), (params, text)
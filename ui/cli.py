@@ -6,9 +6,18 @@ import argparse
 import logging
 from src.data_loader import load_data, load_config
 from src.preprocessing import preprocess_data
-from src.recommender import train_model, predict_compatibility, load_model_and_scaler
-from src.agent import apply_rules, encode_user_profile
-from src.utils import save_models, save_recommendations
+from src.recommender import train_model, load_model_and_encoders, model_version
+from src.profile_store import ProfileStore
+from src.pipeline import MatchEngine, engine_options, create_result_cache
+from src.batch import check_profile, run_batch
+from src.sharding import PARTITIONS, build_shards, ShardedMatchEngine
+from src.near_duplicates import suppressed_profile_ids
+from src.cold_start import load_cold_start
+from src.event_ingest import create_ingestor
+from src.request_profiler import create_profiler
+from src.shadow_scoring import create_shadow
+from src import instrumentation
+from src.utils import save_models, create_recommendation_sink
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,28 +26,26 @@ logger = logging.getLogger(__name__)
 def validate_args(args):
     """Validate CLI arguments."""
     try:
-        if not args.user_id or len(args.user_id) > 50:
-            raise ValueError("User ID must be non-empty and less than 50 characters")
-        if args.age < 18 or args.age > 70:
-            raise ValueError("Age must be between 18 and 70")
-        if args.sex not in ["Female", "Male", "unknown"]:
-            raise ValueError("Sex must be 'Female', 'Male', or 'unknown'")
-        if args.seeking not in ["Female", "Male", "unknown"]:
-            raise ValueError("Seeking must be 'Female', 'Male', or 'unknown'")
-        if len(args.country) > 100:
-            raise ValueError("Country must be less than 100 characters")
-        if len(args.language) > 100:
-            raise ValueError("Language must be less than 100 characters")
-        if len(args.relationship_goals) > 100:
-            raise ValueError("Relationship Goals must be less than 100 characters")
-        if len(args.about_me) > 1000:
-            raise ValueError("About Me must be less than 1000 characters")
+        check_profile(profile_from_args(args))
     except ValueError as e:
         logger.error(f"Input validation error: {e}")
         print(f"Error: {e}")
         return False
     return True
 
+def profile_from_args(args):
+    """Viewer profile from the single-request flags."""
+    return {
+        'userId': args.user_id,
+        'age': args.age,
+        'sex': args.sex,
+        'seeking': args.seeking,
+        'country': args.country,
+        'language': args.language,
+        'relationshipGoals': args.relationship_goals,
+        'aboutMe': args.about_me
+    }
+
 def main():
     parser = argparse.ArgumentParser(description="Africa Love Match - Matchmaking AI Agent CLI")
     parser.add_argument("--user_id", default="user123", help="User ID")
@@ -49,29 +56,43 @@ def main():
     parser.add_argument("--language", default="unknown", help="Language")
     parser.add_argument("--relationship_goals", default="unknown", help="Relationship Goals")
     parser.add_argument("--about_me", default="Looking for true love and enjoy soccer", help="About Me")
+    parser.add_argument("--metrics_out", default=None,
+                        help="Write per-stage metrics to this file (.prom for Prometheus text, otherwise JSON)")
+    parser.add_argument("--time_budget_ms", type=float, default=None,
+                        help="Per-request time budget; candidates not scored in time get rule-only scores")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="Serve from N shard worker processes (defaults to config sharding.n_shards)")
+    parser.add_argument("--partition", default=None, choices=PARTITIONS,
+                        help="Shard by hash of __id__ or by country (defaults to config sharding.partition)")
+    parser.add_argument("--batch", default=None,
+                        help="JSONL file of user profiles to process in one run ('-' for stdin)")
+    parser.add_argument("--output", default=None, help="Batch mode: JSONL results file (defaults to stdout)")
+    parser.add_argument("--chunk_size", type=int, default=100, help="Batch mode: profiles per work chunk")
+    parser.add_argument("--workers", type=int, default=1, help="Batch mode: worker processes")
 
     args = parser.parse_args()
-    if not validate_args(args):
+    if not args.batch and not validate_args(args):
         return
 
     config = load_config()
-    user_profile = {
-        'userId': args.user_id,
-        'age': args.age,
-        'sex': args.sex,
-        'seeking': args.seeking,
-        'country': args.country,
-        'language': args.language,
-        'relationshipGoals': args.relationship_goals,
-        'aboutMe': args.about_me
-    }
+    instrumentation.configure(config)
+    if args.metrics_out:
+        instrumentation.enable()
+    user_profile = profile_from_args(args)
 
     # Load data
-    (profiles, liked, matched, blocked_ids, declined_ids, deleted_ids, reported_ids) = load_data(data_dir=config['data_dir'])
+    (profiles, liked, matched, blocked_ids, declined_ids, deleted_ids, reported_ids) = load_data(data_dir=config['data']['data_dir'])
     if profiles is None:
         print("Error: Failed to load data. Check logs for details.")
         return
 
+    # Near-duplicate/spam bios to exclude (before preprocess_data encodes columns in place)
+    suppressed_ids = suppressed_profile_ids(profiles, config)
+
+    # Compact profile store (built before preprocess_data encodes columns in place)
+    store = ProfileStore.from_profiles(profiles, config['preprocessing']['categorical_columns'],
+                                       config['preprocessing']['keywords'])
+
     # Preprocess data
     try:
         (profiles, interaction_matrix, X_features, user_to_idx, profile_to_idx, 
@@ -82,63 +103,85 @@ def main():
         return
 
     # Load or train model
-    model, scaler = load_model_and_scaler(config['models_dir'])
+    model, scaler, _, _, _, _ = load_model_and_encoders(config['model']['models_dir'])
     if model is None or scaler is None:
         logger.info("Training new model")
         try:
             model, scaler = train_model(interaction_matrix, X_features)
             save_models(model, scaler, label_encoders, tfidf, user_to_idx, profile_to_idx, 
-                        models_dir=config['models_dir'])
+                        models_dir=config['model']['models_dir'])
         except Exception as e:
             logger.error(f"Model training failed: {e}")
             print("Error: Model training failed. Check logs for details.")
             return
 
-    # Apply rules
-    try:
-        filtered_profiles = apply_rules(profiles, user_profile, blocked_ids, declined_ids, 
-                                       deleted_ids, reported_ids)
-    except Exception as e:
-        logger.error(f"Rule application failed: {e}")
-        print("Error: Rule application failed. Check logs for details.")
-        return
-    
-    if filtered_profiles.empty:
-        print("Error: No compatible profiles found after rule-based filtering.")
-        logger.warning("No compatible profiles found after rule-based filtering")
-        return
+    # Recommend: rules, encoding, ML scoring, top-K and logging
+    sink = create_recommendation_sink(model_version(config['model']['models_dir']))
+    n_shards = args.shards if args.shards is not None else config.get('sharding', {}).get('n_shards', 0)
+    if n_shards > 1:
+        shards = build_shards(store, X_features, user_to_idx, profile_to_idx,
+                              set(blocked_ids).union(declined_ids, deleted_ids, reported_ids, suppressed_ids),
+                              n_shards,
+                              args.partition or config.get('sharding', {}).get('partition', 'hash'))
+        engine = ShardedMatchEngine(shards, model, scaler, label_encoders, tfidf, user_to_idx,
+                                    sink=None if args.batch else sink,
+                                    engine_kwargs=engine_options(config)).start()
+    else:
+        engine = MatchEngine(store, X_features, model, scaler, label_encoders, tfidf, user_to_idx,
+                             profile_to_idx, blocked_ids, declined_ids, deleted_ids, reported_ids,
+                             sink=None if args.batch else sink, interaction_matrix=interaction_matrix,
+                             suppressed_ids=suppressed_ids, cold_start=load_cold_start(config, store),
+                             profiler=create_profiler(config),
+                             shadow=create_shadow(config, scaler, tfidf, label_encoders, user_to_idx, profile_to_idx),
+                             result_cache=create_result_cache(config) if args.batch else None,
+                             **engine_options(config))
 
-    # Encode user profile
-    try:
-        user_features = encode_user_profile(user_profile, label_encoders, tfidf)
-    except Exception as e:
-        logger.error(f"User profile encoding failed: {e}")
-        print("Error: User profile encoding failed. Check logs for details.")
+    # Blocks, deletions, likes, ... logged since the CSV snapshot
+    ingestor = create_ingestor(config, engine)
+    if ingestor is not None:
+        ingestor.catch_up()
+
+    if args.batch:
+        # Shard workers hold pipes that cannot be shared with forked batch workers
+        workers = 1 if n_shards > 1 else args.workers
+        stream = sys.stdin if args.batch == '-' else open(args.batch, 'r', encoding='utf-8')
+        out = sys.stdout if args.output is None else open(args.output, 'w', encoding='utf-8')
+        try:
+            run_batch(engine, stream, out, chunk_size=args.chunk_size, workers=workers, sink=sink,
+                      time_budget_ms=args.time_budget_ms)
+        finally:
+            for f in (stream, out):
+                if f not in (sys.stdin, sys.stdout):
+                    f.close()
+            if n_shards > 1:
+                engine.close()
+            sink.close()
+            if args.metrics_out:
+                instrumentation.write_metrics(args.metrics_out)
         return
 
-    # Predict compatibility
     try:
-        filtered_profiles = predict_compatibility(model, scaler, user_profile['userId'], 
-                                                filtered_profiles, X_features, 
-                                                user_to_idx, profile_to_idx)
+        top_matches = engine.recommend(user_profile, time_budget_ms=args.time_budget_ms)
     except Exception as e:
-        logger.error(f"Prediction failed: {e}")
-        print("Error: Prediction failed. Check logs for details.")
+        logger.error(f"Recommendation failed: {e}")
+        print("Error: Recommendation failed. Check logs for details.")
         return
-    
-    # Top 5 matches
-    top_matches = filtered_profiles.sort_values('final_score', ascending=False).head(5)
-    
-    # Save recommendations
-    try:
-        save_recommendations(top_matches, output_dir=config['data_dir'])
-    except Exception as e:
-        logger.error(f"Failed to save recommendations: {e}")
-        print("Error: Failed to save recommendations. Check logs for details.")
+    finally:
+        if n_shards > 1:
+            engine.close()
+        sink.close()
+        if args.metrics_out:
+            instrumentation.write_metrics(args.metrics_out)
+
+    if top_matches.empty:
+        print("Error: No compatible profiles found after rule-based filtering.")
         return
 
     # Display results
     print("\nTop Compatible Profiles:")
+    if top_matches.attrs.get('partial'):
+        print(f"(Partial result: time budget reached after ML-scoring "
+              f"{top_matches.attrs['scored_fraction']:.0%} of candidates)")
     for _, row in top_matches.iterrows():
         print(f"Profile ID: {row['__id__']}")
         print(f"User Name: {row['userName']}")
@@ -7,9 +7,16 @@ import time
 import logging
 from src.data_loader import load_data, load_config
 from src.preprocessing import preprocess_data
-from src.recommender import train_model, predict_compatibility, load_model_and_encoders
-from src.agent import apply_rules, encode_user_profile
-from src.utils import save_models, save_recommendations
+from src.recommender import train_model, load_model_and_encoders, model_version
+from src.profile_store import ProfileStore
+from src.pipeline import MatchEngine, QuerySession, engine_options, create_result_cache
+from src.near_duplicates import suppressed_profile_ids
+from src.cold_start import load_cold_start
+from src.event_ingest import create_ingestor, start_ingestion, stop_ingestion
+from src.request_profiler import create_profiler
+from src.shadow_scoring import create_shadow
+from src import instrumentation
+from src.utils import save_models, create_recommendation_sink
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -18,10 +25,58 @@ logger = logging.getLogger(__name__)
 def cached_load_data(data_dir):
     return load_data(data_dir=data_dir)
 
+@st.cache_resource
+def cached_build_store(_profiles, data_dir, categorical_cols, keywords):
+    return ProfileStore.from_profiles(_profiles, list(categorical_cols), list(keywords))
+
 @st.cache_resource
 def cached_preprocess_data(profiles, liked, matched):
     return preprocess_data(profiles, liked, matched)
 
+@st.cache_resource
+def cached_suppressed_ids(_profiles, data_dir):
+    return suppressed_profile_ids(_profiles, load_config())
+
+@st.cache_resource
+def cached_recommendation_sink(version):
+    return create_recommendation_sink(version)
+
+@st.cache_resource
+def cached_result_cache():
+    # Shared by the per-click engines; entries are keyed on model and exclusion versions
+    return create_result_cache(load_config())
+
+@st.cache_resource
+def cached_match_engine(_store, _X_features, _model, _scaler, _label_encoders, _tfidf, _user_to_idx,
+                        _profile_to_idx, _exclusions, _suppressed_ids, _interaction_matrix, version):
+    # One engine per model version, so the per-row precomputation is not repeated on every rerun
+    config = load_config()
+    return MatchEngine(_store, _X_features, _model, _scaler, _label_encoders, _tfidf, _user_to_idx,
+                       _profile_to_idx, *_exclusions, suppressed_ids=_suppressed_ids,
+                       cold_start=load_cold_start(config, _store, version), profiler=create_profiler(config),
+                       shadow=create_shadow(config, _scaler, _tfidf, _label_encoders, _user_to_idx, _profile_to_idx),
+                       sink=cached_recommendation_sink(version),
+                       interaction_matrix=_interaction_matrix, result_cache=cached_result_cache(),
+                       model_version=version, **engine_options(config))
+
+@st.cache_resource
+def running_ingestion():
+    # The one live (ingestor, thread, stop) across model versions, so a single thread owns the checkpoint
+    return {}
+
+@st.cache_resource
+def cached_event_ingestion(_engine, version):
+    # One tailing thread per engine: events keep flowing in between reruns. A new model version
+    # stops the previous thread first, so its final checkpoint is what the new ingestor restores
+    running = running_ingestion()
+    if 'current' in running:
+        _, thread, stop = running.pop('current')
+        stop_ingestion(thread, stop)
+    ingestor = create_ingestor(load_config(), _engine)
+    if ingestor is not None:
+        running['current'] = (ingestor, *start_ingestion(ingestor))
+    return ingestor
+
 @st.cache_resource
 def cached_train_model(_interaction_matrix, _X_features):
     return train_model(_interaction_matrix, _X_features)
@@ -34,6 +89,7 @@ def main():
 
     # Load config
     config = load_config()
+    instrumentation.configure(config)
     data_dir = config['data']['data_dir']
     models_dir = config['model']['models_dir']
 
@@ -68,6 +124,10 @@ def main():
         if profiles is None:
             st.error("Failed to load data. Please check the data directory and CSV files.")
             st.stop()
+        store = cached_build_store(profiles, data_dir,
+                                   tuple(config['preprocessing']['categorical_columns']),
+                                   tuple(config['preprocessing']['keywords']))
+        suppressed_ids = cached_suppressed_ids(profiles, data_dir)
         # Preprocess data to get X_features
         (profiles, interaction_matrix, X_features, user_to_idx, profile_to_idx, 
          label_encoders, tfidf) = cached_preprocess_data(profiles, liked, matched)
@@ -79,6 +139,10 @@ def main():
             st.error("Failed to load data. Please check the data directory and CSV files.")
             st.stop()
 
+        store = cached_build_store(profiles, data_dir,
+                                   tuple(config['preprocessing']['categorical_columns']),
+                                   tuple(config['preprocessing']['keywords']))
+        suppressed_ids = cached_suppressed_ids(profiles, data_dir)
         # Preprocess data
         (profiles, interaction_matrix, X_features, user_to_idx, profile_to_idx, 
          label_encoders, tfidf) = cached_preprocess_data(profiles, liked, matched)
@@ -100,7 +164,12 @@ def main():
     relationship_goals_input = st.text_input("Relationship Goals", "Long-term")
     about_me_input = st.text_area("About Me", "Looking for true love and enjoy soccer!")
 
-    if st.button("Find Matches"):
+    # After the first search, results follow the inputs: each rerun re-queries incrementally,
+    # but only an explicit "Find Matches" click is written to the recommendation log
+    submitted = st.button("Find Matches")
+    if submitted:
+        st.session_state['show_matches'] = True
+    if st.session_state.get('show_matches'):
         user_profile = {
             'userId': user_id_input,
             'age': age_input,
@@ -112,28 +181,21 @@ def main():
             'aboutMe': about_me_input
         }
         
-        # Apply rules
-        filtered_profiles = apply_rules(profiles, user_profile, blocked_ids, declined_ids, 
-                                       deleted_ids, reported_ids)
+        version = model_version(models_dir)
+        engine = cached_match_engine(store, X_features, model, scaler, label_encoders, tfidf, user_to_idx,
+                                     profile_to_idx, (blocked_ids, declined_ids, deleted_ids, reported_ids),
+                                     suppressed_ids, interaction_matrix, version)
+        cached_event_ingestion(engine, version)
+        session = st.session_state.setdefault('query_session', QuerySession())
+        top_matches = engine.recommend_incremental(user_profile, session, persist=submitted)
         
-        if filtered_profiles.empty:
+        if top_matches.empty:
             st.error("No compatible profiles found after rule-based filtering.")
         else:
-            # Encode user profile
-            user_features = encode_user_profile(user_profile, label_encoders, tfidf)
-            
-            # Predict compatibility
-            filtered_profiles = predict_compatibility(model, scaler, user_id_input, 
-                                                    filtered_profiles, X_features, 
-                                                    user_to_idx, profile_to_idx)
-            
-            # Top 5 matches
-            top_matches = filtered_profiles.sort_values('final_score', ascending=False).head(5)
-            
-            # Save recommendations
-            save_recommendations(top_matches, output_dir=data_dir)
-            
             st.subheader("Top Compatible Profiles:")
+            if top_matches.attrs.get('partial'):
+                st.warning(f"Partial result: time budget reached after ML-scoring "
+                           f"{top_matches.attrs['scored_fraction']:.0%} of candidates.")
             for _, row in top_matches.iterrows():
                 st.write(f"Profile ID: {row['__id__']}")
                 st.write(f"User Name: {row['userName']}")